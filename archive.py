@@ -0,0 +1,279 @@
+# archive.py
+# Фоновая архивация дневных папок BASE_PATH/<YYYY-MM-DD>/<task_id>/.
+# Папки старше ARCHIVE_AFTER_DAYS упаковываются в один zip на день (BASE_PATH/_archive/<YYYY>/<день>.zip).
+# Содержимое архивов записывается в таблицу archive_catalog, так что файлы задачи можно найти и после упаковки.
+# Архивы старше ARCHIVE_RETENTION_DAYS удаляются. Чтение с диска ограничено по скорости,
+# чтобы архивация не мешала боту.
+#
+# Ручной запуск:
+#   python archive.py --once                  # упаковать всё, что пора, прямо сейчас
+#   python archive.py --locate 123            # где лежат файлы задачи 123
+#   python archive.py --extract 123 out_dir   # достать файлы задачи 123 из архива
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import time
+import zipfile
+from datetime import date, timedelta
+
+from pathconf import BASE_PATH
+from attachments import STORE_DIR
+from db_async import (
+    day_in_use, save_archive_catalog, find_task_archive, expired_archives,
+    drop_archive_catalog, forget_store_paths, get_task_column, init_db, shutdown_db_executor
+)
+from loggers import log_user_friendly
+
+ARCHIVE_DIR = os.path.join(BASE_PATH, "_archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", 5 * 365))  # 0 — хранить вечно
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 6 * 3600))
+ARCHIVE_IO_BYTES_PER_SECOND = int(os.getenv("ARCHIVE_IO_BYTES_PER_SECOND", 16 * 1024 * 1024))  # 0 — без ограничения
+COPY_CHUNK_SIZE = 1024 * 1024
+
+DAY_FOLDER_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# Эти форматы уже сжаты: повторное сжатие тратит процессор и почти ничего не даёт
+STORED_EXTENSIONS = frozenset({
+    ".zip", ".rar", ".7z", ".gz", ".jpg", ".jpeg", ".png", ".heic", ".mp4", ".xlsx", ".docx", ".pptx"
+})
+
+
+class IOThrottle:
+    """Ограничивает скорость чтения: после каждого куска спит столько, сколько нужно для заданной скорости."""
+
+    def __init__(self, bytes_per_second: int):
+        self.bytes_per_second = bytes_per_second
+        self._started = time.monotonic()
+        self._consumed = 0
+
+    def consume(self, amount: int):
+        if not self.bytes_per_second:
+            return
+        self._consumed += amount
+        ahead = self._consumed / self.bytes_per_second - (time.monotonic() - self._started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def _archive_path_for(day: str) -> str:
+    folder = os.path.join(ARCHIVE_DIR, day[:4])
+    path = os.path.join(folder, f"{day}.zip")
+    n = 2
+    # Дозапись после прерванной архивации: прежний архив не перезаписываем
+    while os.path.exists(path):
+        path = os.path.join(folder, f"{day}_{n}.zip")
+        n += 1
+    return path
+
+
+def _pack_day(day_path: str, archive_path: str, throttle: IOThrottle) -> list:
+    """Упаковывает дневную папку в zip (сначала во временный файл). Возвращает [(member, task_id, size)]."""
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    tmp_path = archive_path + ".part"
+    entries = []
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+            for root, dirs, files in os.walk(day_path):
+                dirs.sort()
+                for name in sorted(files):
+                    full_path = os.path.join(root, name)
+                    member = os.path.relpath(full_path, day_path).replace(os.sep, "/")
+                    info = zipfile.ZipInfo.from_file(full_path, member, strict_timestamps=False)
+                    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+                        info.compress_type = zipfile.ZIP_STORED
+                    else:
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                    with open(full_path, "rb") as src, zf.open(info, "w") as dst:
+                        while True:
+                            chunk = src.read(COPY_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            throttle.consume(len(chunk))
+                    top = member.split("/", 1)[0]
+                    entries.append((member, int(top) if top.isdigit() else None, info.file_size))
+        os.replace(tmp_path, archive_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return entries
+
+
+def _prune_store(older_than: float) -> list:
+    """Удаляет из хранилища файлы, на которые больше не ссылается ни одна папка задачи.
+
+    На такие файлы осталась одна жёсткая ссылка — сама запись в хранилище. Удаляются только
+    файлы старше older_than (время в секундах), чтобы не трогать свежие загрузки.
+    """
+    removed = []
+    if not os.path.isdir(STORE_DIR):
+        return removed
+    for prefix in os.listdir(STORE_DIR):
+        folder = os.path.join(STORE_DIR, prefix)
+        if prefix == "tmp" or not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            st = os.stat(path)
+            if st.st_nlink == 1 and st.st_mtime < older_than:
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+
+class Archiver:
+    def __init__(self, base_path: str = BASE_PATH, after_days: int = ARCHIVE_AFTER_DAYS,
+                 retention_days: int = ARCHIVE_RETENTION_DAYS, interval: float = ARCHIVE_INTERVAL_SECONDS,
+                 io_limit: int = ARCHIVE_IO_BYTES_PER_SECOND):
+        self.base_path = base_path
+        self.after_days = after_days
+        self.retention_days = retention_days
+        self.interval = interval
+        self.io_limit = io_limit
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.after_days > 0:
+            self._task = asyncio.create_task(self._run(), name="archiver")
+            log_user_friendly(f"🗄 Архивация папок старше {self.after_days} дн. включена")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                log_user_friendly(f"⚠️ Ошибка архивации: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _due_days(self) -> list:
+        cutoff = (date.today() - timedelta(days=self.after_days)).isoformat()
+        with os.scandir(self.base_path) as it:
+            return sorted(
+                entry.name for entry in it
+                if entry.is_dir() and DAY_FOLDER_RE.match(entry.name) and entry.name < cutoff
+            )
+
+    async def run_once(self) -> dict:
+        summary = {"archived_days": 0, "archived_files": 0, "expired_archives": 0, "pruned_store_files": 0}
+        throttle = IOThrottle(self.io_limit)
+
+        for day in await asyncio.to_thread(self._due_days):
+            day_path = os.path.join(self.base_path, day)
+            if await day_in_use(day_path):
+                # Файлы ещё нужны очереди (например, загрузка вложений в WEEEK) или открытому черновику —
+                # вернёмся в следующий раз
+                continue
+            archive_path = _archive_path_for(day)
+            try:
+                entries = await asyncio.to_thread(_pack_day, day_path, archive_path, throttle)
+            except OSError as e:
+                log_user_friendly(f"⚠️ Не удалось упаковать папку {day}: {e}")
+                continue
+            # Пока упаковывали, папка могла понадобиться снова: проверка и запись каталога — одна транзакция
+            if not await save_archive_catalog(day, archive_path, entries, day_path):
+                await asyncio.to_thread(os.remove, archive_path)
+                log_user_friendly(f"ℹ️ Папка {day} снова используется, архивация отложена")
+                continue
+            await asyncio.to_thread(shutil.rmtree, day_path)
+            summary["archived_days"] += 1
+            summary["archived_files"] += len(entries)
+            log_user_friendly(f"🗄 Папка {day} упакована в {archive_path} ({len(entries)} файлов)")
+
+        if self.retention_days > 0:
+            before = (date.today() - timedelta(days=self.retention_days)).isoformat()
+            for archive_path in await expired_archives(before):
+                if os.path.exists(archive_path):
+                    await asyncio.to_thread(os.remove, archive_path)
+                    if not os.listdir(os.path.dirname(archive_path)):
+                        os.rmdir(os.path.dirname(archive_path))
+                await drop_archive_catalog(archive_path)
+                summary["expired_archives"] += 1
+                log_user_friendly(f"🗑 Архив {archive_path} удалён по сроку хранения")
+
+        # Дедупликационное хранилище: освобождаем место от файлов, которые остались только в архивах
+        older_than = time.time() - self.after_days * 86400
+        removed = await asyncio.to_thread(_prune_store, older_than)
+        if removed:
+            await forget_store_paths(removed)
+            summary["pruned_store_files"] = len(removed)
+
+        if any(summary.values()):
+            log_user_friendly(
+                f"🗄 Архивация: дней {summary['archived_days']}, файлов {summary['archived_files']}, "
+                f"удалено архивов {summary['expired_archives']}, очищено из хранилища {summary['pruned_store_files']}"
+            )
+        return summary
+
+
+async def locate_task_files(task_id: int) -> dict:
+    """Где лежат файлы задачи: {"folder": путь} до архивации или {"archives": [(архив, member, размер)]} после."""
+    folder = await get_task_column(task_id, "folder_path")
+    if folder and os.path.isdir(folder):
+        return {"folder": folder}
+    return {"archives": await find_task_archive(task_id)}
+
+
+def extract_task_files(entries: list, dest: str) -> list:
+    """Достаёт файлы задачи из архивов в dest. Возвращает список извлечённых путей."""
+    extracted = []
+    by_archive = {}
+    for archive_path, member, _ in entries:
+        by_archive.setdefault(archive_path, []).append(member)
+    for archive_path, members in by_archive.items():
+        with zipfile.ZipFile(archive_path) as zf:
+            for member in members:
+                extracted.append(zf.extract(member, dest))
+    return extracted
+
+
+archiver = Archiver()
+
+
+async def _cli(args):
+    try:
+        await init_db()
+        if args.once:
+            print(await archiver.run_once())
+        elif args.locate is not None:
+            print(await locate_task_files(args.locate))
+        elif args.extract:
+            task_id, dest = int(args.extract[0]), args.extract[1]
+            location = await locate_task_files(task_id)
+            if "folder" in location:
+                print(f"Файлы задачи не в архиве: {location['folder']}")
+            else:
+                for path in await asyncio.to_thread(extract_task_files, location["archives"], dest):
+                    print(path)
+    finally:
+        shutdown_db_executor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация дневных папок BuhBot")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--once", action="store_true", help="выполнить архивацию сейчас")
+    group.add_argument("--locate", type=int, metavar="TASK_ID", help="найти файлы задачи")
+    group.add_argument("--extract", nargs=2, metavar=("TASK_ID", "DEST"), help="извлечь файлы задачи из архива")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# attachments.py
+# Хранилище вложений по SHA-256 содержимого: BASE_PATH/_store/<ab>/<sha256>.
+# Файл, который уже присылали (тот же file_unique_id в Telegram или то же содержимое),
+# повторно не скачивается и не дублируется — в папку задачи кладётся жёсткая ссылка.
+
+import asyncio
+import os
+import shutil
+import uuid
+
+from pathconf import BASE_PATH
+from db_async import get_attachment, save_attachment, forget_attachment
+from loggers import log_user_friendly
+from processing import PROCESSING_SAVED, pool, prepare_download, report_warnings
+
+STORE_DIR = os.path.join(BASE_PATH, "_store")
+TMP_DIR = os.path.join(STORE_DIR, "tmp")  # недокачанные и ещё не обработанные файлы
+
+
+def store_path_for(sha256: str) -> str:
+    return os.path.join(STORE_DIR, sha256[:2], sha256)
+
+
+def link_into(store_path: str, dest_path: str):
+    """Жёсткая ссылка из хранилища в папку задачи; если ФС не умеет — обычная копия."""
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(store_path, dest_path)
+    except OSError:
+        shutil.copy2(store_path, dest_path)
+
+
+def _commit_to_store(tmp_path: str, sha256: str) -> str:
+    """Переносит обработанный файл в хранилище. Возвращает store_path."""
+    store_path = store_path_for(sha256)
+    if os.path.exists(store_path):
+        # Такое содержимое уже есть под другим file_unique_id
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        os.replace(tmp_path, store_path)
+    return store_path
+
+
+def clear_tmp() -> int:
+    """Удаляет временные файлы загрузок (вызывать, когда загрузок в работе нет). Возвращает число удалённых."""
+    if not os.path.isdir(TMP_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(TMP_DIR):
+        try:
+            os.remove(os.path.join(TMP_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+async def fetch_attachment(file_source, dest_path: str, before_download=None, recompress: bool = False) -> bool:
+    """Кладёт вложение в dest_path. Возвращает True, если файл взят из хранилища без скачивания.
+
+    before_download() вызывается перед реальной загрузкой (например, проверка свободного места).
+    Скачанный файл проверяется, при recompress пережимается и хэшируется в процессе-воркере (processing.py).
+    """
+    file_unique_id = file_source.file_unique_id
+    known = await get_attachment(file_unique_id)
+    if known is not None:
+        _, _, store_path = known
+        if os.path.exists(store_path):
+            await asyncio.to_thread(link_into, store_path, dest_path)
+            log_user_friendly(f"♻️ Вложение {os.path.basename(dest_path)} взято из хранилища без скачивания")
+            return True
+        # Файл из хранилища удалили вручную — индекс больше не верен
+        await forget_attachment(file_unique_id)
+
+    if before_download is not None:
+        before_download()
+
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    try:
+        file = await file_source.get_file()
+        await file.download_to_drive(tmp_path)
+        ext = os.path.splitext(dest_path)[1].lower()
+        result = await pool.run(prepare_download, tmp_path, ext, recompress)
+        report_warnings(os.path.basename(dest_path), result["warnings"])
+        if result["saved"]:
+            PROCESSING_SAVED.inc(result["saved"])
+        sha256, size = result["sha256"], result["size"]
+        store_path = await asyncio.to_thread(_commit_to_store, tmp_path, sha256)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    await save_attachment(file_unique_id, sha256, size, store_path)
+    await asyncio.to_thread(link_into, store_path, dest_path)
+    return False
@@ -0,0 +1,429 @@
+# benchmark.py
+# Нагрузочный прогон сценария start -> collect_data -> publish_task -> создание задачи в WEEEK
+# без настоящих Telegram и WEEEK: синтетические Update, заглушка бота и локальный HTTP-сервер вместо WEEEK.
+#
+# Пример:
+#   python benchmark.py --users 50 --messages 5 --files 3 --weeek-latency 0.2 --weeek-error-rate 0.05
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import logging
+
+from telegram import Bot, Chat, Document, Message, PhotoSize, Update, User
+
+# Модули бота читают BUHBOT_BASE_PATH, настройки WEEEK и рабочую папку при импорте,
+# поэтому импортируются внутри функций — после того как main() подготовит временную папку
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SRC_DIR not in sys.path:
+    sys.path.insert(0, _SRC_DIR)
+
+ADMIN_CHAT_ID = -1000
+
+
+# --- Заглушка WEEEK ---
+
+class WeeekStub:
+    """Минимальный HTTP/1.1-сервер с keep-alive, отвечающий как WEEEK, с задержкой и долей ошибок."""
+
+    def __init__(self, latency: float, error_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.uploaded_bytes = 0
+        self._next_task_id = 1
+        self._server = None
+        self.port = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/public/v1/"
+
+    def _route(self, method: str, path: str):
+        import WEEEK
+        if method == "POST" and path.endswith("/attachments"):
+            return 200, {"success": True}
+        if method == "POST" and path.endswith("/tm/tasks"):
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            return 200, {"success": True, "task": {"id": task_id}}
+        if path.endswith("/tm/board-columns"):
+            return 200, {"success": True, "boardColumns": [{"id": 1, "name": WEEEK.COLUMN_NAME}]}
+        if path.endswith("/tm/boards"):
+            return 200, {"success": True, "boards": [{"id": 1, "name": WEEEK.BOARD_NAME}]}
+        if path.endswith("/tm/projects"):
+            return 200, {"success": True, "projects": [{"id": 1, "name": WEEEK.PROJECT_NAME}]}
+        return 404, {"success": False, "message": "not found"}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+                # Тело читаем кусками, чтобы большие вложения не копились в памяти заглушки
+                remaining = content_length
+                while remaining:
+                    chunk = await reader.read(min(remaining, 256 * 1024))
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    remaining -= len(chunk)
+                if "/attachments" in target:
+                    self.uploaded_bytes += content_length
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+                if random.random() < self.error_rate:
+                    self.errors += 1
+                    status, payload = 503, {"success": False, "message": "stub error"}
+                else:
+                    status, payload = self._route(method, target.split("?", 1)[0])
+
+                body = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+# --- Заглушка Telegram ---
+
+class StubFile:
+    def __init__(self, size: int, latency: float):
+        self.size = size
+        self.latency = latency
+
+    async def download_to_drive(self, path):
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        with open(path, "wb") as f:
+            f.write(os.urandom(self.size))
+
+
+class StubBot(Bot):
+    """Bot, который ничего не отправляет в сеть: сообщения считаются, файлы генерируются локально."""
+
+    def __init__(self, file_size: int, download_latency: float):
+        # Bot замораживает атрибуты после __init__, поэтому свои поля задаём до него
+        self._file_size = file_size
+        self._download_latency = download_latency
+        self._counters = {"sent": 0}
+        super().__init__("123456:BENCHMARK")
+
+    @property
+    def sent(self) -> int:
+        return self._counters["sent"]
+
+    async def send_message(self, *args, **kwargs):
+        self._counters["sent"] += 1
+
+    async def send_photo(self, *args, **kwargs):
+        self._counters["sent"] += 1
+
+    async def send_media_group(self, *args, **kwargs):
+        self._counters["sent"] += 1
+
+    async def get_file(self, *args, **kwargs):
+        return StubFile(self._file_size, self._download_latency)
+
+
+class StubContext:
+    def __init__(self, bot: Bot, chat_data: dict):
+        self.bot = bot
+        self.chat_data = chat_data
+        self.user_data = {}
+        self.args = []
+
+
+class UpdateFactory:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._update_id = 0
+        self._message_id = 0
+
+    def make(self, user_id: int, text: str = None, document: bool = False, photo: bool = False,
+             media_group_id: str = None) -> Update:
+        self._update_id += 1
+        self._message_id += 1
+        user = User(id=user_id, first_name=f"Bench{user_id}", is_bot=False)
+        chat = Chat(id=user_id, type=Chat.PRIVATE)
+        kwargs = {}
+        if document:
+            uid = f"doc-{self._message_id}"
+            kwargs["document"] = Document(file_id=uid, file_unique_id=uid, file_name=f"{uid}.pdf", file_size=1024)
+        if photo:
+            uid = f"photo-{self._message_id}"
+            kwargs["photo"] = (PhotoSize(file_id=uid, file_unique_id=uid, width=800, height=600, file_size=1024),)
+            kwargs["media_group_id"] = media_group_id
+        message = Message(
+            message_id=self._message_id, date=datetime.now(), chat=chat, from_user=user,
+            text=text, **kwargs
+        )
+        message.set_bot(self.bot)
+        for attachment in (message.document, *message.photo):
+            if attachment is not None:
+                attachment.set_bot(self.bot)
+        return Update(update_id=self._update_id, message=message)
+
+
+# --- Замеры ---
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    async def measure(self, stage: str, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        except Exception:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            raise
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - started)
+
+    def report(self) -> dict:
+        result = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            result[stage] = {
+                "count": len(values),
+                "errors": self.errors.get(stage, 0),
+                "p50_ms": _percentile(values, 50) * 1000,
+                "p95_ms": _percentile(values, 95) * 1000,
+                "p99_ms": _percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return result
+
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def _pending_outbox_jobs() -> int:
+    from db import get_connection
+    return get_connection().execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+async def simulate_user(user_id: int, args, factory: UpdateFactory, bot: StubBot, recorder: Recorder):
+    import handlers
+    chat_data = {}
+    for _ in range(args.rounds):
+        await recorder.measure("start", handlers.start(factory.make(user_id, text="/start"), StubContext(bot, chat_data)))
+        for i in range(args.messages):
+            update = factory.make(user_id, text=f"Сообщение {i} от пользователя {user_id}")
+            await recorder.measure("collect_text", handlers.collect_data(update, StubContext(bot, chat_data)))
+        group = f"album-{user_id}-{random.random()}"
+        await asyncio.gather(*(
+            recorder.measure(
+                "collect_file",
+                handlers.collect_data(
+                    factory.make(user_id, photo=True, media_group_id=group) if i % 2 else factory.make(user_id, document=True),
+                    StubContext(bot, chat_data)
+                )
+            )
+            for i in range(args.files)
+        ))
+        update = factory.make(user_id, text="Создать задачу")
+        await recorder.measure("publish_task", handlers.collect_data(update, StubContext(bot, chat_data)))
+
+
+async def run(args) -> dict:
+    import db_async
+    import downloads
+    import handlers
+    import outbox
+    import processing
+    import WEEEK
+    from db import close_connections
+
+    random.seed(args.seed)
+    # Ошибки заглушки включаются после начальной загрузки ID: её бот не повторяет
+    stub = WeeekStub(args.weeek_latency, 0.0)
+    await stub.start()
+    WEEEK.BASE_URL = stub.base_url
+    outbox.BACKOFF_BASE = args.retry_base
+    WEEEK.scheduler.rate = args.weeek_rate
+    WEEEK.scheduler.burst = max(int(args.weeek_rate), 1)
+    downloads.MIN_FREE_BYTES = 0
+
+    with open("Admin_chat.txt", "w", encoding="utf-8") as f:
+        f.write(str(ADMIN_CHAT_ID))
+    handlers.config.admin_chat.reload(force=True)
+
+    recorder = Recorder()
+    # Время самого создания задачи в WEEEK, включая повторы после ошибок заглушки
+    create_handler = outbox.JOB_HANDLERS[outbox.KIND_WEEEK_CREATE]
+
+    async def timed_create(job):
+        return await recorder.measure("weeek_create", create_handler(job))
+
+    outbox.JOB_HANDLERS[outbox.KIND_WEEEK_CREATE] = timed_create
+
+    upload_handler = outbox.JOB_HANDLERS[outbox.KIND_WEEEK_UPLOAD]
+
+    async def timed_upload(job):
+        return await recorder.measure("weeek_upload", upload_handler(job))
+
+    outbox.JOB_HANDLERS[outbox.KIND_WEEEK_UPLOAD] = timed_upload
+
+    await db_async.init_db()
+    await WEEEK.open_weeek_client()
+    await WEEEK.initialize_weeek_data(verify_in_background=False)
+    stub.error_rate = args.weeek_error_rate
+    outbox.worker.start()
+
+    bot = StubBot(args.file_size, args.download_latency)
+    outbox.set_bot(bot)
+    factory = UpdateFactory(bot)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(user_id, args, factory, bot, recorder) for user_id in range(1, args.users + 1)
+    ))
+    ingest_elapsed = time.perf_counter() - started
+
+    # Ждём, пока outbox отправит всё в WEEEK
+    deadline = time.monotonic() + args.drain_timeout
+    while await db_async.executor.read(_pending_outbox_jobs) and time.monotonic() < deadline:
+        outbox.worker.notify()
+        await asyncio.sleep(0.05)
+    total_elapsed = time.perf_counter() - started
+
+    await outbox.worker.stop()
+    await WEEEK.close_weeek_client()
+    await stub.stop()
+    processing.pool.shutdown()
+    pending = await db_async.executor.read(_pending_outbox_jobs)
+    db_stats = db_async.get_db_stats()
+    db_async.shutdown_db_executor()
+    close_connections()
+
+    tasks_total = args.users * args.rounds
+    return {
+        "config": vars(args),
+        "tasks": tasks_total,
+        "ingest_seconds": ingest_elapsed,
+        "total_seconds": total_elapsed,
+        "ingest_tasks_per_second": tasks_total / ingest_elapsed if ingest_elapsed else 0.0,
+        "end_to_end_tasks_per_second": tasks_total / total_elapsed if total_elapsed else 0.0,
+        "outbox_pending_after_drain": pending,
+        "weeek_stub_requests": stub.requests,
+        "weeek_stub_errors": stub.errors,
+        "weeek_uploaded_bytes": stub.uploaded_bytes,
+        "telegram_messages_sent": bot.sent,
+        "db": db_stats,
+        "stages": recorder.report(),
+    }
+
+
+def print_report(result: dict):
+    print(f"\nЗадач: {result['tasks']}, приём: {result['ingest_seconds']:.2f} с "
+          f"({result['ingest_tasks_per_second']:.1f} задач/с), "
+          f"до WEEEK: {result['total_seconds']:.2f} с ({result['end_to_end_tasks_per_second']:.1f} задач/с)")
+    print(f"Запросов к заглушке WEEEK: {result['weeek_stub_requests']}, ошибок: {result['weeek_stub_errors']}, "
+          f"осталось в outbox: {result['outbox_pending_after_drain']}, "
+          f"загружено вложений: {result['weeek_uploaded_bytes'] / 1024 / 1024:.1f} МБ")
+    print(f"{'этап':<14}{'кол-во':>8}{'ошибки':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<14}{s['count']:>8}{s['errors']:>8}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+              f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк BuhBot с заглушками Telegram и WEEEK")
+    parser.add_argument("--users", type=int, default=20, help="число одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=1, help="задач на пользователя")
+    parser.add_argument("--messages", type=int, default=3, help="текстовых сообщений в задаче")
+    parser.add_argument("--files", type=int, default=2, help="вложений в задаче (фото и документы поровну)")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="размер вложения, байт")
+    parser.add_argument("--download-latency", type=float, default=0.05, help="задержка скачивания файла, с")
+    parser.add_argument("--weeek-latency", type=float, default=0.1, help="задержка ответа WEEEK, с")
+    parser.add_argument("--weeek-rate", type=float, default=1000.0, help="лимит запросов к WEEEK в секунду")
+    parser.add_argument("--weeek-error-rate", type=float, default=0.0, help="доля ответов 503 от WEEEK")
+    parser.add_argument("--retry-base", type=float, default=0.1, help="база задержки повтора outbox, с")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="сколько ждать опустошения outbox, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON-файл")
+    parser.add_argument("--verbose", action="store_true", help="не глушить user-friendly логи")
+    return parser.parse_args(argv)
+
+
+def _prepare_environment(workdir: str):
+    """Все данные бенчмарка — во временной папке; выставляется до импорта модулей бота."""
+    os.environ["BUHBOT_BASE_PATH"] = os.path.join(workdir, "Bot_Data")
+    os.environ.setdefault("WEEEK_API_KEY", "bench")
+    os.environ["WEEEK_PROJECT_ID"] = "1"
+    os.environ["WEEEK_BOARD_ID"] = "1"
+    os.environ["WEEEK_COLUMN_ID"] = "1"
+    os.chdir(workdir)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    orig_cwd = os.getcwd()
+    if args.json_path:
+        args.json_path = os.path.abspath(args.json_path)
+
+    # Папка живёт ровно один прогон и удаляется вместе с базой и файлами
+    with tempfile.TemporaryDirectory(prefix="buhbot_bench_") as workdir:
+        _prepare_environment(workdir)
+        try:
+            from loggers import UF_LOGGER_NAME, stop_logging
+            if not args.verbose:
+                logging.getLogger(UF_LOGGER_NAME).setLevel(logging.WARNING)
+                logging.getLogger("WEEEK_INIT").setLevel(logging.WARNING)
+                logging.getLogger("httpx").setLevel(logging.WARNING)
+            try:
+                result = asyncio.run(run(args))
+            finally:
+                # Логи пишутся в logs/ рабочей папки — дописываем их до удаления папки
+                stop_logging()
+        finally:
+            os.chdir(orig_cwd)
+
+    print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
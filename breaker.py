@@ -0,0 +1,115 @@
+# breaker.py
+# Предохранитель (circuit breaker) для внешнего API.
+# Считает неудачные и слишком медленные вызовы в скользящем окне. Если их много, размыкается,
+# и вызовы сразу получают CircuitOpenError. Через паузу пропускает один пробный вызов:
+# если тот прошёл, предохранитель снова замыкается.
+
+import time
+from collections import deque
+from typing import Callable, Optional
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name}: предохранитель разомкнут, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window_seconds: float = 60.0, min_calls: int = 5,
+                 failure_ratio: float = 0.5, slow_call_seconds: float = 5.0,
+                 open_seconds: float = 30.0, max_open_seconds: float = 300.0,
+                 on_state_change: Optional[Callable[[str, str, str], None]] = None):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.on_state_change = on_state_change
+
+        self.state = CLOSED
+        self.rejected = 0
+        self._calls = deque()          # (время, неудача)
+        self._opened_at = 0.0
+        self._current_open = open_seconds
+        self._probe_in_flight = False
+        self._last_error = ""
+
+    # --- перед вызовом ---
+
+    def before_call(self):
+        """Разрешает вызов или бросает CircuitOpenError. В полуоткрытом состоянии пропускает один пробный."""
+        if self.state == OPEN:
+            remaining = self._opened_at + self._current_open - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, remaining)
+            self._set_state(HALF_OPEN, "пауза истекла, пробный запрос")
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self._probe_in_flight = True
+
+    # --- после вызова ---
+
+    def record_success(self, elapsed: float):
+        if elapsed > self.slow_call_seconds:
+            self.record_failure(f"медленный ответ {elapsed:.1f} с")
+            return
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            self._calls.clear()
+            self._current_open = self.open_seconds
+            self._set_state(CLOSED, "пробный запрос прошёл")
+            return
+        self._remember(False)
+
+    def record_failure(self, error: str):
+        self._last_error = error
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            # Сервис ещё не поднялся — ждём дольше, но не бесконечно
+            self._current_open = min(self._current_open * 2, self.max_open_seconds)
+            self._open(f"пробный запрос не прошёл: {error}")
+            return
+        self._remember(True)
+        failures = sum(1 for _, failed in self._calls if failed)
+        if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_ratio:
+            self._open(f"{failures} из {len(self._calls)} вызовов неудачны, последний: {error}")
+
+    def release_probe(self):
+        """Пробный вызов завершился без вывода о здоровье сервиса (например, 429) — пропускаем следующий."""
+        self._probe_in_flight = False
+
+    def describe(self) -> str:
+        if self.state == OPEN:
+            remaining = max(self._opened_at + self._current_open - time.monotonic(), 0.0)
+            return f"{self.name}: разомкнут ещё {remaining:.0f} с ({self._last_error}), отклонено {self.rejected}"
+        if self.state == HALF_OPEN:
+            return f"{self.name}: пробный режим, отклонено {self.rejected}"
+        return f"{self.name}: норма, отклонено {self.rejected}"
+
+    def _remember(self, failed: bool):
+        now = time.monotonic()
+        self._calls.append((now, failed))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self, reason: str):
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._set_state(OPEN, reason)
+
+    def _set_state(self, state: str, reason: str):
+        previous, self.state = self.state, state
+        if previous != state and self.on_state_change is not None:
+            self.on_state_change(previous, state, reason)
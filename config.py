@@ -0,0 +1,170 @@
+# config.py
+# Настройки из текстовых файлов (extensions.txt, Admin_chat.txt, path.txt) в памяти.
+# Каждый файл разбирается и проверяется один раз, дальше обращения идут к кэшу.
+# При смене mtime/размера файл перечитывается без перезапуска бота. Если новое содержимое
+# не прошло проверку, остаётся прежнее значение и в лог пишется ошибка.
+
+import asyncio
+import os
+import re
+import time
+
+from loggers import log_user_friendly
+from pathconf import PATH_FILE, BASE_PATH
+
+EXTENSIONS_FILE = "extensions.txt"
+ADMIN_CHAT_FILE = "Admin_chat.txt"
+RECHECK_SECONDS = float(os.getenv("CONFIG_RECHECK_SECONDS", 5))  # не чаще одного stat на файл за этот интервал
+
+EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,16}$")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def parse_extensions(text: str) -> frozenset:
+    """Одно расширение на строку; регистр и точка в начале не важны, # — комментарий."""
+    extensions = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        ext = line.split("#", 1)[0].strip().lower()
+        if not ext:
+            continue
+        if not ext.startswith("."):
+            ext = "." + ext
+        if not EXTENSION_RE.match(ext):
+            raise ConfigError(f"{EXTENSIONS_FILE}, строка {line_no}: некорректное расширение '{line.strip()}'")
+        extensions.append(ext)
+    duplicates = sorted({ext for ext in extensions if extensions.count(ext) > 1})
+    if duplicates:
+        log_user_friendly(f"ℹ️ {EXTENSIONS_FILE}: повторяются {', '.join(duplicates)}")
+    return frozenset(extensions)
+
+
+def parse_admin_chat(text: str) -> int:
+    try:
+        return int(text.strip())
+    except ValueError:
+        raise ConfigError(f"{ADMIN_CHAT_FILE}: ожидается числовой ID чата, получено '{text.strip()[:40]}'") from None
+
+
+def parse_base_path(text: str) -> str:
+    path = text.strip()
+    if not path or os.getenv("BUHBOT_BASE_PATH"):
+        # Пустой файл или путь задан через окружение — path.txt не используется
+        return BASE_PATH
+    if not os.path.isabs(path):
+        raise ConfigError(f"path.txt: путь должен быть абсолютным, получено '{path}'")
+    if not os.path.isdir(path) and not os.path.isdir(os.path.dirname(path)):
+        raise ConfigError(f"path.txt: папка '{path}' не существует и не может быть создана")
+    return path
+
+
+class WatchedFile:
+    """Значение, разобранное из файла, с перечитыванием при изменении mtime или размера."""
+
+    def __init__(self, path: str, parse, missing=None, on_change=None):
+        self.path = path
+        self.parse = parse
+        self.missing = missing        # значение, если файла нет
+        self.on_change = on_change    # вызывается (старое, новое) после успешной перезагрузки
+        self.error = None
+        self._value = missing
+        self._signature = None        # (mtime_ns, size) разобранной версии; "missing", если файла не было
+        self._checked_at = 0.0
+
+    @property
+    def value(self):
+        if time.monotonic() - self._checked_at >= RECHECK_SECONDS:
+            self.reload()
+        return self._value
+
+    def reload(self, force: bool = False) -> bool:
+        """Перечитывает файл, если он изменился. Возвращает True, если значение обновилось."""
+        self._checked_at = time.monotonic()
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = "missing"
+        if signature == self._signature and not force:
+            return False
+
+        if signature == "missing":
+            value = self.missing
+        else:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    value = self.parse(f.read())
+            except (OSError, UnicodeDecodeError, ConfigError) as e:
+                # Битый файл не должен ломать работающего бота — оставляем прежнее значение
+                self.error = str(e)
+                self._signature = signature
+                log_user_friendly(f"⚠️ Настройки {os.path.basename(self.path)} не применены: {e}")
+                return False
+
+        first_load = self._signature is None
+        old, self._value, self._signature, self.error = self._value, value, signature, None
+        if not first_load:
+            log_user_friendly(f"🔄 Настройки {os.path.basename(self.path)} перечитаны")
+            if self.on_change is not None and old != value:
+                self.on_change(old, value)
+        return True
+
+
+def _base_path_changed(old: str, new: str):
+    # База, хранилище и архив открыты по старому пути — переключать их на ходу небезопасно
+    if new != BASE_PATH:
+        log_user_friendly(f"⚠️ Путь к данным в path.txt изменён на {new}; вступит в силу после перезапуска бота")
+
+
+class Config:
+    def __init__(self):
+        # Нет extensions.txt — разрешены все расширения (None)
+        self.extensions = WatchedFile(EXTENSIONS_FILE, parse_extensions, missing=None)
+        self.admin_chat = WatchedFile(ADMIN_CHAT_FILE, parse_admin_chat, missing=None)
+        self.base_path = WatchedFile(PATH_FILE, parse_base_path, missing=BASE_PATH, on_change=_base_path_changed)
+        self._files = (self.extensions, self.admin_chat, self.base_path)
+        self._task = None
+
+    @property
+    def allowed_extensions(self):
+        return self.extensions.value
+
+    @property
+    def admin_chat_id(self):
+        return self.admin_chat.value
+
+    def validate(self) -> list:
+        """Загружает все файлы при старте. Возвращает список ошибок (пустой, если всё в порядке)."""
+        for watched in self._files:
+            watched.reload(force=True)
+        # Ошибки разбора reload уже записал в лог
+        errors = [watched.error for watched in self._files if watched.error]
+        if self.admin_chat.value is None and not self.admin_chat.error:
+            errors.append(f"{ADMIN_CHAT_FILE} не найден — новые задачи не будут пересылаться администратору")
+            log_user_friendly(f"⚠️ {errors[-1]}")
+        return errors
+
+    def start_watching(self, interval: float = RECHECK_SECONDS):
+        """Фоновая проверка файлов: изменения применяются и попадают в лог, даже если к настройке никто не обращался."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(interval), name="config-watcher")
+
+    async def stop_watching(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for watched in self._files:
+                watched.reload()
+
+
+config = Config()
@@ -1,6 +1,10 @@
 # db.py
+import json
 import os
+import re
 import sqlite3
+import threading
+import time
 from datetime import datetime
 
 from pathconf import BASE_PATH
@@ -8,58 +12,666 @@ from loggers import log_user_friendly
 
 DB_PATH = os.path.join(BASE_PATH, "tasks.db") if 'BASE_PATH' in globals() else "tasks.db"
 
+# Колонки, которые разрешено обновлять через update_task / update_task_fields
+TASK_COLUMNS = frozenset({
+    "user_id", "user_name", "created_at", "full_text", "files_json", "weeek_task_id", "sost", "folder_path",
+    "weeek_status", "weeek_column", "weeek_updated_at"
+})
+
+# Долгоживущие соединения: по одному на поток, открываются при первом обращении
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # в WAL-режиме fsync только на чекпоинтах
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16 МБ страничного кэша
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def close_connections():
+    with _connections_lock:
+        for conn in _connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _connections.clear()
+    _local.__dict__.clear()
+
+
+def _check_columns(columns):
+    unknown = set(columns) - TASK_COLUMNS
+    if unknown:
+        raise ValueError(f"Недопустимые колонки tasks: {', '.join(sorted(unknown))}")
+
 # db.py
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            task_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            user_name TEXT,
-            created_at TEXT,
-            full_text TEXT,
-            files_json TEXT,
-            weeek_task_id TEXT,
-            sost TEXT DEFAULT 'draft'
-        )
-    ''')
-    # Добавляем проверку существования колонки
-    c.execute("PRAGMA table_info(tasks)")
-    columns = [column[1] for column in c.fetchall()]
-    if 'weeek_task_id' not in columns:
-        c.execute("ALTER TABLE tasks ADD COLUMN weeek_task_id TEXT")
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                user_name TEXT,
+                created_at TEXT,
+                full_text TEXT,
+                files_json TEXT,
+                weeek_task_id TEXT,
+                sost TEXT DEFAULT 'draft'
+            )
+        ''')
+        # Добавляем проверку существования колонки
+        c.execute("PRAGMA table_info(tasks)")
+        columns = [column[1] for column in c.fetchall()]
+        if 'weeek_task_id' not in columns:
+            c.execute("ALTER TABLE tasks ADD COLUMN weeek_task_id TEXT")
+        # Очередь отложенных действий (outbox), переживает перезапуски
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                task_id INTEGER NOT NULL,
+                payload TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0,
+                last_error TEXT,
+                created_at TEXT,
+                UNIQUE (kind, task_id)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+        # Хранилище вложений по хэшу содержимого с индексом по file_unique_id Telegram
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS attachments (
+                file_unique_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER,
+                store_path TEXT NOT NULL,
+                created_at TEXT
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON attachments(sha256)")
+        # Какие вложения задачи уже загружены в WEEEK: повторная попытка продолжает с оставшихся
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS weeek_uploads (
+                task_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                size INTEGER,
+                uploaded_at TEXT,
+                PRIMARY KEY (task_id, path)
+            )
+        ''')
+    _migrate(conn)
     log_user_friendly("✅ Инициализация базы данных завершена.")
 
-def create_task() -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO tasks DEFAULT VALUES")
-    conn.commit()
-    task_id = c.lastrowid
-    conn.close()
+
+def _fts_text(column: str) -> str:
+    """SQL-выражение для текста, который попадает в полнотекстовый индекс."""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Миграции схемы: номер версии -> SQL. Применённая версия хранится в PRAGMA user_version,
+# новые миграции дописываются в конец списка.
+MIGRATIONS = [
+    (1, [
+        # (user_id, task_id) — история пользователя листается по task_id без OFFSET
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user ON tasks(user_id, task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_sost ON tasks(sost)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_weeek_task_id ON tasks(weeek_task_id)",
+    ]),
+    (2, [
+        # Папка задачи фиксируется при создании черновика, а не вычисляется по текущей дате
+        "ALTER TABLE tasks ADD COLUMN folder_path TEXT",
+        # Каталог архивов: в каком архиве лежат файлы задачи после упаковки дневной папки
+        """CREATE TABLE IF NOT EXISTS archive_catalog (
+            archive_path TEXT NOT NULL,
+            member TEXT NOT NULL,
+            task_id INTEGER,
+            day TEXT NOT NULL,
+            size INTEGER,
+            archived_at TEXT,
+            PRIMARY KEY (archive_path, member)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_archive_catalog_task ON archive_catalog(task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_archive_catalog_day ON archive_catalog(day)",
+    ]),
+    (3, [
+        # Полнотекстовый индекс по тексту задачи и имени автора; данные берутся из tasks (external content)
+        """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            full_text, user_name,
+            content='tasks', content_rowid='task_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts(rowid, full_text, user_name) VALUES (new.task_id, new.full_text, new.user_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, full_text, user_name)
+            VALUES ('delete', old.task_id, old.full_text, old.user_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF full_text, user_name ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, full_text, user_name)
+            VALUES ('delete', old.task_id, old.full_text, old.user_name);
+            INSERT INTO tasks_fts(rowid, full_text, user_name) VALUES (new.task_id, new.full_text, new.user_name);
+        END""",
+        # Индексируем уже существующие задачи
+        "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+    ]),
+    (4, [
+        # Незавершённые черновики по чатам: переживают перезапуск бота (persistence.py)
+        """CREATE TABLE IF NOT EXISTS drafts (
+            chat_id INTEGER PRIMARY KEY,
+            task_id INTEGER,
+            data TEXT NOT NULL,
+            updated_at TEXT
+        )""",
+    ]),
+    (5, [
+        # Кто держит аренду задания: закрыть или отложить его может только этот обработчик
+        "ALTER TABLE outbox ADD COLUMN lease_owner TEXT",
+    ]),
+    (6, [
+        # Состояние задачи в WEEEK по данным сверки (weeek_sync.py): open / done / deleted, колонка доски
+        "ALTER TABLE tasks ADD COLUMN weeek_status TEXT",
+        "ALTER TABLE tasks ADD COLUMN weeek_column TEXT",
+        "ALTER TABLE tasks ADD COLUMN weeek_updated_at TEXT",
+        # Курсоры фоновых синхронизаций
+        """CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TEXT
+        )""",
+    ]),
+    (7, [
+        # ё и е в поиске не различаются: в индекс попадает текст с ё, заменённой на е (запрос нормализуется
+        # так же, см. _fts_query). Замена буква в букву, поэтому позиции слов для snippet() не сдвигаются
+        "DROP TRIGGER IF EXISTS tasks_fts_insert",
+        "DROP TRIGGER IF EXISTS tasks_fts_delete",
+        "DROP TRIGGER IF EXISTS tasks_fts_update",
+        f"""CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts(rowid, full_text, user_name)
+            VALUES (new.task_id, {_fts_text('new.full_text')}, {_fts_text('new.user_name')});
+        END""",
+        f"""CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, full_text, user_name)
+            VALUES ('delete', old.task_id, {_fts_text('old.full_text')}, {_fts_text('old.user_name')});
+        END""",
+        f"""CREATE TRIGGER tasks_fts_update AFTER UPDATE OF full_text, user_name ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, full_text, user_name)
+            VALUES ('delete', old.task_id, {_fts_text('old.full_text')}, {_fts_text('old.user_name')});
+            INSERT INTO tasks_fts(rowid, full_text, user_name)
+            VALUES (new.task_id, {_fts_text('new.full_text')}, {_fts_text('new.user_name')});
+        END""",
+        # 'rebuild' взял бы текст из tasks как есть, поэтому индекс заполняем сами
+        "INSERT INTO tasks_fts(tasks_fts) VALUES ('delete-all')",
+        f"""INSERT INTO tasks_fts(rowid, full_text, user_name)
+            SELECT task_id, {_fts_text('full_text')}, {_fts_text('user_name')} FROM tasks""",
+    ]),
+]
+
+
+def _migrate(conn: sqlite3.Connection):
+    for version, statements in MIGRATIONS:
+        with conn:
+            # Явный BEGIN: иначе sqlite3 выполняет DDL вне транзакции и миграция применится частично.
+            # IMMEDIATE и чтение версии внутри транзакции — несколько процессов (worker.py) могут стартовать разом
+            conn.execute("BEGIN IMMEDIATE")
+            if version <= conn.execute("PRAGMA user_version").fetchone()[0]:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+        log_user_friendly(f"🛠 База данных обновлена до версии {version}")
+
+def create_task(day_folder: str = None) -> int:
+    """Создаёт черновик. Если передана дневная папка, путь папки задачи записывается в той же транзакции."""
+    conn = get_connection()
+    with conn:
+        c = conn.execute("INSERT INTO tasks DEFAULT VALUES")
+        task_id = c.lastrowid
+        if day_folder is not None:
+            conn.execute(
+                "UPDATE tasks SET folder_path = ? WHERE task_id = ?",
+                (os.path.join(day_folder, str(task_id)), task_id)
+            )
     log_user_friendly(f"🆕 Создана новая задача с ID: {task_id}")
     return task_id
 
 def update_task(task_id: int, column: str, value):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(f"UPDATE tasks SET {column} = ? WHERE task_id = ?", (value, task_id))
-    conn.commit()
-    conn.close()
+    _check_columns([column])
+    conn = get_connection()
+    with conn:
+        conn.execute(f"UPDATE tasks SET {column} = ? WHERE task_id = ?", (value, task_id))
     log_user_friendly(f"✏️ Задача {task_id} обновлена: {column} = {value}")
 
+def update_task_fields(task_id: int, **columns):
+    """Обновляет несколько колонок задачи одним UPDATE в одной транзакции."""
+    if not columns:
+        return
+    _check_columns(columns)
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+            (*columns.values(), task_id)
+        )
+    log_user_friendly(f"✏️ Задача {task_id} обновлена: {', '.join(columns)}")
+
 def get_task_column(task_id: int, column: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(f"SELECT {column} FROM tasks WHERE task_id = ?", (task_id,))
+    _check_columns([column])
+    c = get_connection().execute(f"SELECT {column} FROM tasks WHERE task_id = ?", (task_id,))
     value = c.fetchone()
-    conn.close()
     return value[0] if value else None
 
-def mark_task_deleted(task_id: int):
-    update_task(task_id, "sost", "deleted_by_user")
+def list_user_tasks(user_id: int, before_id: int = None, after_id: int = None, limit: int = 10) -> tuple:
+    """Страница истории пользователя, от новых к старым, по ключу task_id (без OFFSET).
+
+    before_id — следующая (более старая) страница, after_id — предыдущая (более новая).
+    Возвращает (строки, есть_старее, есть_новее); строка — (task_id, created_at, sost, weeek_task_id,
+    weeek_status, weeek_column, full_text).
+    """
+    conn = get_connection()
+    columns = "task_id, created_at, sost, weeek_task_id, weeek_status, weeek_column, substr(full_text, 1, 200)"
+    if after_id is not None:
+        rows = conn.execute(
+            f"SELECT {columns} FROM tasks WHERE user_id = ? AND task_id > ? ORDER BY task_id ASC LIMIT ?",
+            (user_id, after_id, limit + 1)
+        ).fetchall()
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_older = bool(rows) and _user_has_task(conn, user_id, "<", rows[-1][0])
+    else:
+        bound = "AND task_id < ?" if before_id is not None else ""
+        params = (user_id, before_id, limit + 1) if before_id is not None else (user_id, limit + 1)
+        rows = conn.execute(
+            f"SELECT {columns} FROM tasks WHERE user_id = ? {bound} ORDER BY task_id DESC LIMIT ?", params
+        ).fetchall()
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = bool(rows) and _user_has_task(conn, user_id, ">", rows[0][0])
+    return rows, has_older, has_newer
+
+def _user_has_task(conn: sqlite3.Connection, user_id: int, op: str, task_id: int) -> bool:
+    return conn.execute(
+        f"SELECT 1 FROM tasks WHERE user_id = ? AND task_id {op} ? LIMIT 1", (user_id, task_id)
+    ).fetchone() is not None
+
+def _fts_query(text: str) -> str:
+    # Слова пользователя превращаем в префиксные термы в кавычках: операторы FTS5 из ввода не выполняются.
+    # ё -> е, как и в индексе (миграция 7)
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text.lower().replace("ё", "е")))
+
+def search_tasks(text: str, limit: int = 5, offset: int = 0) -> tuple:
+    """Опубликованные задачи по релевантности (bm25). Возвращает (строки, есть_ещё).
+
+    Строка — (task_id, created_at, user_name, weeek_task_id, фрагмент с отметками \x02...\x03 вокруг совпадений).
+    """
+    query = _fts_query(text)
+    if not query:
+        return [], False
+    rows = get_connection().execute(
+        "SELECT t.task_id, t.created_at, t.user_name, t.weeek_task_id, "
+        "snippet(tasks_fts, 0, char(2), char(3), '…', 16) "
+        "FROM tasks_fts JOIN tasks t ON t.task_id = tasks_fts.rowid "
+        "WHERE tasks_fts MATCH ? AND t.sost = 'sucsessefully_publeshed' "
+        "ORDER BY bm25(tasks_fts, 1.0, 0.5), t.task_id DESC LIMIT ? OFFSET ?",
+        (query, limit + 1, offset)
+    ).fetchall()
+    return rows[:limit], len(rows) > limit
+
+def mark_task_deleted(task_id: int, **columns):
+    """Помечает задачу отменённой; columns (автор, время) сохраняются для отчётов в том же UPDATE."""
+    update_task_fields(task_id, sost="deleted_by_user", **columns)
     log_user_friendly(f"❌ Задача {task_id} помечена как удалённая пользователем.")
+
+
+# --- Outbox ---
+
+def publish_task_record(task_id: int, jobs: list, **columns):
+    """Записывает колонки задачи и ставит задания outbox в одной транзакции.
+
+    jobs — список пар (kind, payload); повторная постановка того же kind для задачи игнорируется.
+    """
+    _check_columns(columns)
+    assignments = ", ".join(f"{column} = ?" for column in columns)
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    with conn:
+        if columns:
+            conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+                (*columns.values(), task_id)
+            )
+        conn.executemany(
+            "INSERT OR IGNORE INTO outbox (kind, task_id, payload, created_at) VALUES (?, ?, ?, ?)",
+            [(kind, task_id, json.dumps(payload, ensure_ascii=False), created_at) for kind, payload in jobs]
+        )
+    log_user_friendly(f"📤 Задача {task_id} сохранена, заданий в очереди: {len(jobs)}")
+
+def claim_outbox_jobs(limit: int, lease_seconds: float, kinds=None, owner: str = None) -> list:
+    """Забирает готовые к выполнению задания и сдвигает их срок на lease_seconds.
+
+    Если обработчик упадёт вместе с процессом, задание снова станет видимым по истечении аренды.
+    owner — идентификатор обработчика; закрыть задание потом сможет только он.
+    """
+    now = time.time()
+    conn = get_connection()
+    kind_filter = ""
+    params = [now]
+    if kinds:
+        kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})"
+        params += list(kinds)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            f"SELECT job_id, kind, task_id, payload, attempts FROM outbox "
+            f"WHERE status = 'pending' AND next_attempt_at <= ?{kind_filter} "
+            f"ORDER BY next_attempt_at LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET next_attempt_at = ?, attempts = attempts + 1, lease_owner = ? WHERE job_id = ?",
+            [(now + lease_seconds, owner, row[0]) for row in rows]
+        )
+    return [
+        {"job_id": row[0], "kind": row[1], "task_id": row[2],
+         "payload": json.loads(row[3]) if row[3] else {}, "attempts": row[4] + 1}
+        for row in rows
+    ]
+
+_LEASE_CHECK = "job_id = ? AND status = 'pending' AND (? IS NULL OR lease_owner = ?)"
+_SAVE_WEEEK_TASK_ID = "UPDATE tasks SET weeek_task_id = ? WHERE task_id = ? AND weeek_task_id IS NULL"
+
+
+def save_weeek_task_id(task_id: int, weeek_task_id: str) -> str:
+    """Запоминает ID задачи WEEEK сразу после создания, не дожидаясь закрытия задания.
+
+    Уже записанный ID не перезаписывается; возвращает тот, что в итоге хранится в tasks.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(_SAVE_WEEEK_TASK_ID, (weeek_task_id, task_id))
+        return conn.execute("SELECT weeek_task_id FROM tasks WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+
+def complete_outbox_job(job_id: int, task_id: int = None, follow_up: list = None, owner: str = None,
+                        **columns) -> bool:
+    """Закрывает задание; переданные колонки задачи и следующие задания (kind, payload) пишутся в той же транзакции.
+
+    Если аренда уже перешла к другому обработчику (owner не совпал), ничего не меняет и возвращает False.
+    """
+    _check_columns(columns)
+    conn = get_connection()
+    with conn:
+        c = conn.execute(
+            f"UPDATE outbox SET status = 'done', last_error = NULL WHERE {_LEASE_CHECK}", (job_id, owner, owner)
+        )
+        if c.rowcount == 0:
+            if task_id is not None and columns.get("weeek_task_id"):
+                # Задача в WEEEK уже создана: её ID сохраняем и без аренды, иначе следующий обработчик создаст дубль
+                conn.execute(_SAVE_WEEEK_TASK_ID, (columns["weeek_task_id"], task_id))
+            return False
+        if task_id is not None and follow_up:
+            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (kind, task_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                [(kind, task_id, json.dumps(payload, ensure_ascii=False), created_at) for kind, payload in follow_up]
+            )
+        if task_id is not None and columns:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            conn.execute(
+                f"UPDATE tasks SET {assignments} WHERE task_id = ?",
+                (*columns.values(), task_id)
+            )
+    return True
+
+def retry_outbox_job(job_id: int, error: str, next_attempt_at: float, owner: str = None) -> bool:
+    conn = get_connection()
+    with conn:
+        c = conn.execute(
+            f"UPDATE outbox SET next_attempt_at = ?, last_error = ? WHERE {_LEASE_CHECK}",
+            (next_attempt_at, error, job_id, owner, owner)
+        )
+    return c.rowcount > 0
+
+def fail_outbox_job(job_id: int, error: str, owner: str = None) -> bool:
+    """Окончательно закрывает задание с ошибкой (status = 'failed'): повторов больше не будет."""
+    conn = get_connection()
+    with conn:
+        c = conn.execute(
+            f"UPDATE outbox SET status = 'failed', last_error = ? WHERE {_LEASE_CHECK}", (error, job_id, owner, owner)
+        )
+    return c.rowcount > 0
+
+def extend_outbox_leases(job_ids: list, lease_seconds: float, owner: str) -> int:
+    """Продлевает аренду заданий, которые обработчик ещё выполняет. Возвращает число продлённых."""
+    if not job_ids:
+        return 0
+    conn = get_connection()
+    with conn:
+        c = conn.execute(
+            f"UPDATE outbox SET next_attempt_at = ? WHERE lease_owner = ? AND status = 'pending' "
+            f"AND job_id IN ({', '.join('?' for _ in job_ids)})",
+            (time.time() + lease_seconds, owner, *job_ids)
+        )
+    return c.rowcount
+
+def next_outbox_due(kinds=None):
+    """Время ближайшего ожидающего задания или None, если очередь пуста."""
+    query = "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
+    params = []
+    if kinds:
+        query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+        params = list(kinds)
+    row = get_connection().execute(query, params).fetchone()
+    return row[0] if row else None
+
+def outbox_counts() -> dict:
+    """Число заданий по состояниям, а для 'failed' — ещё и по видам: {"pending": n, "failed": {kind: n}}."""
+    counts = {"pending": 0, "failed": {}}
+    rows = get_connection().execute(
+        "SELECT status, kind, COUNT(*) FROM outbox WHERE status IN ('pending', 'failed') GROUP BY status, kind"
+    ).fetchall()
+    for status, kind, count in rows:
+        if status == "failed":
+            counts["failed"][kind] = count
+        else:
+            counts["pending"] += count
+    return counts
+
+
+# --- Хранилище вложений ---
+
+def get_attachment(file_unique_id: str):
+    """Возвращает (sha256, size, store_path) для уже скачанного файла или None."""
+    c = get_connection().execute(
+        "SELECT sha256, size, store_path FROM attachments WHERE file_unique_id = ?", (file_unique_id,)
+    )
+    return c.fetchone()
+
+def save_attachment(file_unique_id: str, sha256: str, size: int, store_path: str):
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO attachments (file_unique_id, sha256, size, store_path, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (file_unique_id, sha256, size, store_path, created_at)
+        )
+
+def forget_attachment(file_unique_id: str):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM attachments WHERE file_unique_id = ?", (file_unique_id,))
+
+
+# --- Загрузка вложений в WEEEK ---
+
+def get_finished_uploads(task_id: int) -> set:
+    """Пути вложений задачи, с которыми уже покончено (загружены или пропали с диска)."""
+    c = get_connection().execute("SELECT path FROM weeek_uploads WHERE task_id = ?", (task_id,))
+    return {row[0] for row in c.fetchall()}
+
+def mark_upload_finished(task_id: int, path: str, status: str, size: int = None):
+    uploaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO weeek_uploads (task_id, path, status, size, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+            (task_id, path, status, size, uploaded_at)
+        )
+
+
+# --- Архив дневных папок ---
+
+def _day_in_use(conn: sqlite3.Connection, day_folder: str) -> bool:
+    prefix = os.path.join(day_folder, "")
+    row = conn.execute(
+        "SELECT 1 FROM tasks t WHERE substr(t.folder_path, 1, ?) = ? AND ("
+        "    EXISTS (SELECT 1 FROM outbox o WHERE o.task_id = t.task_id AND o.status = 'pending')"
+        "    OR (t.sost = 'draft' AND EXISTS (SELECT 1 FROM drafts d WHERE d.task_id = t.task_id))"
+        ") LIMIT 1",
+        (len(prefix), prefix)
+    ).fetchone()
+    return row is not None
+
+def day_in_use(day_folder: str) -> bool:
+    """Нужны ли ещё файлы дневной папки: у её задач есть незавершённые задания outbox или открытый черновик.
+
+    Черновиком считается задача с сохранённой сессией (таблица drafts): такой черновик можно дописать и
+    опубликовать даже после перезапуска. Брошенные до появления drafts черновики архивации не мешают.
+    Задания с окончательной ошибкой ('failed') тоже не мешают.
+    """
+    return _day_in_use(get_connection(), day_folder)
+
+def save_archive_catalog(day: str, archive_path: str, entries: list, day_folder: str = None) -> bool:
+    """entries — (member, task_id, size) для каждого файла в архиве.
+
+    С day_folder сначала, в той же транзакции, проверяет, что папка не понадобилась заново (day_in_use);
+    если понадобилась — ничего не пишет и возвращает False. Новые черновики создаются в сегодняшней папке,
+    поэтому после успешной проверки сослаться на старую папку уже нечему и её можно удалять.
+    """
+    archived_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if day_folder is not None and _day_in_use(conn, day_folder):
+            return False
+        conn.executemany(
+            "INSERT OR REPLACE INTO archive_catalog (archive_path, member, task_id, day, size, archived_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(archive_path, member, task_id, day, size, archived_at) for member, task_id, size in entries]
+        )
+    return True
+
+def find_task_archive(task_id: int) -> list:
+    """[(archive_path, member, size)] файлов задачи, упакованных в архив."""
+    c = get_connection().execute(
+        "SELECT archive_path, member, size FROM archive_catalog WHERE task_id = ? ORDER BY member", (task_id,)
+    )
+    return c.fetchall()
+
+def expired_archives(before_day: str) -> list:
+    c = get_connection().execute(
+        "SELECT DISTINCT archive_path FROM archive_catalog WHERE day < ?", (before_day,)
+    )
+    return [row[0] for row in c.fetchall()]
+
+def drop_archive_catalog(archive_path: str):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM archive_catalog WHERE archive_path = ?", (archive_path,))
+
+def forget_store_paths(store_paths: list):
+    conn = get_connection()
+    with conn:
+        conn.executemany("DELETE FROM attachments WHERE store_path = ?", [(path,) for path in store_paths])
+
+
+def load_drafts() -> list:
+    """[(chat_id, data)] сохранённых черновиков, задача которых всё ещё в состоянии draft."""
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT d.chat_id, d.data FROM drafts d JOIN tasks t ON t.task_id = d.task_id WHERE t.sost = 'draft'"
+    ).fetchall()
+    return [(chat_id, json.loads(data)) for chat_id, data in rows]
+
+
+def save_drafts(changed: list, dropped: list):
+    """Записывает изменённые черновики [(chat_id, task_id, data)] и удаляет dropped одной транзакцией."""
+    conn = get_connection()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        conn.executemany(
+            "INSERT INTO drafts (chat_id, task_id, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET task_id = excluded.task_id, data = excluded.data, "
+            "updated_at = excluded.updated_at",
+            [(chat_id, task_id, json.dumps(data, ensure_ascii=False), now) for chat_id, task_id, data in changed]
+        )
+        conn.executemany("DELETE FROM drafts WHERE chat_id = ?", [(chat_id,) for chat_id in dropped])
+
+
+# --- Сверка состояния задач с WEEEK ---
+
+def get_sync_state(name: str):
+    row = get_connection().execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def set_sync_state(name: str, value: str):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO sync_state (name, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (name, value, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        )
+
+
+def apply_weeek_states(states: list) -> int:
+    """Записывает состояния [(weeek_task_id, status, column, updated_at)] одной транзакцией.
+
+    Строки, где ничего не поменялось, не перезаписываются; column/updated_at = None оставляют прежнее значение.
+    Возвращает число изменённых задач.
+    """
+    conn = get_connection()
+    with conn:
+        before = conn.total_changes
+        conn.executemany(
+            "UPDATE tasks SET weeek_status = ?1, weeek_column = COALESCE(?2, weeek_column), "
+            "weeek_updated_at = COALESCE(?3, weeek_updated_at) "
+            "WHERE weeek_task_id = ?4 AND (weeek_status IS NOT ?1 OR weeek_column IS NOT COALESCE(?2, weeek_column) "
+            "OR weeek_updated_at IS NOT COALESCE(?3, weeek_updated_at))",
+            [(status, column, updated_at, str(weeek_task_id)) for weeek_task_id, status, column, updated_at in states]
+        )
+        return conn.total_changes - before
+
+
+def list_tracked_weeek_ids() -> list:
+    """(task_id, weeek_task_id) задач, которые не помечены удалёнными в WEEEK, от новых к старым."""
+    return get_connection().execute(
+        "SELECT task_id, weeek_task_id FROM tasks WHERE weeek_task_id IS NOT NULL AND weeek_status IS NOT 'deleted' "
+        "ORDER BY task_id DESC"
+    ).fetchall()
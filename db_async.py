@@ -0,0 +1,270 @@
+# db_async.py
+# Асинхронный фасад над db.py: записи идут через один поток-писатель с очередью,
+# чтения — через небольшой пул потоков со своими соединениями (WAL позволяет читать параллельно).
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import db
+from loggers import log_user_friendly
+from metrics import DB_LATENCY, DB_WAIT, registry
+
+READER_THREADS = 4
+SLOW_WAIT_SECONDS = 0.5  # ожидание в очереди дольше этого попадает в лог
+
+
+class DBStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.writes = 0
+            self.reads = 0
+            self.write_wait_total = 0.0
+            self.write_wait_max = 0.0
+            self.read_wait_total = 0.0
+            self.read_wait_max = 0.0
+            self.reads_in_flight = 0
+
+    def record(self, kind: str, wait: float):
+        with self._lock:
+            if kind == "write":
+                self.writes += 1
+                self.write_wait_total += wait
+                self.write_wait_max = max(self.write_wait_max, wait)
+            else:
+                self.reads += 1
+                self.read_wait_total += wait
+                self.read_wait_max = max(self.read_wait_max, wait)
+        DB_WAIT.observe(wait, kind=kind)
+        if wait > SLOW_WAIT_SECONDS:
+            log_user_friendly(f"🐢 Запрос к БД ({kind}) ждал в очереди {wait:.2f} с")
+
+
+class DBExecutor:
+    def __init__(self, reader_threads: int = READER_THREADS):
+        self.stats = DBStats()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._readers = None
+        self._reader_threads = reader_threads
+
+    def start(self):
+        if self._writer is not None:
+            return
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
+        self._readers = ThreadPoolExecutor(max_workers=self._reader_threads, thread_name_prefix="db-reader")
+
+    def stop(self):
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        self._writer = None
+        self._readers = None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, enqueued_at, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.stats.record("write", time.perf_counter() - enqueued_at)
+            started = time.perf_counter()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            DB_LATENCY.observe(time.perf_counter() - started, op=fn.__name__, kind="write")
+
+    def _run_read(self, enqueued_at, fn, args, kwargs):
+        self.stats.record("read", time.perf_counter() - enqueued_at)
+        with DB_LATENCY.time(op=fn.__name__, kind="read"):
+            return fn(*args, **kwargs)
+
+    async def write(self, fn, *args, **kwargs):
+        self.start()
+        future = Future()
+        self._queue.put((future, time.perf_counter(), fn, args, kwargs))
+        return await asyncio.wrap_future(future)
+
+    async def read(self, fn, *args, **kwargs):
+        self.start()
+        future = self._readers.submit(self._run_read, time.perf_counter(), fn, args, kwargs)
+        return await asyncio.wrap_future(future)
+
+    def snapshot(self) -> dict:
+        s = self.stats
+        with s._lock:
+            return {
+                "write_queue_depth": self.queue_depth(),
+                "writes": s.writes,
+                "write_wait_avg": s.write_wait_total / s.writes if s.writes else 0.0,
+                "write_wait_max": s.write_wait_max,
+                "reads": s.reads,
+                "read_wait_avg": s.read_wait_total / s.reads if s.reads else 0.0,
+                "read_wait_max": s.read_wait_max,
+            }
+
+
+executor = DBExecutor()
+registry.gauge("buhbot_db_write_queue_depth", "Запросов в очереди потока-писателя БД", executor.queue_depth)
+
+
+def get_db_stats() -> dict:
+    return executor.snapshot()
+
+
+def shutdown_db_executor():
+    executor.stop()
+
+
+# --- Асинхронные обёртки над функциями db.py ---
+
+async def init_db():
+    return await executor.write(db.init_db)
+
+
+async def create_task(day_folder: str = None) -> int:
+    return await executor.write(db.create_task, day_folder)
+
+
+async def update_task(task_id: int, column: str, value):
+    return await executor.write(db.update_task, task_id, column, value)
+
+
+async def update_task_fields(task_id: int, **columns):
+    return await executor.write(db.update_task_fields, task_id, **columns)
+
+
+async def get_task_column(task_id: int, column: str):
+    return await executor.read(db.get_task_column, task_id, column)
+
+
+async def list_user_tasks(user_id: int, before_id: int = None, after_id: int = None, limit: int = 10) -> tuple:
+    return await executor.read(db.list_user_tasks, user_id, before_id, after_id, limit)
+
+
+async def search_tasks(text: str, limit: int = 5, offset: int = 0) -> tuple:
+    return await executor.read(db.search_tasks, text, limit, offset)
+
+
+async def mark_task_deleted(task_id: int, **columns):
+    return await executor.write(db.mark_task_deleted, task_id, **columns)
+
+
+async def publish_task_record(task_id: int, jobs: list, **columns):
+    return await executor.write(db.publish_task_record, task_id, jobs, **columns)
+
+
+async def claim_outbox_jobs(limit: int, lease_seconds: float, kinds=None, owner: str = None) -> list:
+    return await executor.write(db.claim_outbox_jobs, limit, lease_seconds, kinds, owner)
+
+
+async def complete_outbox_job(job_id: int, task_id: int = None, follow_up: list = None, owner: str = None,
+                              **columns) -> bool:
+    return await executor.write(db.complete_outbox_job, job_id, task_id, follow_up, owner, **columns)
+
+
+async def save_weeek_task_id(task_id: int, weeek_task_id: str) -> str:
+    return await executor.write(db.save_weeek_task_id, task_id, weeek_task_id)
+
+
+async def retry_outbox_job(job_id: int, error: str, next_attempt_at: float, owner: str = None) -> bool:
+    return await executor.write(db.retry_outbox_job, job_id, error, next_attempt_at, owner)
+
+
+async def fail_outbox_job(job_id: int, error: str, owner: str = None) -> bool:
+    return await executor.write(db.fail_outbox_job, job_id, error, owner)
+
+
+async def extend_outbox_leases(job_ids: list, lease_seconds: float, owner: str) -> int:
+    return await executor.write(db.extend_outbox_leases, job_ids, lease_seconds, owner)
+
+
+async def next_outbox_due(kinds=None):
+    return await executor.read(db.next_outbox_due, kinds)
+
+
+async def outbox_counts() -> dict:
+    return await executor.read(db.outbox_counts)
+
+
+async def get_attachment(file_unique_id: str):
+    return await executor.read(db.get_attachment, file_unique_id)
+
+
+async def save_attachment(file_unique_id: str, sha256: str, size: int, store_path: str):
+    return await executor.write(db.save_attachment, file_unique_id, sha256, size, store_path)
+
+
+async def forget_attachment(file_unique_id: str):
+    return await executor.write(db.forget_attachment, file_unique_id)
+
+
+async def get_finished_uploads(task_id: int) -> set:
+    return await executor.read(db.get_finished_uploads, task_id)
+
+
+async def mark_upload_finished(task_id: int, path: str, status: str, size: int = None):
+    return await executor.write(db.mark_upload_finished, task_id, path, status, size)
+
+
+async def day_in_use(day_folder: str) -> bool:
+    return await executor.read(db.day_in_use, day_folder)
+
+
+async def save_archive_catalog(day: str, archive_path: str, entries: list, day_folder: str = None) -> bool:
+    return await executor.write(db.save_archive_catalog, day, archive_path, entries, day_folder)
+
+
+async def find_task_archive(task_id: int) -> list:
+    return await executor.read(db.find_task_archive, task_id)
+
+
+async def expired_archives(before_day: str) -> list:
+    return await executor.read(db.expired_archives, before_day)
+
+
+async def drop_archive_catalog(archive_path: str):
+    return await executor.write(db.drop_archive_catalog, archive_path)
+
+
+async def forget_store_paths(store_paths: list):
+    return await executor.write(db.forget_store_paths, store_paths)
+
+
+async def load_drafts() -> list:
+    return await executor.read(db.load_drafts)
+
+
+async def save_drafts(changed: list, dropped: list):
+    return await executor.write(db.save_drafts, changed, dropped)
+
+
+async def get_sync_state(name: str):
+    return await executor.read(db.get_sync_state, name)
+
+
+async def set_sync_state(name: str, value: str):
+    return await executor.write(db.set_sync_state, name, value)
+
+
+async def apply_weeek_states(states: list) -> int:
+    return await executor.write(db.apply_weeek_states, states)
+
+
+async def list_tracked_weeek_ids() -> list:
+    return await executor.read(db.list_tracked_weeek_ids)
@@ -0,0 +1,98 @@
+# downloads.py
+# Фоновое скачивание вложений: ограниченное число параллельных загрузок,
+# дедупликация через хранилище attachments, проверка свободного места
+# ожидание завершения всех загрузок задачи перед публикацией и превью картинок для карточки.
+
+import asyncio
+import os
+import shutil
+
+from attachments import clear_tmp, fetch_attachment
+from processing import can_thumbnail, make_thumbnail, pool, thumbnail_path_for
+from loggers import log_user_friendly
+
+MAX_PARALLEL_DOWNLOADS = 16
+MIN_FREE_BYTES = 500 * 1024 * 1024  # запас свободного места, ниже которого не скачиваем
+
+
+def check_free_space(folder: str, expected_size: int = 0):
+    free = shutil.disk_usage(folder).free
+    if free - (expected_size or 0) < MIN_FREE_BYTES:
+        raise OSError(f"Недостаточно места на диске: свободно {free // (1024 * 1024)} МБ")
+
+
+class DownloadManager:
+    def __init__(self, limit: int = MAX_PARALLEL_DOWNLOADS):
+        self._semaphore = asyncio.Semaphore(limit)
+        self._tasks = set()  # все незавершённые загрузки, для остановки бота
+
+    def submit(self, session, file_source, path: str, expected_size: int = 0, on_error=None,
+               recompress: bool = False) -> asyncio.Task:
+        """Ставит загрузку в очередь и сразу возвращает управление.
+
+        file_source — объект Telegram с методом get_file() (Document или PhotoSize);
+        on_error(exc) вызывается, если файл скачать не удалось;
+        recompress — пережать картинку после скачивания (см. processing.py).
+        """
+        task = asyncio.create_task(self._download(file_source, path, expected_size, recompress))
+        session.pending_downloads.add(task)
+        self._tasks.add(task)
+
+        def _done(t: asyncio.Task):
+            session.pending_downloads.discard(t)
+            self._tasks.discard(t)
+            if t.cancelled():
+                return
+            exc = t.exception()
+            if exc is not None:
+                log_user_friendly(f"⚠️ Не удалось скачать {os.path.basename(path)}: {exc}")
+                if on_error is not None:
+                    on_error(exc)
+
+        task.add_done_callback(_done)
+        return task
+
+    async def _download(self, file_source, path: str, expected_size: int, recompress: bool):
+        async with self._semaphore:
+            folder = os.path.dirname(path)
+            os.makedirs(folder, exist_ok=True)
+            # Повторно присланные файлы берутся из хранилища, место проверяем только для новых
+            await fetch_attachment(
+                file_source, path,
+                before_download=lambda: check_free_space(folder, expected_size),
+                recompress=recompress
+            )
+        if can_thumbnail(path):
+            try:
+                await pool.run(make_thumbnail, path, thumbnail_path_for(path))
+            except Exception as e:
+                # Без превью карточка просто уйдёт без картинок
+                log_user_friendly(f"⚠️ Не удалось сделать превью {os.path.basename(path)}: {e}")
+
+    async def wait_for(self, session):
+        """Дожидается всех загрузок черновика (ошибки уже учтены через on_error)."""
+        while session.pending_downloads:
+            await asyncio.gather(*list(session.pending_downloads), return_exceptions=True)
+
+    async def cancel(self, session):
+        tasks = list(session.pending_downloads)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def shutdown(self):
+        """Остановка бота: отменяет незавершённые загрузки, дожидается их и убирает временные файлы.
+
+        Недокачанные вложения черновиков при восстановлении сессии отбрасываются (drop_missing_files).
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            log_user_friendly(f"⏹ Прервано загрузок вложений: {len(tasks)}")
+        await asyncio.to_thread(clear_tmp)
+
+
+downloader = DownloadManager()
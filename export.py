@@ -0,0 +1,202 @@
+# export.py
+# Выгрузка задач и сводные отчёты из tasks.db без участия бота.
+# Чтение идёт через отдельное соединение только для чтения в одной транзакции (снимок WAL):
+# бот продолжает писать, а выгрузка видит согласованное состояние на момент старта.
+# Строки идут по цепочке генераторов порциями, поэтому память не растёт с размером таблицы.
+#
+# Примеры:
+#   python export.py tasks --from 2026-09-01 --to 2026-09-30 --format csv -o september.csv
+#   python export.py tasks --state deleted_by_user --format jsonl
+#   python export.py summary --by month --from 2026-01-01
+#   python export.py summary --by user --format csv -o users.csv
+
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+from db import DB_PATH
+
+FETCH_SIZE = 1000
+
+TASK_FIELDS = (
+    "task_id", "created_at", "user_id", "user_name", "sost", "weeek_task_id",
+    "weeek_sync", "weeek_status", "weeek_column", "file_count", "folder_path", "full_text",
+)
+
+# Состояние синхронизации с WEEEK по заданию outbox на создание задачи
+SYNC_STATUS_SQL = """
+    CASE
+        WHEN t.weeek_task_id IS NOT NULL THEN 'synced'
+        WHEN o.status = 'failed' THEN 'failed'
+        WHEN o.status = 'pending' AND o.last_error IS NOT NULL THEN 'retrying'
+        WHEN o.status = 'pending' THEN 'queued'
+        ELSE 'not_queued'
+    END
+"""
+
+SUMMARY_GROUPS = {
+    "month": ("substr(t.created_at, 1, 7)", "month"),
+    "day": ("substr(t.created_at, 1, 10)", "day"),
+    "user": ("t.user_id", "user_id"),
+}
+
+SUMMARY_FIELDS = (
+    "total", "published", "deleted_by_user", "publish_rate", "delete_rate",
+    "synced", "queued", "retrying", "failed", "not_queued",
+)
+
+
+@contextmanager
+def snapshot(db_path: str = DB_PATH):
+    """Соединение только для чтения с открытой транзакцией: все запросы видят один и тот же снимок."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("BEGIN")
+        yield conn
+    finally:
+        conn.close()
+
+
+def _filters(date_from: str = None, date_to: str = None, states: list = None, user_id: int = None) -> tuple:
+    clauses, params = [], []
+    if date_from:
+        clauses.append("t.created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        # Дата без времени включает весь день
+        clauses.append("t.created_at <= ?")
+        params.append(date_to + " 23:59:59" if len(date_to) == 10 else date_to)
+    if states:
+        clauses.append(f"t.sost IN ({', '.join('?' for _ in states)})")
+        params.extend(states)
+    if user_id is not None:
+        clauses.append("t.user_id = ?")
+        params.append(user_id)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def iter_rows(conn: sqlite3.Connection, query: str, params) -> iter:
+    """Строки запроса порциями по FETCH_SIZE."""
+    cursor = conn.execute(query, params)
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            return
+        yield from batch
+
+
+def iter_tasks(conn: sqlite3.Connection, **filters) -> iter:
+    where, params = _filters(**filters)
+    query = (
+        f"SELECT t.task_id, t.created_at, t.user_id, t.user_name, t.sost, t.weeek_task_id, "
+        f"{SYNC_STATUS_SQL}, t.weeek_status, t.weeek_column, json_extract(t.files_json, '$.file_count'), "
+        f"t.folder_path, t.full_text "
+        f"FROM tasks t LEFT JOIN outbox o ON o.task_id = t.task_id AND o.kind = 'weeek_create'"
+        f"{where} ORDER BY t.task_id"
+    )
+    for row in iter_rows(conn, query, params):
+        yield dict(zip(TASK_FIELDS, row))
+
+
+def iter_summary(conn: sqlite3.Connection, by: str = "month", **filters) -> iter:
+    """Агрегаты считает SQLite; в Python приходит по строке на группу."""
+    group_sql, group_name = SUMMARY_GROUPS[by]
+    where, params = _filters(**filters)
+    extra = ", MAX(t.user_name)" if by == "user" else ""
+    query = f"""
+        SELECT {group_sql}{extra},
+               COUNT(*),
+               SUM(t.sost = 'sucsessefully_publeshed'),
+               SUM(t.sost = 'deleted_by_user'),
+               SUM(sync = 'synced'), SUM(sync = 'queued'), SUM(sync = 'retrying'), SUM(sync = 'failed'),
+               SUM(sync = 'not_queued')
+        FROM (SELECT t.*, {SYNC_STATUS_SQL} AS sync
+              FROM tasks t LEFT JOIN outbox o ON o.task_id = t.task_id AND o.kind = 'weeek_create') t
+        {where}
+        GROUP BY 1 ORDER BY 1
+    """
+    names = (group_name, "user_name") if by == "user" else (group_name,)
+    for row in iter_rows(conn, query, params):
+        head, counts = row[:len(names)], row[len(names):]
+        total, published, deleted, synced, queued, retrying, failed, not_queued = counts
+        record = dict(zip(names, head))
+        record.update(
+            total=total, published=published, deleted_by_user=deleted,
+            publish_rate=round(published / total, 4) if total else 0.0,
+            delete_rate=round(deleted / total, 4) if total else 0.0,
+            synced=synced, queued=queued, retrying=retrying, failed=failed, not_queued=not_queued,
+        )
+        yield record
+
+
+def write_csv(records: iter, fields: tuple, out) -> int:
+    writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+def write_jsonl(records: iter, out) -> int:
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+
+@contextmanager
+def _open_output(path: str, fmt: str):
+    if not path or path == "-":
+        yield sys.stdout
+        return
+    # utf-8-sig: Excel открывает CSV с кириллицей без ручного выбора кодировки
+    encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+    with open(path, "w", encoding=encoding, newline="") as f:
+        yield f
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка задач и отчёты по tasks.db")
+    parser.add_argument("--db", default=DB_PATH, help="путь к tasks.db")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("tasks", "выгрузка задач построчно"), ("summary", "сводка по группам")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--from", dest="date_from", help="с даты, ГГГГ-ММ-ДД")
+        p.add_argument("--to", dest="date_to", help="по дату включительно, ГГГГ-ММ-ДД")
+        p.add_argument("--state", dest="states", action="append",
+                       help="состояние (sost); можно указать несколько раз")
+        p.add_argument("--user", dest="user_id", type=int, help="только задачи этого user_id")
+        p.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+        p.add_argument("-o", "--output", help="файл (по умолчанию — stdout)")
+    sub.choices["summary"].add_argument("--by", choices=tuple(SUMMARY_GROUPS), default="month")
+
+    args = parser.parse_args()
+    filters = {"date_from": args.date_from, "date_to": args.date_to, "states": args.states, "user_id": args.user_id}
+
+    with snapshot(args.db) as conn, _open_output(args.output, args.format) as out:
+        if args.command == "tasks":
+            records, fields = iter_tasks(conn, **filters), TASK_FIELDS
+        else:
+            records = iter_summary(conn, args.by, **filters)
+            head = (SUMMARY_GROUPS[args.by][1], "user_name") if args.by == "user" else (SUMMARY_GROUPS[args.by][1],)
+            fields = head + SUMMARY_FIELDS
+        count = write_csv(records, fields, out) if args.format == "csv" else write_jsonl(records, out)
+
+    print(f"Выгружено строк: {count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        # Вывод обрезали (например, | head) — это не ошибка выгрузки
+        sys.stderr.close()
@@ -1,7 +1,6 @@
 # handlers.py
 import sys
 
-from WEEEK import create_weeek_task
 from telegram import (
     Update, ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
@@ -13,14 +12,20 @@ from telegram.ext import (
 from datetime import datetime
 import os
 import json
-from pathconf import BASE_PATH
-from db import create_task, update_task, get_task_column, mark_task_deleted
-from loggers import log_user_friendly
-from utils import (
-    get_d_id, increase_d_id, reset_d_id,
-    save_text_file, save_rename_log, delete_task_files,
-    build_task_card
+import html
+from config import ADMIN_CHAT_FILE, config
+from db_async import (
+    create_task, publish_task_record, mark_task_deleted, get_db_stats, list_user_tasks, get_task_column,
+    search_tasks, outbox_counts
 )
+from outbox import KIND_ADMIN_NOTIFY, KIND_TASK_FILES, KIND_WEEEK_CREATE, worker as outbox_worker
+from loggers import log_user_friendly
+from metrics import instrument_handler, render_summary
+from WEEEK import breaker as weeek_breaker
+from session import DraftSession, get_session
+from downloads import downloader
+from processing import RECOMPRESS_DOCUMENTS
+from utils import delete_task_files, build_task_card, parse_task_text, day_folder
 
 from pathlib import Path
 import ast  # Для безопасного чтения Python-выражений
@@ -28,30 +33,38 @@ import ast  # Для безопасного чтения Python-выражени
 
 
 
-def load_allowed_extensions():
-    try:
-        with open("extensions.txt", "r", encoding="utf-8") as f:
-            extensions = [line.strip().lower() for line in f if line.strip()]
-            return extensions
-    except FileNotFoundError:
-        # Если файла нет - разрешаем все расширения (или можно вернуть пустой список для запрета всех)
-        return None
-
-ALLOWED_EXTENSIONS = load_allowed_extensions()
+def read_admin_chat_id() -> int:
+    # Значение из кэша config: файл перечитывается, только когда меняется
+    admin_chat_id = config.admin_chat_id
+    if admin_chat_id is None:
+        if config.admin_chat.error:
+            raise ValueError(config.admin_chat.error)
+        raise FileNotFoundError(f"{ADMIN_CHAT_FILE} не найден")
+    return admin_chat_id
 
 def register_handlers(application):
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("mytasks", mytasks))
+    application.add_handler(CommandHandler("search", search))
     application.add_handler(MessageHandler(filters.TEXT | filters.PHOTO | filters.Document.ALL, collect_data))
     application.add_handler(CallbackQueryHandler(button_handler))
 
 
+@instrument_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = get_session(context)
+    async with session.lock:
+        await _begin_draft(update, session)
+
+
+async def _begin_draft(update: Update, session: DraftSession):
+    """Создаёт новую задачу-черновик. Вызывается под session.lock."""
     user = update.effective_user
-    task_id = create_task()
-    context.user_data['db_task_id'] = task_id
-    context.user_data['messages'] = []
-    context.user_data['files'] = []
-    reset_d_id()
+    # Папка выбирается один раз: черновик, начатый до полуночи, не разъедется по двум датам
+    today_folder = day_folder()
+    task_id = await create_task(today_folder)
+    session.reset(task_id, os.path.join(today_folder, str(task_id)))
 
     keyboard = ReplyKeyboardMarkup([
         [KeyboardButton("Создать задачу"), KeyboardButton("Отмена")]
@@ -70,9 +83,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # handlers.py
 
 # Модифицируем функцию collect_data
+@instrument_handler
 async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    task_id = context.user_data.get('db_task_id')
+    session = get_session(context)
+    task_id = session.task_id
     if not task_id:
         await update.message.reply_text("❗ Пожалуйста, начните с команды /start")
         return
@@ -84,167 +99,324 @@ async def collect_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await cancel_task(update, context)
         return
 
-    rename_log = context.user_data.get('rename_log', "")
-    file_entries = context.user_data.get('files', [])
-    file_texts = []
-
     msg_text = update.message.text or update.message.caption or ""
     has_text = bool(msg_text.strip())
-    has_file = False
-
-    # Обработка документов
-    if update.message.document:
-        doc = update.message.document
-        file_ext = os.path.splitext(doc.file_name)[1].lower()
-
-        # Проверяем расширение, если список расширений задан
-        if ALLOWED_EXTENSIONS is not None and file_ext not in ALLOWED_EXTENSIONS:
-            file_texts.append(f"{doc.file_name} [Файл не скачан из-за недопустимого расширения]")
-            log_user_friendly(f"⚠️ Файл {doc.file_name} отклонён из-за недопустимого расширения")
-        else:
-            file = await doc.get_file()
-            did = get_d_id()
-            filename = f"{task_id}_{did}{os.path.splitext(doc.file_name)[1]}"
-            folder = os.path.join(BASE_PATH, datetime.now().strftime("%Y-%m-%d"), str(task_id))
-            os.makedirs(folder, exist_ok=True)
-            path = os.path.join(folder, filename)
-            await file.download_to_drive(path)
-            rename_log += f"{doc.file_name} -> {filename}\n"
-            file_entries.append(f"{doc.file_name} -> {path}")
-            file_texts.append(doc.file_name)
+    media_group_id = update.message.media_group_id
+
+    async with session.lock:
+        # Берём актуальный черновик: пока ждали блокировку, прежний могли опубликовать или отменить
+        task_id = session.task_id
+        file_texts = []
+        has_file = False
+        folder = session.folder
+
+        # Обработка документов
+        if update.message.document:
+            doc = update.message.document
+            file_ext = os.path.splitext(doc.file_name)[1].lower()
+
+            # Проверяем расширение, если список расширений задан
+            allowed_extensions = config.allowed_extensions
+            if allowed_extensions is not None and file_ext not in allowed_extensions:
+                file_texts.append(f"{doc.file_name} [Файл не скачан из-за недопустимого расширения]")
+                log_user_friendly(f"⚠️ Файл {doc.file_name} отклонён из-за недопустимого расширения")
+            else:
+                did = session.reserve_file_no()
+                filename = f"{task_id}_{did}{os.path.splitext(doc.file_name)[1]}"
+                _queue_download(session, doc, doc.file_size, folder, filename, doc.file_name, doc.file_name,
+                                recompress=RECOMPRESS_DOCUMENTS)
+                file_texts.append(doc.file_name)
+                has_file = True
+
+        # Обработка фото (оставляем без изменений, так как фото всегда допустимы)
+        elif update.message.photo:
+            photo = update.message.photo[-1]
+            did = session.reserve_file_no()
+            filename = f"{task_id}_{did}.jpg"
+            # Фото пережимается после скачивания (processing.py)
+            _queue_download(session, photo, photo.file_size, folder, filename,
+                            f"photo_{photo.file_unique_id}.jpg", "photo", recompress=True)
+            file_texts.append("photo.jpg")
             has_file = True
-            increase_d_id()
-
-    # Обработка фото (оставляем без изменений, так как фото всегда допустимы)
-    elif update.message.photo:
-        photo = update.message.photo[-1]
-        file = await photo.get_file()
-        did = get_d_id()
-        filename = f"{task_id}_{did}.jpg"
-        folder = os.path.join(BASE_PATH, datetime.now().strftime("%Y-%m-%d"), str(task_id))
-        os.makedirs(folder, exist_ok=True)
-        path = os.path.join(folder, filename)
-        await file.download_to_drive(path)
-        rename_log += f"photo_{photo.file_unique_id}.jpg -> {filename}\n"
-        file_entries.append(f"photo -> {path}")
-        file_texts.append("photo.jpg")
-        has_file = True
-        increase_d_id()
-
-    # Остальной код функции оставляем без изменений
-    if has_text or has_file:
-        entry = msg_text.strip()
-        if file_texts:
-            entry += "\n" + "\n".join(file_texts) if entry else "\n".join(file_texts)
-        context.user_data.setdefault('messages', []).append(entry)
-
-    context.user_data['rename_log'] = rename_log
-    context.user_data['files'] = file_entries
+
+        if has_text or has_file:
+            entry = msg_text.strip()
+            if file_texts:
+                entry += "\n" + "\n".join(file_texts) if entry else "\n".join(file_texts)
+            session.add_message(entry, media_group_id)
 
     log_user_friendly(f"📨 Принято сообщение от {user.full_name}. Текст: {msg_text or '[нет текста]'}")
 
+
+def _queue_download(session: DraftSession, file_source, file_size, folder: str, filename: str,
+                    log_name: str, entry_name: str, recompress: bool = False):
+    """Регистрирует вложение в черновике и ставит его скачивание в фон. Вызывается под session.lock."""
+    path = os.path.join(folder, filename)
+    rename_line = f"{log_name} -> {filename}\n"
+    entry = f"{entry_name} -> {path}"
+    session.rename_log += rename_line
+    session.files.append(entry)
+    downloader.submit(
+        session, file_source, path, file_size or 0,
+        on_error=lambda exc: session.mark_file_failed(entry, entry_name, rename_line),
+        recompress=recompress
+    )
+
 # handlers.py (изменяем функцию publish_task)
 
+@instrument_handler
 async def publish_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    task_id = context.user_data.get('db_task_id')
-    if not task_id:
-        await update.message.reply_text("❗ Не удалось найти задачу.")
+    session = get_session(context)
+    async with session.lock:
+        task_id = session.task_id
+        if not task_id:
+            await update.message.reply_text("❗ Не удалось найти задачу.")
+            return
+
+        # Карточку собираем только после того, как докачаются все вложения
+        await downloader.wait_for(session)
+
+        user = update.effective_user
+        user_id = user.id
+        user_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+        full_text = "\n".join(session.messages) or "[текст не указан]"
+        files = list(session.files)
+        attachments = [{"name": name, "path": path} for name, path in session.downloaded_files()]
+        rename_log = session.rename_log or "Файлы не прикреплялись"
+
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        files_json = json.dumps({
+            "file_count": len(files),
+            "doc_ids": [],
+            "photo_ids": [],
+            "rename_log": rename_log
+        }, ensure_ascii=False, indent=2)
+
+        # Текст разбираем один раз: из него строятся и карточка, и описание для WEEEK
+        parsed = parse_task_text(task_id, full_text, files)
+        task_card, task_title = build_task_card(
+            task_id, f"<a href='tg://user?id={user_id}'>{user_name}</a>", created_at, full_text, files, parsed
+        )
+        weeek_description = parsed.body
+
+        # Побочные действия публикации выполняет outbox (в этом процессе или в worker.py):
+        # задача и все задания пишутся одной транзакцией, повтор для той же задачи не дублирует задания
+        jobs = [
+            (KIND_TASK_FILES, {"folder": session.folder, "full_text": full_text, "rename_log": rename_log}),
+            (KIND_WEEEK_CREATE, {
+                "title": task_title,
+                "description": weeek_description,
+                "files_info": rename_log,
+                "attachments": attachments
+            }),
+        ]
+        admin_warning = None
+        try:
+            read_admin_chat_id()
+            jobs.append((KIND_ADMIN_NOTIFY, {"card": task_card, "paths": [a["path"] for a in attachments]}))
+        except (ValueError, FileNotFoundError) as e:
+            admin_warning = e
+        await publish_task_record(
+            task_id,
+            jobs,
+            user_id=user_id,
+            user_name=user_name,
+            created_at=created_at,
+            full_text=full_text,
+            files_json=files_json,
+            sost="sucsessefully_publeshed"
+        )
+        outbox_worker.notify()
+
+        # Отправляем пользователю
+        await update.message.reply_text(f"✅ Задача создана:\n\n{task_card}", parse_mode="HTML")
+        if admin_warning:
+            await update.message.reply_text(f"⚠️ Не удалось отправить задачу администратору: {admin_warning}")
+
+        log_user_friendly(f"📦 Задача {task_id} опубликована.")
+
+        # Сброс и переход к новой задаче
+        await _begin_draft(update, session)
+
+
+@instrument_handler
+async def cancel_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = get_session(context)
+    async with session.lock:
+        task_id = session.task_id
+        await downloader.cancel(session)
+        user = update.effective_user
+        await mark_task_deleted(
+            task_id,
+            user_id=user.id,
+            user_name=f"{user.first_name or ''} {user.last_name or ''}".strip(),
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+        delete_task_files(task_id, folder=session.folder or await get_task_column(task_id, "folder_path"))
+        await update.message.reply_text("🚫 Задача отменена. Ввод сброшен.")
+        log_user_friendly(f"🗑 Задача {task_id} отменена и очищены файлы.")
+
+        # Сброс и переход к новой задаче
+        await _begin_draft(update, session)
+
+
+@instrument_handler
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    data = query.data or ""
+
+    # Листание истории: mytasks:older:<task_id> / mytasks:newer:<task_id>
+    if data.startswith(MYTASKS_CALLBACK):
+        _, direction, task_id = data.split(":", 2)
+        cursor = {"before_id" if direction == "older" else "after_id": int(task_id)}
+        text, markup = await _render_history(query.from_user.id, **cursor)
+        await query.answer()
+        await query.edit_message_text(text, parse_mode="HTML", reply_markup=markup)
         return
 
-    user = update.effective_user
-    user_id = user.id
-    user_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
-    full_text = "\n".join(context.user_data.get('messages', [])) or "[текст не указан]"
-    files = context.user_data.get('files', [])
-    rename_log = context.user_data.get('rename_log', "Файлы не прикреплялись")
-
-    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    files_json = json.dumps({
-        "file_count": len(files),
-        "doc_ids": [],
-        "photo_ids": [],
-        "rename_log": rename_log
-    }, ensure_ascii=False, indent=2)
-
-    # Сохраняем в базу
-    update_task(task_id, "user_id", user_id)
-    update_task(task_id, "user_name", user_name)
-    update_task(task_id, "created_at", created_at)
-    update_task(task_id, "full_text", full_text)
-    update_task(task_id, "files_json", files_json)
-    update_task(task_id, "sost", "sucsessefully_publeshed")
-
-    # Сохраняем текст и лог
-    text_file_path = save_text_file(task_id, full_text)
-    save_rename_log(task_id, rename_log)
-
-    # Формируем данные для карточки задачи
-    task_card, task_title = build_task_card(
-        task_id, f"<a href='tg://user?id={user_id}'>{user_name}</a>", created_at, full_text, files
-    )
+    # Страницы поиска: search:<id запроса>:<страница>
+    if data.startswith(SEARCH_CALLBACK):
+        _, search_id, page = data.split(":", 2)
+        search_text = context.chat_data.get(SEARCH_KEY, {}).get(search_id)
+        if search_text is None or not _is_admin_chat(query.message.chat.id):
+            await query.answer("Поиск устарел, повторите /search")
+            return
+        text, markup = await _render_search(search_text, search_id, int(page))
+        await query.answer()
+        await query.edit_message_text(text, parse_mode="HTML", reply_markup=markup)
+        return
 
-    # Формируем данные для WEEEK
-    # Формируем описание задачи с сохранением структуры
-    task_text_parts = []
-    current_text = []
+    await query.answer()
 
-    for line in full_text.split('\n'):
-        if line.startswith('data\\') or any(f in line for f in files):
-            if current_text:
-                task_text_parts.append("\n".join(current_text))
-                current_text = []
-            task_text_parts.append(line)
-        elif line.strip():
-            current_text.append(line)
 
-    if current_text:
-        task_text_parts.append("\n".join(current_text))
+# --- История задач пользователя ---
 
-    weeek_description = "\n\n".join(task_text_parts)
+MYTASKS_CALLBACK = "mytasks:"
+MYTASKS_PAGE_SIZE = 10
+
+SOST_LABELS = {
+    "draft": "📝 черновик",
+    "sucsessefully_publeshed": "✅ опубликована",
+    "deleted_by_user": "🚫 отменена",
+}
+
+# Состояние в WEEEK по данным фоновой сверки (weeek_sync.py)
+WEEEK_STATUS_LABELS = {
+    "open": "в работе",
+    "done": "выполнена",
+    "deleted": "удалена в WEEEK",
+}
 
-    # Создаем задачу в WEEEK
-    try:
-        weeek_task_id = await create_weeek_task(
-            title=task_title,
-            description=weeek_description,
-            files_info=rename_log
-        )
 
-        # Сохраняем ID задачи из WEEEK в нашу базу
-        update_task(task_id, "weeek_task_id", str(weeek_task_id))
-        log_user_friendly(f"✅ Задача {task_id} создана в WEEEK с ID {weeek_task_id}")
-    except Exception as e:
-        log_user_friendly(f"⚠️ Ошибка при создании задачи в WEEEK: {str(e)}")
-        await update.message.reply_text(f"⚠️ Задача создана, но не отправлена в WEEEK: {str(e)}")
+async def _render_history(user_id: int, before_id: int = None, after_id: int = None):
+    rows, has_older, has_newer = await list_user_tasks(user_id, before_id, after_id, MYTASKS_PAGE_SIZE)
+    if not rows:
+        return "У вас пока нет опубликованных задач.", None
 
-    # Отправляем пользователю
-    await update.message.reply_text(f"✅ Задача создана:\n\n{task_card}", parse_mode="HTML")
+    lines = ["🗂 <b>Ваши задачи</b>\n"]
+    for task_id, created_at, sost, weeek_task_id, weeek_status, weeek_column, full_text in rows:
+        first_line = (full_text or "").strip().split("\n", 1)[0]
+        if len(first_line) > 60:
+            first_line = first_line[:57] + "..."
+        status = SOST_LABELS.get(sost, sost or "")
+        if sost == "sucsessefully_publeshed":
+            status += f", WEEEK #{weeek_task_id}" if weeek_task_id else ", ждёт отправки в WEEEK"
+            if weeek_status:
+                status += f": {WEEEK_STATUS_LABELS.get(weeek_status, weeek_status)}"
+                if weeek_status == "open" and weeek_column:
+                    status += f" ({html.escape(weeek_column)})"
+        lines.append(f"<b>#{task_id}</b> {html.escape(created_at or '')} — {status}\n{html.escape(first_line)}")
 
-    # Отправляем в админ-чат
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"{MYTASKS_CALLBACK}newer:{rows[0][0]}"))
+    if has_older:
+        buttons.append(InlineKeyboardButton("Старее ➡️", callback_data=f"{MYTASKS_CALLBACK}older:{rows[-1][0]}"))
+    return "\n\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+@instrument_handler
+async def mytasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, markup = await _render_history(update.effective_user.id)
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=markup)
+
+
+def _is_admin_chat(chat_id: int) -> bool:
     try:
-        with open("Admin_chat.txt", "r", encoding="utf-8") as f:
-            admin_chat_id = int(f.read().strip())
-        await context.bot.send_message(admin_chat_id, f"📥 Новая задача:\n\n{task_card}", parse_mode="HTML")
-    except Exception as e:
-        await update.message.reply_text(f"⚠️ Не удалось отправить задачу администратору: {e}")
+        return chat_id == read_admin_chat_id()
+    except (FileNotFoundError, ValueError):
+        return False
 
-    log_user_friendly(f"📦 Задача {task_id} опубликована.")
 
-    # Сброс и переход к новой задаче
-    await start(update, context)
+@instrument_handler
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Только для админ-чата
+    if not _is_admin_chat(update.effective_chat.id):
+        return
 
+    db_stats = get_db_stats()
+    outbox = await outbox_counts()
+    failed = ", ".join(f"{kind}: {count}" for kind, count in sorted(outbox["failed"].items()))
+    await update.message.reply_text(
+        f"{render_summary()}\n"
+        f"очередь записи: {db_stats['write_queue_depth']}, "
+        f"макс. ожидание записи {db_stats['write_wait_max'] * 1000:.0f} мс\n"
+        f"🔌 {weeek_breaker.describe()}\n"
+        f"📮 Outbox: в очереди {outbox['pending']}, не выполнено {failed or 0}"
+    )
 
-async def cancel_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    task_id = context.user_data.get('db_task_id')
-    mark_task_deleted(task_id)
-    delete_task_files(task_id)
-    await update.message.reply_text("🚫 Задача отменена. Ввод сброшен.")
-    log_user_friendly(f"🗑 Задача {task_id} отменена и очищены файлы.")
 
-    # Сброс и переход к новой задаче
-    await start(update, context)
+# --- Поиск по задачам (админ-чат) ---
 
+SEARCH_CALLBACK = "search:"
+# chat_data: id запроса -> текст, чтобы не тащить текст в callback_data. Запросы принадлежат
+# админ-чату, а не автору: листать результаты может любой его участник
+SEARCH_KEY = "searches"
+SEARCH_PAGE_SIZE = 5
+SEARCH_REMEMBER = 20          # сколько последних запросов помнить для листания
 
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
 
+def _highlight(fragment: str) -> str:
+    # snippet() отмечает совпадения символами \x02 и \x03; экранируем текст и ставим вместо них <b>
+    return html.escape(fragment or "").replace("\x02", "<b>").replace("\x03", "</b>")
+
+
+async def _render_search(search_text: str, search_id: str, page: int = 0):
+    rows, has_more = await search_tasks(search_text, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    if not rows:
+        return (f"🔎 По запросу «{html.escape(search_text)}» ничего не найдено." if page == 0
+                else "🔎 Больше результатов нет."), None
+
+    lines = [f"🔎 <b>{html.escape(search_text)}</b> — стр. {page + 1}\n"]
+    for task_id, created_at, user_name, weeek_task_id, fragment in rows:
+        weeek = f", WEEEK #{weeek_task_id}" if weeek_task_id else ""
+        lines.append(
+            f"<b>#{task_id}</b> {html.escape(created_at or '')}, {html.escape(user_name or '')}{weeek}\n"
+            f"{_highlight(fragment)}"
+        )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"{SEARCH_CALLBACK}{search_id}:{page - 1}"))
+    if has_more:
+        buttons.append(InlineKeyboardButton("Дальше ➡️", callback_data=f"{SEARCH_CALLBACK}{search_id}:{page + 1}"))
+    return "\n\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+@instrument_handler
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin_chat(update.effective_chat.id):
+        return
+    search_text = " ".join(context.args or []).strip()
+    if not search_text:
+        await update.message.reply_text("Использование: /search слова для поиска")
+        return
+
+    searches = context.chat_data.setdefault(SEARCH_KEY, {})
+    search_id = str(update.message.message_id)
+    searches[search_id] = search_text
+    while len(searches) > SEARCH_REMEMBER:
+        searches.pop(next(iter(searches)))
+
+    text, markup = await _render_search(search_text, search_id)
+    await update.message.reply_text(text, parse_mode="HTML", reply_markup=markup)
@@ -1,8 +1,27 @@
 # loggers.py
 
+import atexit
+import glob
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import sys
+import threading
+from datetime import datetime, timedelta
+
+LOG_DIR = "logs"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 20 * 1024 * 1024))   # размер одного файла
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 30))        # сколько дней хранить логи
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"                         # писать файлы в JSON Lines
+LOG_LEVEL_RAW = os.getenv("LOG_LEVEL_RAW", "INFO").upper()           # уровень логгера telegram
+LOG_FILE_TAG = os.getenv("LOG_FILE_TAG", "")                        # свои файлы для каждого процесса worker.py
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL = 1.0
+
+UF_LOGGER_NAME = "user_friendly"
+
 
 # Цветной вывод в консоль
 class ColorFormatter(logging.Formatter):
@@ -18,35 +37,220 @@ class ColorFormatter(logging.Formatter):
         msg = super().format(record)
         return f"{color}{record.levelname}: {msg}{self.COLORS['RESET']}"
 
+
+# Структурированный вывод: одна JSON-запись на строку
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DailyFileHandler(logging.Handler):
+    """Файл logs/<prefix>_<дата>.txt с ротацией по дню и размеру и удалением старых файлов.
+
+    Не сбрасывает буфер после каждой записи — это делает слушатель очереди после пачки.
+    """
+
+    def __init__(self, prefix: str, log_dir: str = LOG_DIR, max_bytes: int = LOG_MAX_BYTES,
+                 retention_days: int = LOG_RETENTION_DAYS, extension: str = "txt"):
+        super().__init__()
+        self.prefix = prefix
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.extension = extension
+        self._day = None
+        self._part = 0
+        self._stream = None
+
+    def _path(self) -> str:
+        suffix = f"_{self._part}" if self._part else ""
+        return os.path.join(self.log_dir, f"{self.prefix}_{self._day}{suffix}.{self.extension}")
+
+    def _open(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        while self._part and os.path.exists(self._path()) and os.path.getsize(self._path()) >= self.max_bytes:
+            self._part += 1
+        self._stream = open(self._path(), "a", encoding="utf-8")
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _rollover(self, day: str):
+        self._close_stream()
+        if day != self._day:
+            self._day = day
+            self._part = 0
+            self._purge_old()
+        else:
+            self._part += 1
+        self._open()
+
+    def _purge_old(self):
+        border = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        for path in glob.glob(os.path.join(self.log_dir, f"{self.prefix}_*.{self.extension}")):
+            day = os.path.basename(path)[len(self.prefix) + 1:len(self.prefix) + 11]
+            if day < border:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def emit(self, record):
+        try:
+            day = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d")
+            if self._stream is None or day != self._day:
+                self._rollover(day)
+            elif self.max_bytes and self._stream.tell() >= self.max_bytes:
+                self._rollover(day)
+            self._stream.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._stream is not None:
+            self._stream.flush()
+
+    def close(self):
+        self.flush()
+        self._close_stream()
+        super().close()
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    # Форматирование откладываем до фонового потока — в горячем пути только put в очередь
+    def prepare(self, record):
+        return record
+
+
+class BatchingListener(threading.Thread):
+    """Фоновый поток: забирает записи из очереди пачками и сбрасывает файлы один раз на пачку."""
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        super().__init__(name="log-listener", daemon=True)
+        self.queue = log_queue
+        self.routes = []  # (фильтр, обработчик)
+        self._sentinel = object()
+
+    def add_route(self, record_filter, handler: logging.Handler):
+        self.routes.append((record_filter, handler))
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = [record]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                    continue
+                self._dispatch(record)
+            for _, handler in self.routes:
+                handler.flush()
+            if stop:
+                break
+
+    def _dispatch(self, record):
+        for record_filter, handler in self.routes:
+            if record_filter(record) and record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stop(self):
+        if self.is_alive():
+            self.queue.put(self._sentinel)
+            self.join()
+        for _, handler in self.routes:
+            handler.close()
+
+
+def _is_user_friendly(record) -> bool:
+    return record.name == UF_LOGGER_NAME
+
+
+def _is_raw(record) -> bool:
+    return record.name != UF_LOGGER_NAME
+
+
+def _file_formatter(fmt: str) -> logging.Formatter:
+    return JsonFormatter() if LOG_JSON else logging.Formatter(fmt, datefmt="%Y-%m-%d %H:%M:%S")
+
+
+def _log_prefix(prefix: str) -> str:
+    return f"{prefix}_{LOG_FILE_TAG}" if LOG_FILE_TAG else prefix
+
+
+_log_queue = queue.SimpleQueue()
+_listener = BatchingListener(_log_queue)
+_raw_configured = False
+
+# user-friendly: консоль + logs/logs_UF_<дата>.txt
+_uf_console = logging.StreamHandler(sys.stdout)
+_uf_console.setFormatter(logging.Formatter(
+    f"[%(asctime)s]{f' [{LOG_FILE_TAG}]' if LOG_FILE_TAG else ''} %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+))
+_uf_file = DailyFileHandler(_log_prefix("logs_UF"), extension="jsonl" if LOG_JSON else "txt")
+_uf_file.setFormatter(_file_formatter("[%(asctime)s] %(message)s"))
+_listener.add_route(_is_user_friendly, _uf_console)
+_listener.add_route(_is_user_friendly, _uf_file)
+
+_uf_logger = logging.getLogger(UF_LOGGER_NAME)
+_uf_logger.setLevel(logging.INFO)
+_uf_logger.propagate = False
+_uf_logger.addHandler(_EnqueueHandler(_log_queue))
+
+_listener.start()
+
+
 def setup_user_not_friendly_logger():
-    logger = logging.getLogger("telegram")
-    logger.setLevel(logging.DEBUG)
+    """Подключает технические логи (telegram, httpx, WEEEK) к той же фоновой очереди."""
+    global _raw_configured
+    if _raw_configured:
+        return
+    _raw_configured = True
 
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    today = datetime.now().strftime("%Y-%m-%d")
-    log_path = os.path.join(log_dir, f"logs_RAW_{today}.txt")
+    logging.getLogger("telegram").setLevel(getattr(logging, LOG_LEVEL_RAW, logging.INFO))
 
     # File handler
-    file_handler = logging.FileHandler(log_path, encoding='utf-8')
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    file_handler = DailyFileHandler(_log_prefix("logs_RAW"), extension="jsonl" if LOG_JSON else "txt")
+    file_handler.setFormatter(_file_formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 
     # Console handler with color
     stream_handler = logging.StreamHandler()
     stream_handler.setFormatter(ColorFormatter('%(asctime)s - %(name)s - %(message)s'))
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    _listener.add_route(_is_raw, file_handler)
+    _listener.add_route(_is_raw, stream_handler)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(_EnqueueHandler(_log_queue))
+
+
+def stop_logging():
+    """Дописывает всё, что осталось в очереди, и закрывает файлы."""
+    _listener.stop()
+
+
+atexit.register(stop_logging)
+
 
 # Ручной логгер user-friendly
 def log_user_friendly(msg: str):
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    today = datetime.now().strftime("%Y-%m-%d")
-    path = os.path.join(log_dir, f"logs_UF_{today}.txt")
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    formatted = f"[{timestamp}] {msg}"
-    print(formatted)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(formatted + "\n")
+    _uf_logger.info(msg)
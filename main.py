@@ -1,12 +1,30 @@
 # main.py
 
 import asyncio
+import os
+import signal
 import sys
 from telegram.ext import ApplicationBuilder
 from loggers import setup_user_not_friendly_logger, log_user_friendly
-from db import init_db
+from db import close_connections
+from db_async import init_db, shutdown_db_executor, get_db_stats
 from handlers import register_handlers
-from WEEEK import initialize_weeek_data
+from outbox import set_bot as set_outbox_bot, worker as outbox_worker
+from archive import archiver
+from weeek_sync import status_sync
+from persistence import SQLitePersistence
+from processing import pool as processing_pool
+from downloads import downloader
+from config import config
+from metrics import server as metrics_server
+from WEEEK import initialize_weeek_data, open_weeek_client, close_weeek_client
+from webhook import WebhookServer
+
+CONCURRENT_UPDATES = 64
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()  # polling | webhook
+# all — очередь outbox разбирается в этом же процессе; ingest — только приём сообщений,
+# публикацию выполняют отдельные процессы worker.py
+BOT_ROLE = os.getenv("BOT_ROLE", "all").lower()
 
 
 def read_token():
@@ -14,41 +32,97 @@ def read_token():
         return f.read().strip()
 
 
-async def main():
-    log_user_friendly("🚀 Запуск бота...")
-    init_db()
-    setup_user_not_friendly_logger()
-
+async def init_weeek():
     try:
         await initialize_weeek_data()
         log_user_friendly("✅ WEEEK данные успешно инициализированы")
     except Exception as e:
         log_user_friendly(f"⚠️ Ошибка инициализации WEEEK: {e}")
 
+
+def install_stop_signals(stop_event: asyncio.Event):
+    """SIGINT/SIGTERM завершают бот штатно; на Windows остаётся KeyboardInterrupt."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+
+async def main():
+    log_user_friendly("🚀 Запуск бота...")
+    setup_user_not_friendly_logger()
+    # Настройки из файлов проверяем сразу, а не при первом сообщении пользователя
+    config.validate()
+
     token = read_token()
-    application = ApplicationBuilder().token(token).build()
+    # Обновления разных чатов обрабатываются параллельно; внутри чата порядок держит DraftSession.lock
+    # Черновики хранятся в tasks.db и восстанавливаются после перезапуска
+    application = (
+        ApplicationBuilder().token(token).concurrent_updates(CONCURRENT_UPDATES)
+        .persistence(SQLitePersistence()).build()
+    )
     register_handlers(application)
-
-    log_user_friendly("🤖 Бот запущен и готов к работе.")
+    set_outbox_bot(application.bot)
+    await open_weeek_client()
+    webhook_server = WebhookServer(application) if BOT_MODE == "webhook" else None
+    stop_event = asyncio.Event()
+    install_stop_signals(stop_event)
 
     try:
+        # Независимые шаги инициализации выполняем параллельно; черновики из БД
+        # загружаются в application.initialize(), поэтому схема должна быть готова раньше
+        await asyncio.gather(init_db(), init_weeek())
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        if webhook_server is not None:
+            await webhook_server.start()
+        else:
+            await application.updater.start_polling()
+        if BOT_ROLE == "ingest":
+            log_user_friendly("📮 Режим ingest: очередь outbox разбирают процессы worker.py")
+        else:
+            outbox_worker.start()
+            status_sync.start()
+        archiver.start()
+        config.start_watching()
+        await metrics_server.start()
 
-        while True:
-            await asyncio.sleep(1)
+        log_user_friendly(f"🤖 Бот запущен и готов к работе (режим: {'вебхук' if webhook_server else 'polling'}).")
+
+        await stop_event.wait()
+        log_user_friendly("🛑 Получен сигнал остановки...")
     except (KeyboardInterrupt, asyncio.CancelledError):
         log_user_friendly("🛑 Получен сигнал остановки...")
     finally:
         log_user_friendly("⏳ Останавливаем бота...")
         try:
+            if webhook_server is not None:
+                await webhook_server.stop()
             if application.updater.running:
                 await application.updater.stop()
+            # Outbox отправляет в админ-чат через application.bot: дожидаемся его заданий до остановки бота
+            await outbox_worker.stop()
+            await status_sync.stop()
             await application.stop()
             await application.shutdown()
         except Exception as e:
             log_user_friendly(f"⚠️ Ошибка при остановке: {e}")
+        await metrics_server.stop()
+        await config.stop_watching()
+        await archiver.stop()
+        # Загрузки пишут во временные файлы и в БД и пользуются пулом обработки — останавливаем их раньше
+        await downloader.shutdown()
+        await close_weeek_client()
+        processing_pool.shutdown()
+        stats = get_db_stats()
+        log_user_friendly(
+            f"📊 БД: записей {stats['writes']}, макс. ожидание записи {stats['write_wait_max']:.3f} с, "
+            f"чтений {stats['reads']}, макс. ожидание чтения {stats['read_wait_max']:.3f} с"
+        )
+        shutdown_db_executor()
+        close_connections()
         log_user_friendly("🛑 Бот успешно остановлен")
 
 
@@ -0,0 +1,273 @@
+# metrics.py
+# Метрики в памяти: счётчики, гистограммы и gauge с метками.
+# Отдаются в формате Prometheus на локальном HTTP-порту и кратко — командой /stats.
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from loggers import log_user_friendly
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))  # 0 — не поднимать HTTP-эндпоинт
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(key: tuple, extra: dict = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def items(self) -> list:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Значение снимается функцией в момент экспорта, поэтому в горячем пути ничего не стоит."""
+
+    def __init__(self, name: str, help_text: str, read):
+        self.name = name
+        self.help = help_text
+        self._read = read
+
+    def render(self) -> list:
+        try:
+            value = self._read()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [счётчики по корзинам..., +Inf], сумма
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def series(self) -> dict:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+    def quantile(self, q: float, counts: list) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины, как histogram_quantile без интерполяции)."""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self.series().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self.register(Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, read) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.histogram("buhbot_handler_duration_seconds", "Время обработки апдейта хендлером")
+HANDLER_ERRORS = registry.counter("buhbot_handler_errors_total", "Исключения в хендлерах")
+WEEEK_LATENCY = registry.histogram("buhbot_weeek_request_duration_seconds", "Время HTTP-запроса к WEEEK")
+WEEEK_QUEUE_WAIT = registry.histogram("buhbot_weeek_queue_wait_seconds", "Ожидание разрешения планировщика WEEEK")
+WEEEK_THROTTLED = registry.counter("buhbot_weeek_throttled_total", "Ответы 429 от WEEEK")
+WEEEK_CIRCUIT_REJECTED = registry.counter("buhbot_weeek_circuit_rejected_total", "Вызовы WEEEK, отклонённые предохранителем")
+WEEEK_CIRCUIT_TRANSITIONS = registry.counter("buhbot_weeek_circuit_transitions_total", "Смены состояния предохранителя WEEEK")
+DB_LATENCY = registry.histogram("buhbot_db_op_duration_seconds", "Время выполнения функции db.py")
+DB_WAIT = registry.histogram("buhbot_db_queue_wait_seconds", "Ожидание в очереди исполнителя БД")
+
+
+def instrument_handler(func):
+    """Замеряет время и ошибки асинхронного хендлера Telegram."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+
+    return wrapper
+
+
+# --- Краткая сводка для /stats ---
+
+def _summarize(histogram: Histogram, label: str) -> list:
+    rows = []
+    for key, (counts, total) in sorted(histogram.series().items()):
+        count = sum(counts)
+        labels = dict(key)
+        name = " ".join(str(labels[k]) for k in dict.fromkeys((label, "method", "status", "kind")) if k in labels)
+        rows.append(
+            f"{name}: {count} шт., ср. {total / count * 1000:.0f} мс, "
+            f"p95 ≤ {histogram.quantile(0.95, counts) * 1000:.0f} мс"
+        )
+    return rows
+
+
+def render_summary() -> str:
+    parts = ["📊 Хендлеры:"]
+    parts += _summarize(HANDLER_LATENCY, "handler") or ["нет данных"]
+    errors = [f"{dict(key)['handler']}: {int(v)}" for key, v in HANDLER_ERRORS.items() if v]
+    if errors:
+        parts.append("Ошибки: " + ", ".join(errors))
+    parts.append("\n🌐 WEEEK:")
+    parts += _summarize(WEEEK_LATENCY, "endpoint") or ["нет данных"]
+    parts += [f"ожидание лимита {row}" for row in _summarize(WEEEK_QUEUE_WAIT, "priority")]
+    throttled = sum(v for _, v in WEEEK_THROTTLED.items())
+    if throttled:
+        parts.append(f"Ответов 429: {int(throttled)}")
+    parts.append("\n🗄 БД:")
+    parts += _summarize(DB_LATENCY, "op") or ["нет данных"]
+    parts += [f"ожидание в очереди {row}" for row in _summarize(DB_WAIT, "kind")]
+    return "\n".join(parts)
+
+
+# --- HTTP-эндпоинт /metrics ---
+
+class MetricsServer:
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        if not self.port:
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            log_user_friendly(f"📈 Метрики доступны на http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            log_user_friendly(f"⚠️ Не удалось поднять эндпоинт метрик: {e}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+server = MetricsServer()
@@ -0,0 +1,310 @@
+# outbox.py
+# Фоновый обработчик очереди outbox: выполняет отложенные действия (файлы задачи, карточка в админ-чате,
+# создание задач в WEEEK, загрузка вложений) с ограниченной параллельностью и экспоненциальной
+# задержкой между попытками. Очередь живёт в tasks.db, поэтому её могут разбирать и отдельные
+# процессы (worker.py): каждое задание арендуется одним обработчиком, аренда продлевается,
+# пока задание выполняется, и переходит к другому, только если обработчик пропал.
+
+import asyncio
+import os
+import random
+import socket
+import time
+import uuid
+
+from telegram import InputMediaPhoto
+from telegram.error import BadRequest, Forbidden
+
+from config import config
+from db_async import (
+    claim_outbox_jobs, complete_outbox_job, retry_outbox_job, fail_outbox_job, extend_outbox_leases,
+    next_outbox_due, get_finished_uploads, mark_upload_finished, get_task_column, save_weeek_task_id
+)
+from loggers import log_user_friendly
+from processing import thumbnail_path_for
+from utils import save_text_file, save_rename_log
+from WEEEK import WeeekAPIError, create_weeek_task, open_weeek_client, upload_task_attachment
+
+KIND_WEEEK_CREATE = "weeek_create"
+KIND_WEEEK_UPLOAD = "weeek_upload"
+KIND_TASK_FILES = "task_files"
+KIND_ADMIN_NOTIFY = "admin_notify"
+KIND_ADMIN_THUMBNAILS = "admin_thumbnails"
+
+MAX_CONCURRENCY = 4
+LEASE_SECONDS = 120.0      # через сколько зависшее задание снова станет доступным
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 30 * 60.0
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 15))  # ~4 ч повторов, дальше задание закрывается с ошибкой
+RETRYABLE_STATUSES = frozenset({404, 408, 429})             # 4xx от WEEEK, после которых есть смысл повторить
+IDLE_POLL_SECONDS = 30.0   # как часто проверять очередь, если нас никто не разбудил
+UPLOAD_CONCURRENCY = 3     # одновременных загрузок файлов в WEEEK на весь процесс
+
+_upload_slots = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+_bot = None                # Bot для отправки в админ-чат, см. set_bot
+
+
+def set_bot(bot):
+    global _bot
+    _bot = bot
+
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_permanent_error(e: BaseException) -> bool:
+    """Ошибка, которую повтор не исправит: запрос отклонён WEEEK (4xx) или Telegram (нет доступа к чату и т. п.)."""
+    for err in (e, e.__cause__):
+        if isinstance(err, WeeekAPIError) and err.status_code and 400 <= err.status_code < 500:
+            return err.status_code not in RETRYABLE_STATUSES
+        if isinstance(err, (Forbidden, BadRequest)):
+            return True
+    return False
+
+
+async def handle_task_files(job: dict) -> dict:
+    """Текст задачи и лог переименований в папке задачи (повтор просто перезаписывает файлы)."""
+    payload = job["payload"]
+    await asyncio.to_thread(save_text_file, job["task_id"], payload["full_text"], folder=payload["folder"])
+    await asyncio.to_thread(save_rename_log, job["task_id"], payload["rename_log"], folder=payload["folder"])
+    return {}
+
+
+def _admin_chat_id() -> int:
+    admin_chat_id = config.admin_chat_id
+    if admin_chat_id is None:
+        raise RuntimeError("не задан админ-чат (Admin_chat.txt)")
+    return admin_chat_id
+
+
+async def handle_admin_notify(job: dict) -> dict:
+    await _bot.send_message(_admin_chat_id(), f"📥 Новая задача:\n\n{job['payload']['card']}", parse_mode="HTML")
+    return {}
+
+
+def _read_files(paths: list) -> list:
+    data = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data.append(f.read())
+    return data
+
+
+async def handle_admin_thumbnails(job: dict) -> dict:
+    """Превью картинок задачи под карточкой в админ-чате (альбомами по 10)."""
+    task_id = job["task_id"]
+    admin_chat_id = _admin_chat_id()
+    thumbs = [thumb for thumb in map(thumbnail_path_for, job["payload"]["paths"]) if os.path.exists(thumb)]
+    for start in range(0, len(thumbs), 10):
+        # Чтение с диска — в потоке: этот же event loop выполняет остальные задания очереди
+        batch = await asyncio.to_thread(_read_files, thumbs[start:start + 10])
+        if len(batch) == 1:
+            await _bot.send_photo(admin_chat_id, batch[0], caption=f"Задача #{task_id}")
+        else:
+            await _bot.send_media_group(
+                admin_chat_id, [InputMediaPhoto(data, caption=f"Задача #{task_id}" if i == 0 else None)
+                                for i, data in enumerate(batch)]
+            )
+    return {}
+
+
+def follow_admin_notify(job: dict, columns: dict) -> list:
+    """Превью отправляются отдельным заданием: повтор после их ошибки не дублирует карточку."""
+    paths = job["payload"].get("paths")
+    return [(KIND_ADMIN_THUMBNAILS, {"paths": paths})] if paths else []
+
+
+async def handle_weeek_create(job: dict) -> dict:
+    payload = job["payload"]
+    existing = await get_task_column(job["task_id"], "weeek_task_id")
+    if existing:
+        # Задачу уже создал обработчик, аренда которого истекла раньше, чем он закрыл задание
+        log_user_friendly(f"ℹ️ Задача {job['task_id']} уже есть в WEEEK (ID {existing}), повторно не создаём")
+        return {"weeek_task_id": existing}
+    weeek_task_id = await create_weeek_task(
+        title=payload["title"],
+        description=payload["description"],
+        files_info=payload.get("files_info", "")
+    )
+    # ID пишем сразу, а не при закрытии задания: если аренду перехватят раньше,
+    # повтор найдёт его в tasks и не создаст задачу в WEEEK ещё раз
+    saved = await save_weeek_task_id(job["task_id"], str(weeek_task_id))
+    if saved != str(weeek_task_id):
+        log_user_friendly(
+            f"⚠️ Задача {job['task_id']} создана в WEEEK повторно (ID {weeek_task_id}), оставлен ID {saved}"
+        )
+    else:
+        log_user_friendly(f"✅ Задача {job['task_id']} создана в WEEEK с ID {weeek_task_id}")
+    return {"weeek_task_id": saved}
+
+
+async def _upload_one(task_id: int, weeek_task_id, attachment: dict):
+    path = attachment["path"]
+    if not os.path.exists(path):
+        log_user_friendly(f"⚠️ Вложение {path} задачи {task_id} не найдено на диске, пропускаем")
+        await mark_upload_finished(task_id, path, "missing")
+        return
+    async with _upload_slots:
+        client = await open_weeek_client()
+        size = await upload_task_attachment(client, weeek_task_id, path, attachment["name"])
+    await mark_upload_finished(task_id, path, "uploaded", size)
+
+
+async def handle_weeek_upload(job: dict) -> dict:
+    """Загружает вложения в созданную задачу WEEEK. Уже загруженные файлы при повторе пропускаются."""
+    task_id = job["task_id"]
+    payload = job["payload"]
+    finished = await get_finished_uploads(task_id)
+    pending = [a for a in payload["attachments"] if a["path"] not in finished]
+    results = await asyncio.gather(
+        *(_upload_one(task_id, payload["weeek_task_id"], a) for a in pending), return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise RuntimeError(
+            f"не загружено вложений: {len(errors)} из {len(pending)}; первая ошибка: {errors[0]}"
+        ) from errors[0]
+    log_user_friendly(f"📎 Вложения задачи {task_id} загружены в WEEEK: {len(pending)} шт.")
+    return {}
+
+
+def follow_weeek_create(job: dict, columns: dict) -> list:
+    """После создания задачи в WEEEK ставит загрузку её вложений."""
+    attachments = job["payload"].get("attachments")
+    if not attachments:
+        return []
+    return [(KIND_WEEEK_UPLOAD, {"weeek_task_id": columns["weeek_task_id"], "attachments": attachments})]
+
+
+# kind -> корутина(job) -> колонки tasks, которые нужно записать при успехе
+JOB_HANDLERS = {
+    KIND_TASK_FILES: handle_task_files,
+    KIND_ADMIN_NOTIFY: handle_admin_notify,
+    KIND_ADMIN_THUMBNAILS: handle_admin_thumbnails,
+    KIND_WEEEK_CREATE: handle_weeek_create,
+    KIND_WEEEK_UPLOAD: handle_weeek_upload,
+}
+
+# kind -> функция(job, колонки) -> задания (kind, payload), которые ставятся вместе с закрытием этого
+FOLLOW_UPS = {
+    KIND_ADMIN_NOTIFY: follow_admin_notify,
+    KIND_WEEEK_CREATE: follow_weeek_create,
+}
+
+
+class OutboxWorker:
+    def __init__(self, handlers: dict = None, concurrency: int = MAX_CONCURRENCY,
+                 poll_seconds: float = IDLE_POLL_SECONDS):
+        self.handlers = handlers or JOB_HANDLERS
+        self.concurrency = concurrency
+        # Новые задания из другого процесса не будят нас через notify() — их видно только опросом
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+        self._renew_task = None
+        self._running = {}  # asyncio.Task -> job_id
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbox-worker")
+            self._renew_task = asyncio.create_task(self._renew_leases(), name="outbox-lease-renewal")
+            log_user_friendly("📮 Обработчик очереди outbox запущен")
+
+    def notify(self):
+        """Будит обработчик сразу после постановки нового задания."""
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        self._renew_task.cancel()
+        try:
+            await self._renew_task
+        except asyncio.CancelledError:
+            pass
+        self._task = self._renew_task = None
+        log_user_friendly("📮 Обработчик очереди outbox остановлен")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                free = self.concurrency - len(self._running)
+                if free <= 0:
+                    await self._wait(None)
+                    continue
+                jobs = await claim_outbox_jobs(free, LEASE_SECONDS, list(self.handlers), self.owner)
+                for job in jobs:
+                    task = asyncio.create_task(self._process(job))
+                    self._running[task] = job["job_id"]
+                    task.add_done_callback(self._job_finished)
+                if jobs and len(jobs) == free:
+                    # Возможно, готовых заданий больше — ждём освобождения слота
+                    await self._wait(None)
+                    continue
+
+                due = await next_outbox_due(list(self.handlers))
+                timeout = self.poll_seconds
+                if due is not None:
+                    timeout = min(self.poll_seconds, max(due - time.time(), 0.0))
+                await self._wait(timeout)
+            except Exception as e:
+                log_user_friendly(f"⚠️ Ошибка обработчика outbox: {e}")
+                await self._wait(IDLE_POLL_SECONDS)
+
+    def _job_finished(self, task):
+        self._running.pop(task, None)
+        self._wakeup.set()
+
+    async def _renew_leases(self):
+        """Пока задание выполняется, его аренда продлевается: долгая загрузка не достанется второму обработчику."""
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await extend_outbox_leases(list(self._running.values()), LEASE_SECONDS, self.owner)
+            except Exception as e:
+                log_user_friendly(f"⚠️ Не удалось продлить аренду заданий outbox: {e}")
+
+    async def _wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _process(self, job: dict):
+        handler = self.handlers[job["kind"]]
+        try:
+            columns = await handler(job) or {}
+            follow_up = FOLLOW_UPS[job["kind"]](job, columns) if job["kind"] in FOLLOW_UPS else []
+            if not await complete_outbox_job(job["job_id"], job["task_id"], follow_up, self.owner, **columns):
+                log_user_friendly(f"ℹ️ Задание {job['kind']} для задачи {job['task_id']} уже закрыто другим обработчиком")
+            elif follow_up:
+                self._wakeup.set()
+        except Exception as e:
+            if is_permanent_error(e) or job["attempts"] >= MAX_ATTEMPTS:
+                log_user_friendly(
+                    f"❌ Задание {job['kind']} для задачи {job['task_id']} не выполнено "
+                    f"(попытка {job['attempts']}): {e}. Повторов больше не будет"
+                )
+                await fail_outbox_job(job["job_id"], str(e), self.owner)
+                return
+            delay = backoff_delay(job["attempts"])
+            # WEEEK сам сказал, когда приходить (429 Retry-After) — раньше не пытаемся
+            delay = max(delay, getattr(e, "retry_after", None) or 0.0)
+            log_user_friendly(
+                f"⚠️ Задание {job['kind']} для задачи {job['task_id']} не выполнено "
+                f"(попытка {job['attempts']}): {e}. Повтор через {delay:.0f} с"
+            )
+            await retry_outbox_job(job["job_id"], str(e), time.time() + delay, self.owner)
+
+
+worker = OutboxWorker()
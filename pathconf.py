@@ -4,26 +4,31 @@ import sys
 from pathlib import Path
 
 
-def load_base_path():
-    """Читает путь из path.txt или использует папку с exe/скриптом."""
-    import sys
-
+def _app_dir() -> Path:
     if getattr(sys, 'frozen', False):  # Если исполняемый файл
-        base_dir = Path(sys.executable).parent
-    else:
-        base_dir = Path(__file__).parent
+        return Path(sys.executable).parent
+    return Path(__file__).parent
+
 
-    path_file = base_dir / "path.txt"
+PATH_FILE = str(_app_dir() / "path.txt")
+
+
+def load_base_path():
+    """Читает путь из BUHBOT_BASE_PATH, path.txt или использует папку с exe/скриптом."""
+    # Переопределение через окружение (бенчмарк, тестовые запуски)
+    env_path = os.getenv("BUHBOT_BASE_PATH")
+    if env_path:
+        return env_path
 
     try:
-        with open(path_file, "r", encoding="utf-8") as f:
+        with open(PATH_FILE, "r", encoding="utf-8") as f:
             custom_path = f.read().strip()
             if custom_path and os.path.isabs(custom_path):
                 return custom_path
     except (FileNotFoundError, UnicodeDecodeError):
         pass
 
-    return str(base_dir / "Bot_Data")
+    return str(_app_dir() / "Bot_Data")
 
 
 
@@ -0,0 +1,125 @@
+# persistence.py
+# Хранение незавершённых черновиков в tasks.db (таблица drafts), чтобы перезапуск бота их не терял.
+# PTB раз в DRAFTS_FLUSH_SECONDS передаёт только те чаты, данные которых менялись с прошлого раза;
+# все они записываются одной транзакцией. Объём записи зависит от числа активных чатов, а не от общего.
+# Сохраняется только chat_data (там лежит DraftSession); user_data, bot_data и разговоры не хранятся.
+
+import asyncio
+import os
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from db_async import load_drafts, save_drafts
+from loggers import log_user_friendly
+from session import SESSION_KEY, DraftSession
+
+DRAFTS_FLUSH_SECONDS = float(os.getenv("DRAFTS_FLUSH_SECONDS", 5))
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, update_interval: float = DRAFTS_FLUSH_SECONDS):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self._changed = {}     # chat_id -> (task_id, data) ещё не записанных черновиков
+        self._dropped = set()
+        self._pending = None   # запись, к которой присоединяются вызовы из одного прохода PTB
+
+    # --- chat_data ---
+
+    async def get_chat_data(self) -> dict:
+        chat_data = {}
+        restored = missing = 0
+        for chat_id, data in await load_drafts():
+            session = DraftSession.from_dict(data)
+            missing += session.drop_missing_files()
+            chat_data[chat_id] = {SESSION_KEY: session}
+            restored += 1
+        if restored:
+            note = f", недокачанных вложений: {missing}" if missing else ""
+            log_user_friendly(f"♻️ Восстановлено черновиков: {restored}{note}")
+        return chat_data
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        session = data.get(SESSION_KEY)
+        if session is None or session.task_id is None:
+            self._dropped.add(chat_id)
+            self._changed.pop(chat_id, None)
+        else:
+            self._changed[chat_id] = (session.task_id, session.to_dict())
+            self._dropped.discard(chat_id)
+        await self._write_batch()
+
+    async def drop_chat_data(self, chat_id: int):
+        self._dropped.add(chat_id)
+        self._changed.pop(chat_id, None)
+        await self._write_batch()
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def flush(self):
+        await self._write_batch()
+
+    async def _write_batch(self):
+        """PTB вызывает update_chat_data для всех изменённых чатов одновременно (gather) —
+        первый вызов планирует запись, остальные дожидаются её же."""
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._write_pending())
+        await asyncio.shield(self._pending)
+
+    async def _write_pending(self):
+        try:
+            # Даём остальным вызовам из того же прохода добавить свои чаты
+            await asyncio.sleep(0)
+            while self._changed or self._dropped:
+                changed = [(chat_id, task_id, data) for chat_id, (task_id, data) in self._changed.items()]
+                dropped = list(self._dropped)
+                self._changed, self._dropped = {}, set()
+                try:
+                    await save_drafts(changed, dropped)
+                except Exception:
+                    # Не теряем изменения: запишем их в следующий проход, если чат не обновился ещё раз
+                    for chat_id, task_id, data in changed:
+                        if chat_id not in self._dropped:
+                            self._changed.setdefault(chat_id, (task_id, data))
+                    self._dropped.update(chat_id for chat_id in dropped if chat_id not in self._changed)
+                    raise
+        finally:
+            self._pending = None
+
+    # --- остальное не хранится ---
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def update_user_data(self, user_id: int, data: dict):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state):
+        pass
@@ -0,0 +1,284 @@
+# processing.py
+# Обработка вложений после скачивания в отдельных процессах (ProcessPoolExecutor):
+# хэширование, пережатие JPEG/PNG, превью для карточки в админ-чате и проверка zip/docx.
+# Event loop только ставит задания и ждёт результат. Число заданий в работе ограничено:
+# при пачке больших файлов загрузки ждут свободного места, а не копят очередь в памяти.
+# Задание, не уложившееся в PROCESSING_TIMEOUT, останавливает процессы пула: зависший воркер не держит место.
+#
+# Задания — функции уровня модуля (их можно передать в другой процесс). Новое задание
+# добавляется так же: функция здесь и вызов через pool.run().
+# Pillow не обязателен: без него пережатие и превью пропускаются.
+
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from loggers import log_user_friendly
+from metrics import registry
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+PROCESSING_MAX_PENDING = int(os.getenv("PROCESSING_MAX_PENDING", PROCESSING_WORKERS * 4))
+PROCESSING_TIMEOUT = float(os.getenv("PROCESSING_TIMEOUT", 120))
+
+IMAGE_RECOMPRESS = os.getenv("IMAGE_RECOMPRESS", "1") == "1"
+RECOMPRESS_DOCUMENTS = os.getenv("RECOMPRESS_DOCUMENTS", "0") == "1"  # картинки, присланные файлом, по умолчанию не трогаем
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 2560))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 85))
+THUMBNAIL_SIDE = int(os.getenv("THUMBNAIL_SIDE", 320))
+THUMBS_DIR = "thumbs"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png"})
+OFFICE_EXTENSIONS = frozenset({".docx", ".xlsx", ".pptx"})
+CONTAINER_EXTENSIONS = OFFICE_EXTENSIONS | {".zip"}
+MAX_ZIP_MEMBERS = 10000
+MAX_ZIP_RATIO = 100                      # распакованный размер / сжатый — выше похоже на zip-бомбу
+MAX_ZIP_UNPACKED = 2 * 1024 ** 3         # больше этого содержимое не распаковываем для проверки
+
+PROCESSING_LATENCY = registry.histogram("buhbot_processing_duration_seconds", "Время задания обработки вложений")
+PROCESSING_SAVED = registry.counter("buhbot_processing_saved_bytes_total", "Байт сэкономлено пережатием картинок")
+PROCESSING_WARNINGS = registry.counter("buhbot_processing_warnings_total", "Вложения, не прошедшие проверку")
+
+
+class ProcessingError(Exception):
+    pass
+
+
+class _Recycled(Exception):
+    """Задание прервано остановкой пула из-за другого, зависшего задания."""
+
+
+# --- Задания (выполняются в процессе-воркере) ---
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def recompress_image(path: str, ext: str) -> int:
+    """Уменьшает картинку до IMAGE_MAX_SIDE и пережимает. Файл заменяется, только если стал меньше.
+
+    Возвращает число сэкономленных байт.
+    """
+    if Image is None:
+        return 0
+    tmp_path = path + ".recompress"
+    with Image.open(path) as img:
+        img.load()
+        exif = img.info.get("exif")
+        if max(img.size) > IMAGE_MAX_SIDE:
+            img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if ext == ".png":
+            img.save(tmp_path, "PNG", optimize=True)
+        else:
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            params = {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}
+            if exif:
+                params["exif"] = exif  # ориентация и дата съёмки
+            img.save(tmp_path, "JPEG", **params)
+    old_size, new_size = os.path.getsize(path), os.path.getsize(tmp_path)
+    if new_size < old_size:
+        os.replace(tmp_path, path)
+        return old_size - new_size
+    os.remove(tmp_path)
+    return 0
+
+
+def check_container(path: str, ext: str) -> list:
+    """Базовая проверка zip и документов Office. Возвращает список замечаний (пустой — всё в порядке)."""
+    warnings = []
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            unpacked = sum(info.file_size for info in infos)
+            packed = sum(info.compress_size for info in infos)
+            if len(infos) > MAX_ZIP_MEMBERS:
+                warnings.append(f"слишком много файлов внутри ({len(infos)})")
+            elif packed and unpacked / packed > MAX_ZIP_RATIO:
+                warnings.append(f"подозрительно высокая степень сжатия ({unpacked // packed}:1)")
+            elif unpacked > MAX_ZIP_UNPACKED:
+                warnings.append(f"слишком большое содержимое ({unpacked // 1024 ** 2} МБ), не проверялось")
+            else:
+                broken = zf.testzip()
+                if broken is not None:
+                    warnings.append(f"повреждён элемент {broken}")
+            if ext in OFFICE_EXTENSIONS and "[Content_Types].xml" not in zf.namelist():
+                warnings.append("не похоже на документ Office")
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+        warnings.append(f"файл повреждён или это не zip-архив ({e})")
+    return warnings
+
+
+def prepare_download(path: str, ext: str, recompress: bool) -> dict:
+    """Всё, что нужно сделать со свежескачанным файлом до переноса в хранилище, одним заданием."""
+    warnings = check_container(path, ext) if ext in CONTAINER_EXTENSIONS else []
+    saved = 0
+    if recompress and IMAGE_RECOMPRESS and ext in IMAGE_EXTENSIONS:
+        try:
+            saved = recompress_image(path, ext)
+        except Exception as e:
+            # Картинка не открылась — оставляем как есть
+            warnings.append(f"не удалось пережать: {e}")
+    return {"sha256": sha256_file(path), "size": os.path.getsize(path), "saved": saved, "warnings": warnings}
+
+
+def make_thumbnail(src_path: str, dest_path: str) -> str:
+    with Image.open(src_path) as img:
+        img.thumbnail((THUMBNAIL_SIDE, THUMBNAIL_SIDE))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        img.save(dest_path, "JPEG", quality=80)
+    return dest_path
+
+
+def thumbnail_path_for(path: str) -> str:
+    folder, name = os.path.split(path)
+    return os.path.join(folder, THUMBS_DIR, os.path.splitext(name)[0] + ".jpg")
+
+
+def can_thumbnail(path: str) -> bool:
+    return Image is not None and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+# --- Пул процессов ---
+
+def _worker_processes(executor: ProcessPoolExecutor):
+    """Процессы пула или None, если их не достать.
+
+    Публичного способа остановить зависший воркер у ProcessPoolExecutor нет, поэтому берём
+    внутренний словарь _processes. shutdown() его обнуляет — вызывать до shutdown().
+    """
+    processes = getattr(executor, "_processes", None)
+    if not isinstance(processes, dict):
+        return None
+    return list(processes.values())
+
+
+class ProcessingPool:
+    def __init__(self, workers: int = PROCESSING_WORKERS, max_pending: int = PROCESSING_MAX_PENDING,
+                 timeout: float = PROCESSING_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor = None
+        self._recycled = weakref.WeakSet()  # пулы, остановленные нами из-за зависшего задания
+        self.in_flight = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # Воркер упал (например, на битой картинке) — такой пул больше не принимает задания.
+        # Пул, уже пересозданный другим заданием, не трогаем
+        if self._executor is not broken:
+            return
+        log_user_friendly("⚠️ Процесс обработки вложений завершился аварийно, пул перезапущен")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _recycle(self, stuck: ProcessPoolExecutor):
+        """Задание не уложилось в таймаут: останавливаем процессы пула, иначе зависший воркер (например,
+        на картинке-бомбе) так и останется занятым, а его место в очереди — неосвобождённым.
+
+        Остальные задания этого пула получат BrokenProcessPool, и run() повторит их в новом пуле.
+        """
+        if stuck in self._recycled:
+            return
+        self._recycled.add(stuck)
+        if self._executor is stuck:
+            self._executor = None
+        processes = _worker_processes(stuck)
+        if processes is None:
+            # Процессы пула недоступны: новые задания пойдут в новый пул, а старый доработает сам
+            stuck.shutdown(wait=False, cancel_futures=False)
+            log_user_friendly(
+                "⚠️ Задание обработки вложений зависло; остановить его процесс не удалось, "
+                "место в очереди освободится, когда процесс закончит"
+            )
+            return
+        stuck.shutdown(wait=False, cancel_futures=False)
+        for process in processes:
+            process.kill()
+        log_user_friendly(f"⏱ Задание обработки вложений зависло, процессы пула перезапущены ({len(processes)})")
+
+    async def run(self, fn, *args, timeout: float = None):
+        """Выполняет fn(*args) в процессе-воркере. Ждёт свободного места, если заданий в работе слишком много."""
+        try:
+            return await self._run_once(fn, args, timeout)
+        except _Recycled:
+            # Пул остановили из-за чужого зависшего задания — это задание не виновато, повторяем один раз
+            try:
+                return await self._run_once(fn, args, timeout)
+            except _Recycled:
+                raise ProcessingError(f"{fn.__name__}: пул обработки перезапущен во время задания") from None
+
+    async def _run_once(self, fn, args: tuple, timeout: float = None):
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._restart(executor)
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        self.in_flight += 1
+
+        def _done(_):
+            # Место освобождается, когда воркер действительно закончил или пул остановлен
+            loop.call_soon_threadsafe(self._release)
+
+        future.add_done_callback(_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._recycle(executor)
+            raise ProcessingError(f"{fn.__name__}: не уложилось в {timeout or self.timeout:.1f} с") from None
+        except BrokenProcessPool:
+            if executor in self._recycled:
+                raise _Recycled() from None
+            self._restart(executor)
+            raise ProcessingError(f"{fn.__name__}: процесс обработки завершился аварийно") from None
+        finally:
+            PROCESSING_LATENCY.observe(time.perf_counter() - started, job=fn.__name__)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+pool = ProcessingPool()
+registry.gauge("buhbot_processing_in_flight", "Заданий обработки вложений в работе", lambda: pool.in_flight)
+
+
+def report_warnings(name: str, warnings: list):
+    for warning in warnings:
+        PROCESSING_WARNINGS.inc()
+        log_user_friendly(f"⚠️ Вложение {name}: {warning}")
@@ -0,0 +1,118 @@
+# ratelimit.py
+# Планировщик запросов по принципу token bucket с приоритетами:
+# запрос ждёт свободный токен, а при ответе 429 весь поток запросов ставится на паузу.
+
+import asyncio
+import heapq
+import itertools
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# Меньше — важнее
+PRIORITY_TASK = 0        # создание задач и всё, что ему нужно
+PRIORITY_DEFAULT = 5
+PRIORITY_BOOTSTRAP = 10  # поиск проекта/доски/колонки при старте и фоновая сверка
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After бывает числом секунд или HTTP-датой."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class TokenBucketScheduler:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate          # токенов в секунду
+        self.burst = burst        # максимальный запас токенов
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []        # куча (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = PRIORITY_DEFAULT) -> float:
+        """Ждёт разрешения на запрос. Возвращает время ожидания в секундах."""
+        started = time.monotonic()
+        if not self._waiters and self._try_take():
+            return 0.0
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        await future
+        return time.monotonic() - started
+
+    def pause_for(self, seconds: float):
+        """Никому не выдаём токены ближайшие seconds (ответ 429 / Retry-After)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        # Пауза не копит запас: после неё токены набираются с нуля, без всплеска из burst запросов
+        self._updated = self._paused_until
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + max(0.0, now - self._updated) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def _try_take(self) -> bool:
+        if time.monotonic() < self._paused_until:
+            return False
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="weeek-rate-limiter")
+
+    async def _dispatch(self):
+        while True:
+            # Отменённые ожидания выкидываем из головы очереди
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), 60)
+                except asyncio.TimeoutError:
+                    if not self._waiters:
+                        return
+                continue
+
+            if self._try_take():
+                _, _, future = heapq.heappop(self._waiters)
+                if future.done():
+                    self._tokens += 1.0  # ожидающий уже ушёл — токен возвращаем
+                else:
+                    future.set_result(None)
+                continue
+
+            now = time.monotonic()
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            else:
+                delay = max((1.0 - self._tokens) / self.rate, 0.001)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,116 @@
+# session.py
+# Состояние черновика задачи для одного чата. Хранится в context.chat_data,
+# поэтому обновления разных чатов можно обрабатывать параллельно (concurrent_updates).
+# Между перезапусками черновик сохраняется в tasks.db (см. persistence.py) через to_dict/from_dict.
+
+import asyncio
+import os
+
+SESSION_KEY = "session"
+
+
+class DraftSession:
+    def __init__(self):
+        self.lock = asyncio.Lock()  # сериализует изменения черновика внутри одного чата
+        self.task_id = None
+        self.folder = None             # папка задачи, зафиксированная при создании черновика
+        self.messages = []
+        self.files = []
+        self.rename_log = ""
+        self.media_groups = {}         # media_group_id -> индекс записи в messages
+        self.pending_downloads = set()  # незавершённые загрузки вложений
+        self._next_file_no = 0
+
+    def reset(self, task_id: int, folder: str = None):
+        self.task_id = task_id
+        self.folder = folder
+        self.messages = []
+        self.files = []
+        self.rename_log = ""
+        self.media_groups = {}
+        self.pending_downloads = set()
+        self._next_file_no = 0
+
+    # Блокировка и фоновые загрузки принадлежат работающему процессу: при копировании
+    # (PTB копирует chat_data перед сохранением) и восстановлении создаются заново
+    def __getstate__(self) -> dict:
+        return self.to_dict()
+
+    def __setstate__(self, state: dict):
+        self.__init__()
+        self._load(state)
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "folder": self.folder,
+            "messages": list(self.messages),
+            "files": list(self.files),
+            "rename_log": self.rename_log,
+            "media_groups": dict(self.media_groups),
+            "next_file_no": self._next_file_no,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DraftSession":
+        session = cls()
+        session._load(data)
+        return session
+
+    def _load(self, data: dict):
+        self.task_id = data.get("task_id")
+        self.folder = data.get("folder")
+        self.messages = list(data.get("messages", []))
+        self.files = list(data.get("files", []))
+        self.rename_log = data.get("rename_log", "")
+        self.media_groups = dict(data.get("media_groups", {}))
+        self._next_file_no = data.get("next_file_no", 0)
+
+    def drop_missing_files(self) -> int:
+        """После перезапуска: вложения, загрузка которых не успела завершиться, помечаются как нескачанные."""
+        missing = 0
+        for index, entry in enumerate(self.files):
+            name, sep, path = entry.rpartition(" -> ")
+            if sep and not os.path.exists(path):
+                self.files[index] = name
+                missing += 1
+        return missing
+
+    def reserve_file_no(self) -> int:
+        """Выдаёт порядковый номер вложения в рамках текущей задачи."""
+        file_no = self._next_file_no
+        self._next_file_no += 1
+        return file_no
+
+    def add_message(self, text: str, media_group_id=None):
+        """Добавляет запись в текст задачи; части одного альбома склеиваются в одну запись."""
+        if media_group_id is not None and media_group_id in self.media_groups:
+            index = self.media_groups[media_group_id]
+            self.messages[index] = f"{self.messages[index]}\n{text}" if self.messages[index] else text
+            return
+        self.messages.append(text)
+        if media_group_id is not None:
+            self.media_groups[media_group_id] = len(self.messages) - 1
+
+    def downloaded_files(self) -> list:
+        """Пары (имя для WEEEK, путь на диске) для вложений, которые удалось скачать."""
+        result = []
+        for entry in self.files:
+            name, sep, path = entry.rpartition(" -> ")
+            if sep:
+                result.append((os.path.basename(path) if name == "photo" else name, path))
+        return result
+
+    def mark_file_failed(self, entry: str, original_name: str, rename_line: str):
+        """Помечает вложение как нескачанное: в карточке оно будет показано с ❌."""
+        if entry in self.files:
+            self.files[self.files.index(entry)] = original_name
+        self.rename_log = self.rename_log.replace(rename_line, "", 1)
+
+
+def get_session(context) -> DraftSession:
+    session = context.chat_data.get(SESSION_KEY)
+    if session is None:
+        session = DraftSession()
+        context.chat_data[SESSION_KEY] = session
+    return session
@@ -0,0 +1,22 @@
+# conftest.py
+# Модули бота лежат в корне репозитория; рабочая папка (BASE_PATH) и текущий каталог (туда пишутся logs/)
+# на время тестов — временные, чтобы тесты не трогали Bot_Data и логи рядом со скриптами.
+
+import os
+import sys
+import tempfile
+
+_base_dir = tempfile.TemporaryDirectory(prefix="buhbot_tests_")
+_initial_cwd = os.getcwd()
+os.environ["BUHBOT_BASE_PATH"] = _base_dir.name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(_base_dir.name)
+
+
+def pytest_unconfigure(config):
+    # Поток логов пишет в sys.stdout, который pytest подменяет на время прогона: дописываем очередь до того,
+    # как pytest закроет свой поток
+    if "loggers" in sys.modules:
+        sys.modules["loggers"].stop_logging()
+    os.chdir(_initial_cwd)
+    _base_dir.cleanup()
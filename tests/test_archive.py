@@ -0,0 +1,68 @@
+# test_archive.py
+
+import asyncio
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import db
+from archive import Archiver
+
+
+@pytest.fixture
+def old_day(tmp_path):
+    db.init_db()
+    day = (date.today() - timedelta(days=40)).isoformat()
+    day_path = tmp_path / day
+    day_path.mkdir()
+    return str(day_path)
+
+
+def _task_in(day_path: str) -> int:
+    task_id = db.create_task(day_path)
+    folder = db.get_task_column(task_id, "folder_path")
+    os.makedirs(folder)
+    with open(os.path.join(folder, "task.txt"), "w", encoding="utf-8") as f:
+        f.write("текст")
+    return task_id
+
+
+def _archive(base_path) -> dict:
+    archiver = Archiver(base_path=str(base_path), after_days=30, retention_days=0, io_limit=0)
+    return asyncio.run(archiver.run_once())
+
+
+def test_day_with_open_draft_is_not_archived(tmp_path, old_day):
+    task_id = _task_in(old_day)
+    db.save_drafts([(1, task_id, {"task_id": task_id})], [])
+
+    assert _archive(tmp_path)["archived_days"] == 0
+    assert os.path.isdir(old_day)
+
+    db.save_drafts([], [1])
+
+
+def test_day_with_pending_job_is_not_archived(tmp_path, old_day):
+    task_id = _task_in(old_day)
+    db.publish_task_record(task_id, [("task_files", {})], sost="sucsessefully_publeshed")
+
+    assert _archive(tmp_path)["archived_days"] == 0
+    assert os.path.isdir(old_day)
+
+
+def test_finished_day_is_archived(tmp_path, old_day):
+    task_id = _task_in(old_day)
+    db.update_task(task_id, "sost", "sucsessefully_publeshed")
+
+    assert _archive(tmp_path)["archived_days"] == 1
+    assert not os.path.exists(old_day)
+    assert db.find_task_archive(task_id)
+
+
+def test_catalog_is_not_saved_if_day_got_used_while_packing(old_day):
+    task_id = _task_in(old_day)
+    db.publish_task_record(task_id, [("task_files", {})], sost="sucsessefully_publeshed")
+
+    assert db.save_archive_catalog("day", "/nowhere.zip", [("x", task_id, 1)], old_day) is False
+    assert db.find_task_archive(task_id) == []
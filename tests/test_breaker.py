@@ -0,0 +1,136 @@
+# test_breaker.py
+
+import pytest
+
+import breaker
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _Clock()
+    monkeypatch.setattr(breaker, "time", fake)
+    return fake
+
+
+def _breaker(**kwargs):
+    transitions = []
+    options = dict(window_seconds=60, min_calls=4, failure_ratio=0.5, slow_call_seconds=5,
+                   open_seconds=30, max_open_seconds=100,
+                   on_state_change=lambda old, new, reason: transitions.append((old, new)))
+    options.update(kwargs)
+    return CircuitBreaker("test", **options), transitions
+
+
+def _trip(cb):
+    for _ in range(cb.min_calls):
+        cb.before_call()
+        cb.record_failure("boom")
+    assert cb.state == OPEN
+
+
+def test_stays_closed_below_min_calls(clock):
+    cb, _ = _breaker()
+    for _ in range(3):
+        cb.before_call()
+        cb.record_failure("boom")
+    assert cb.state == CLOSED
+
+
+def test_opens_when_failure_ratio_reached(clock):
+    cb, transitions = _breaker()
+    for failed in (False, True, False, True):
+        cb.before_call()
+        cb.record_failure("boom") if failed else cb.record_success(0.1)
+    assert cb.state == OPEN
+    assert transitions == [(CLOSED, OPEN)]
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as error:
+        cb.before_call()
+    assert error.value.retry_after == pytest.approx(20)
+    assert cb.rejected == 1
+
+
+def test_old_failures_leave_the_window(clock):
+    cb, _ = _breaker()
+    for _ in range(3):
+        cb.record_failure("boom")
+    clock.now += 61
+    cb.record_failure("boom")
+    assert cb.state == CLOSED
+
+
+def test_slow_success_counts_as_failure(clock):
+    cb, _ = _breaker()
+    for _ in range(4):
+        cb.before_call()
+        cb.record_success(6.0)
+    assert cb.state == OPEN
+    assert "медленный ответ" in cb.describe()
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    cb, transitions = _breaker()
+    _trip(cb)
+    clock.now += 30
+    cb.before_call()
+    assert cb.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+    assert transitions == [(CLOSED, OPEN), (OPEN, HALF_OPEN)]
+
+
+def test_successful_probe_closes_and_resets_open_time(clock):
+    cb, transitions = _breaker()
+    _trip(cb)
+    clock.now += 30
+    cb.before_call()
+    cb.record_failure("still down")
+    assert cb._current_open == 60
+
+    clock.now += 60
+    cb.before_call()
+    cb.record_success(0.1)
+    assert cb.state == CLOSED
+    assert cb._current_open == 30
+    assert transitions[-1] == (HALF_OPEN, CLOSED)
+
+    # После замыкания окно пустое: одна неудача предохранитель не размыкает
+    cb.record_failure("boom")
+    assert cb.state == CLOSED
+
+
+def test_failed_probe_doubles_open_time_up_to_limit(clock):
+    cb, _ = _breaker()
+    _trip(cb)
+    expected = [60, 100, 100]
+    for open_time in expected:
+        clock.now += cb._current_open
+        cb.before_call()
+        cb.record_failure("still down")
+        assert cb.state == OPEN
+        assert cb._current_open == open_time
+
+    clock.now += 99
+    with pytest.raises(CircuitOpenError):
+        cb.before_call()
+
+
+def test_release_probe_allows_the_next_probe(clock):
+    cb, _ = _breaker()
+    _trip(cb)
+    clock.now += 30
+    cb.before_call()
+    cb.release_probe()
+    cb.before_call()
+    assert cb.state == HALF_OPEN
+    assert cb.rejected == 0
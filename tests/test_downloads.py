@@ -0,0 +1,47 @@
+# test_downloads.py
+
+import asyncio
+import os
+
+import db
+from attachments import TMP_DIR
+from downloads import DownloadManager
+
+
+class _Session:
+    def __init__(self):
+        self.pending_downloads = set()
+
+
+class _HangingFile:
+    async def download_to_drive(self, path):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        await asyncio.sleep(60)
+
+
+class _Source:
+    file_unique_id = "hanging"
+
+    async def get_file(self):
+        return _HangingFile()
+
+
+def test_shutdown_cancels_downloads_and_removes_temp_files(tmp_path):
+    db.init_db()
+    manager = DownloadManager()
+    session = _Session()
+
+    async def scenario():
+        task = manager.submit(session, _Source(), str(tmp_path / "task" / "file.pdf"))
+        await asyncio.sleep(0.2)
+        assert os.listdir(TMP_DIR)
+        await manager.shutdown()
+        return task
+
+    task = asyncio.run(scenario())
+    assert task.cancelled()
+    assert not session.pending_downloads
+    assert not manager._tasks
+    assert os.listdir(TMP_DIR) == []
+    assert not os.path.exists(tmp_path / "task" / "file.pdf")
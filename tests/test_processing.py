@@ -0,0 +1,81 @@
+# test_processing.py
+
+import asyncio
+import os
+import time
+
+import pytest
+
+import processing
+from processing import ProcessingError, ProcessingPool
+
+
+def _pid_after(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _counting(pool: ProcessingPool) -> list:
+    calls = []
+    run_once = pool._run_once
+
+    async def wrapper(fn, args, timeout=None):
+        calls.append(fn.__name__)
+        return await run_once(fn, args, timeout)
+
+    pool._run_once = wrapper
+    return calls
+
+
+async def _settle(pool: ProcessingPool, max_pending: int, wait: float = 5.0):
+    # Места освобождаются колбэками из потока пула — даём им дойти до event loop
+    deadline = time.monotonic() + wait
+    while (pool.in_flight or pool._slots._value != max_pending) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+
+def test_timeout_recycles_pool_and_retries_neighbours():
+    async def scenario():
+        pool = ProcessingPool(workers=2, max_pending=3, timeout=0.5)
+        calls = _counting(pool)
+        try:
+            started = time.monotonic()
+            hung, neighbour = await asyncio.gather(
+                pool.run(time.sleep, 60), pool.run(_pid_after, 1.0, timeout=10), return_exceptions=True
+            )
+            assert isinstance(hung, ProcessingError)
+            assert isinstance(neighbour, int)
+            # Соседнее задание прервано остановкой пула и выполнено заново
+            assert calls.count("_pid_after") == 2
+            assert time.monotonic() - started < 10
+
+            await _settle(pool, 3)
+            assert pool.in_flight == 0
+            assert pool._slots._value == 3
+            assert await pool.run(_pid_after, 0) > 0
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_timeout_without_access_to_worker_processes(monkeypatch):
+    monkeypatch.setattr(processing, "_worker_processes", lambda executor: None)
+
+    async def scenario():
+        pool = ProcessingPool(workers=1, max_pending=2, timeout=0.3)
+        try:
+            with pytest.raises(ProcessingError):
+                await pool.run(time.sleep, 1.5)
+            # Новый пул принимает задания сразу, не дожидаясь зависшего процесса
+            started = time.monotonic()
+            assert await pool.run(_pid_after, 0, timeout=5) > 0
+            assert time.monotonic() - started < 1.5
+
+            # Место зависшего задания освобождается, когда его процесс всё-таки закончит
+            await _settle(pool, 2)
+            assert pool.in_flight == 0
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+# test_ratelimit.py
+
+import asyncio
+import time
+from email.utils import formatdate
+
+import pytest
+
+from ratelimit import PRIORITY_BOOTSTRAP, PRIORITY_DEFAULT, PRIORITY_TASK, TokenBucketScheduler, parse_retry_after
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    ("", None),
+    ("5", 5.0),
+    (" 2.5 ", 2.5),
+    ("-3", 0.0),
+    ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    assert 25 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    # Дата в прошлом — можно сразу
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+
+
+def test_burst_is_served_without_waiting():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=1, burst=3)
+        return [await scheduler.acquire() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [0.0, 0.0, 0.0]
+
+
+def test_waiters_are_served_by_priority_then_fifo():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=50, burst=1)
+        await scheduler.acquire()  # запас исчерпан — дальше все ждут в очереди
+        order = []
+
+        async def request(name, priority):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        await asyncio.gather(
+            request("bootstrap", PRIORITY_BOOTSTRAP),
+            request("default-1", PRIORITY_DEFAULT),
+            request("task", PRIORITY_TASK),
+            request("default-2", PRIORITY_DEFAULT),
+        )
+        return order
+
+    assert asyncio.run(scenario()) == ["task", "default-1", "default-2", "bootstrap"]
+
+
+def test_pause_for_holds_everyone_and_empties_bucket():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=100, burst=10)
+        scheduler.pause_for(0.3)
+        waited = await scheduler.acquire(PRIORITY_TASK)
+        return waited, scheduler._tokens
+
+    waited, tokens = asyncio.run(scenario())
+    assert waited >= 0.25
+    assert tokens < 1.0
+
+
+def test_cancelled_waiter_does_not_block_queue():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=20, burst=1)
+        await scheduler.acquire()
+        abandoned = asyncio.create_task(scheduler.acquire(PRIORITY_TASK))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.wait_for(scheduler.acquire(PRIORITY_BOOTSTRAP), 1.0)
+        return scheduler.queue_depth
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,44 @@
+# test_utils.py
+
+from utils import build_task_card, parse_task_text
+
+
+def test_title_joins_text_lines_and_is_cut_to_50():
+    parsed = parse_task_text(7, "Оплатить счёт\n\nпоставщику ООО Ромашка за октябрь и ноябрь", [])
+    assert parsed.title == "7. Оплатить счёт поставщику ООО Ромашка за октябрь"[:50]
+    assert len(parsed.title) == 50
+    assert parsed.body == "Оплатить счёт\nпоставщику ООО Ромашка за октябрь и ноябрь"
+
+
+def test_file_only_draft_gets_placeholder_title():
+    # Имена вложений сверяются без части ' -> путь': строки с файлами не попадают в название
+    files = ["act.pdf -> data\\2026-10-18\\7\\act.pdf", "bill.xlsx -> data\\2026-10-18\\7\\bill.xlsx"]
+    parsed = parse_task_text(7, "📎 act.pdf\n📎 bill.xlsx", files)
+    assert parsed.title == "7. Информация в файле"
+    assert parsed.body == "📎 act.pdf\n\n📎 bill.xlsx"
+
+
+def test_file_lines_split_the_body_into_paragraphs():
+    files = ["act.pdf -> data\\2026-10-18\\7\\act.pdf"]
+    parsed = parse_task_text(7, "Проверить акт\n📎 act.pdf\nи подписать", files)
+    assert parsed.title == "7. Проверить акт и подписать"
+    assert parsed.body == "Проверить акт\n\n📎 act.pdf\n\nи подписать"
+
+
+def test_data_paths_and_longest_names_are_matched():
+    files = ["act.pdf -> data\\a", "act.pdf.sig -> data\\b"]
+    parsed = parse_task_text(3, "data\\2026-10-18\\3\nact.pdf.sig\nТекст", files)
+    assert parsed.title == "3. Текст"
+    assert parsed.body == "data\\2026-10-18\\3\n\nact.pdf.sig\n\nТекст"
+
+
+def test_no_text_and_no_files():
+    assert parse_task_text(5, "", []) == ("5. ", "")
+
+
+def test_card_uses_parsed_title():
+    files = ["act.pdf -> data\\a", "scan.exe[Файл не скачан из-за недопустимого расширения]"]
+    text, title = build_task_card(9, "Анна", "18.10.2026", "act.pdf", files)
+    assert title == "9. Информация в файле"
+    assert "✅ act.pdf" in text
+    assert "❌ scan.exe (не скачан)" in text
@@ -0,0 +1,55 @@
+# test_webhook.py
+
+import asyncio
+
+import webhook
+from webhook import SECRET_HEADER, WebhookServer
+
+
+class _Bot:
+    async def set_webhook(self, **kwargs):
+        self.webhook = kwargs
+
+
+class _Application:
+    def __init__(self):
+        self.bot = _Bot()
+        self.update_queue = asyncio.Queue()
+
+
+def _process(server, token=None, body=b'{"update_id": 1}'):
+    headers = {SECRET_HEADER: token} if token is not None else {}
+    return asyncio.run(server._process("POST", webhook.WEBHOOK_PATH, headers, body))
+
+
+def test_valid_secret_is_accepted():
+    server = WebhookServer(_Application(), secret="s3cret")
+    assert _process(server, "s3cret") == "200 OK"
+    assert server.received == 1
+
+
+def test_wrong_or_missing_secret_is_rejected():
+    server = WebhookServer(_Application(), secret="s3cret")
+    assert _process(server, "other") == "403 Forbidden"
+    assert _process(server) == "403 Forbidden"
+    assert server.rejected == 2
+
+
+def test_non_ascii_secret_is_rejected_not_crashing():
+    # Заголовки разбираются как latin-1: байты >= 0x80 превращаются в не-ASCII символы
+    server = WebhookServer(_Application(), secret="s3cret")
+    assert _process(server, b"s3cr\xe9t".decode("latin-1")) == "403 Forbidden"
+    assert server.rejected == 1
+
+
+def test_public_url_without_secret_gets_generated_one():
+    application = _Application()
+    server = WebhookServer(application, port=0, secret="", public_url="https://example.invalid/telegram")
+
+    async def scenario():
+        await server.start()
+        await server.stop()
+
+    asyncio.run(scenario())
+    assert server.secret
+    assert application.bot.webhook["secret_token"] == server.secret
@@ -1,25 +1,23 @@
 # utils.py
 
 import os
+import re
 from datetime import datetime
-from pathconf import BASE_PATH
-
-_d_id = 0
+from typing import NamedTuple
 
-def get_d_id():
-    global _d_id
-    return _d_id
+from pathconf import BASE_PATH
 
-def increase_d_id():
-    global _d_id
-    _d_id += 1
+def day_folder(base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data') -> str:
+    """Дневная папка для новых задач: <BASE_PATH>/<YYYY-MM-DD>."""
+    return os.path.join(base_path, datetime.now().strftime("%Y-%m-%d"))
 
-def reset_d_id():
-    global _d_id
-    _d_id = 0
+def _task_folder(task_id: int, base_path: str, folder: str = None) -> str:
+    # Папка, записанная при создании черновика; без неё — по сегодняшней дате, как раньше
+    return folder or os.path.join(day_folder(base_path), str(task_id))
 
-def save_text_file(task_id: int, text: str, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data'):
-    folder = os.path.join(base_path, datetime.now().strftime("%Y-%m-%d"), str(task_id))
+def save_text_file(task_id: int, text: str, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data',
+                   folder: str = None):
+    folder = _task_folder(task_id, base_path, folder)
     os.makedirs(folder, exist_ok=True)
     path = os.path.join(folder, f"{task_id}_text.txt")
     with open(path, "w", encoding="utf-8") as f:
@@ -30,16 +28,18 @@ def read_token():
     with open("token.txt", "r", encoding="utf-8") as f:
         return f.read().strip()
 
-def save_rename_log(task_id: int, log_text: str, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data'):
-    folder = os.path.join(base_path, datetime.now().strftime("%Y-%m-%d"), str(task_id))
+def save_rename_log(task_id: int, log_text: str, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data',
+                    folder: str = None):
+    folder = _task_folder(task_id, base_path, folder)
     os.makedirs(folder, exist_ok=True)
     path = os.path.join(folder, "rename.txt")
     with open(path, "w", encoding="utf-8") as f:
         f.write(log_text)
     return path
 
-def delete_task_files(task_id: int, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data'):
-    folder = os.path.join(base_path, datetime.now().strftime("%Y-%m-%d"), str(task_id))
+def delete_task_files(task_id: int, base_path = BASE_PATH if 'BASE_PATH' in globals() else 'data',
+                      folder: str = None):
+    folder = _task_folder(task_id, base_path, folder)
     if os.path.exists(folder):
         for root, dirs, files in os.walk(folder, topdown=False):
             for file in files:
@@ -53,36 +53,56 @@ def delete_task_files(task_id: int, base_path = BASE_PATH if 'BASE_PATH' in glob
 
 # utils.py
 
-def build_task_card(task_id: int, user_name: str, created_at: str, full_text: str, files_list: list):
-    # Формируем название задачи (без переносов строк)
-    task_lines = []
-    for line in full_text.split('\n'):
-        if not line.startswith('data\\') and line.strip() and not any(f in line for f in files_list):
-            task_lines.append(line.strip())
-    cleaned_title_text = " ".join(task_lines)
+class ParsedTask(NamedTuple):
+    title: str   # название с номером задачи, не длиннее 50 символов
+    body: str    # текст задачи: абзацы и строки с файлами разделены пустой строкой
 
-    if not cleaned_title_text and files_list:
-        cleaned_title_text = "Информация в файле"
 
-    title = f"{task_id}. {cleaned_title_text}"[:50]
+def _file_line_matcher(files_list: list):
+    """Один скомпилированный поиск по всем именам вложений вместо any() по списку на каждой строке."""
+    names = {f.split(' -> ')[0] for f in files_list}
+    names.discard('')
+    if not names:
+        return None
+    # Длинные имена первыми, чтобы альтернатива не останавливалась на их префиксах
+    pattern = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(pattern).search
 
-    # Формируем текст задачи с сохранением переносов и разделением файлов
+
+def parse_task_text(task_id: int, full_text: str, files_list: list) -> ParsedTask:
+    """За один проход по тексту собирает название задачи и её текст (он же описание для WEEEK)."""
+    is_file_line = _file_line_matcher(files_list)
+    title_lines = []
     task_text_parts = []
     current_text = []
 
     for line in full_text.split('\n'):
-        if line.startswith('data\\') or any(f in line for f in [f.split(' -> ')[0] for f in files_list]):
+        if line.startswith('data\\') or (is_file_line is not None and is_file_line(line)):
             if current_text:
                 task_text_parts.append("\n".join(current_text))
                 current_text = []
             task_text_parts.append(line)
         elif line.strip():
+            title_lines.append(line.strip())
             current_text.append(line)
 
     if current_text:
         task_text_parts.append("\n".join(current_text))
 
-    task_text = "\n\n".join(task_text_parts)
+    # Формируем название задачи (без переносов строк)
+    cleaned_title_text = " ".join(title_lines)
+    if not cleaned_title_text and files_list:
+        cleaned_title_text = "Информация в файле"
+
+    title = f"{task_id}. {cleaned_title_text}"[:50]
+    return ParsedTask(title, "\n\n".join(task_text_parts))
+
+
+def build_task_card(task_id: int, user_name: str, created_at: str, full_text: str, files_list: list,
+                    parsed: ParsedTask = None):
+    if parsed is None:
+        parsed = parse_task_text(task_id, full_text, files_list)
+    title, task_text = parsed
 
     # Формируем текст карточки
     text = (
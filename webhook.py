@@ -0,0 +1,142 @@
+# webhook.py
+# Приём обновлений через вебхук вместо long polling.
+# Свой HTTP-сервер на asyncio: проверка секретного токена, разбор Update и передача в update_queue.
+# Если WEBHOOK_URL не задан, вебхук в Telegram не регистрируется — удобно для локальной
+# проверки: обновления можно прислать POST-запросом (см. webhook_replay.py).
+# Публичный вебхук без секрета не регистрируется: если WEBHOOK_SECRET пуст, токен генерируется при старте.
+
+import asyncio
+import hmac
+import json
+import os
+import secrets
+
+from telegram import Update
+
+from loggers import log_user_friendly
+
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")          # публичный адрес за обратным прокси
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")    # X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+MAX_BODY_BYTES = 1024 * 1024
+READ_TIMEOUT = 30.0
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class WebhookServer:
+    def __init__(self, application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET, public_url: str = WEBHOOK_URL):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.public_url = public_url
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+        self._connections = set()
+
+    async def start(self):
+        if self.public_url and not self.secret:
+            # Без секрета любой, кто достучится до прокси, сможет подсунуть поддельное обновление.
+            # Секрет передаём Telegram в set_webhook ниже, поэтому случайного на время работы достаточно
+            self.secret = secrets.token_urlsafe(32)
+            log_user_friendly("🔐 WEBHOOK_SECRET не задан — для вебхука сгенерирован случайный секретный токен")
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        log_user_friendly(f"🌐 Вебхук слушает http://{self.listen}:{self.port}{self.path}")
+        if self.public_url:
+            await self.application.bot.set_webhook(
+                url=self.public_url,
+                secret_token=self.secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+            )
+            log_user_friendly(f"🌐 Вебхук зарегистрирован в Telegram: {self.public_url}")
+        else:
+            log_user_friendly("⚠️ WEBHOOK_URL не задан — вебхук в Telegram не регистрируется (локальный режим)")
+
+    async def stop(self):
+        """Перестаёт принимать соединения и дожидается уже начатых запросов.
+
+        Вебхук в Telegram не удаляется: пока бот перезапускается, Telegram копит обновления у себя.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=5)
+        for task in self._connections:
+            task.cancel()
+        await self._server.wait_closed()
+        self._server = None
+        log_user_friendly(f"🌐 Вебхук остановлен. Принято обновлений: {self.received}, отклонено: {self.rejected}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, request_headers, body = request
+                status = await self._process(method, path, request_headers, body)
+                keep_alive = request_headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode()
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        request_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            request_headers[name.strip().lower()] = value.strip()
+        length = int(request_headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Слишком большое тело запроса")
+        body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT) if length else b""
+        return method, target.split("?", 1)[0], request_headers, body
+
+    async def _process(self, method: str, path: str, request_headers: dict, body: bytes) -> str:
+        if path != self.path:
+            return "404 Not Found"
+        if method != "POST":
+            return "405 Method Not Allowed"
+        # Сравниваем байты: compare_digest на str падает с TypeError, если в заголовке есть не-ASCII символы
+        token = request_headers.get(SECRET_HEADER, "").encode("latin-1")
+        if self.secret and not hmac.compare_digest(token, self.secret.encode()):
+            self.rejected += 1
+            log_user_friendly("⛔ Вебхук: запрос с неверным секретным токеном отклонён")
+            return "403 Forbidden"
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+            if update is None:
+                raise ValueError("пустое тело")
+        except (ValueError, TypeError, KeyError) as e:
+            self.rejected += 1
+            log_user_friendly(f"⚠️ Вебхук: не удалось разобрать обновление: {e}")
+            return "400 Bad Request"
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return "200 OK"
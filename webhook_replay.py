@@ -0,0 +1,73 @@
+# webhook_replay.py
+# Отправляет записанные обновления Telegram (JSON-массив или JSON Lines) на локальный вебхук.
+#
+# Пример:
+#   BOT_MODE=webhook WEBHOOK_SECRET=s3cret python main.py
+#   python webhook_replay.py updates.jsonl --secret s3cret --concurrency 20
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from webhook import WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, SECRET_HEADER, WEBHOOK_SECRET
+
+
+def load_updates(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def replay(updates: list, url: str, secret: str, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+    request_headers = {SECRET_HEADER: secret} if secret else {}
+
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        async def send(update: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.post(url, json=update, headers=request_headers)
+                latencies.append(time.perf_counter() - started)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "sent": len(updates),
+        "seconds": elapsed,
+        "updates_per_second": len(updates) / elapsed if elapsed else 0.0,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Повтор записанных обновлений на вебхук бота")
+    parser.add_argument("file", help="JSON-массив или JSON Lines с объектами Update")
+    parser.add_argument("--url", default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз повторить набор")
+    args = parser.parse_args()
+
+    updates = load_updates(args.file) * args.repeat
+    result = asyncio.run(replay(updates, args.url, args.secret, args.concurrency))
+    print(
+        f"Отправлено {result['sent']} за {result['seconds']:.2f} с ({result['updates_per_second']:.0f}/с), "
+        f"p50 {result['p50_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс, ответы: {result['statuses']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
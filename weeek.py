@@ -1,5 +1,9 @@
 # WEEEK.py
+import mimetypes
 import os
+import re
+import time
+import uuid
 
 import httpx
 import asyncio
@@ -7,16 +11,18 @@ import logging
 from dotenv import load_dotenv, set_key
 from typing import Optional
 
+from breaker import STATE_CODES, CircuitBreaker, CircuitOpenError
+from loggers import log_user_friendly
+from metrics import (
+    WEEEK_CIRCUIT_REJECTED, WEEEK_CIRCUIT_TRANSITIONS, WEEEK_LATENCY, WEEEK_QUEUE_WAIT, WEEEK_THROTTLED, registry
+)
+from ratelimit import (
+    PRIORITY_BOOTSTRAP, PRIORITY_DEFAULT, PRIORITY_TASK, TokenBucketScheduler, parse_retry_after
+)
+
 # --- Настройка логгирования ---
+# Обработчики подключает loggers.setup_user_not_friendly_logger (фоновая очередь, logs/logs_RAW_*.txt)
 logger = logging.getLogger("WEEEK_INIT")
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("weeek_integration.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
 
 # --- Загрузка переменных окружения ---
 load_dotenv()
@@ -34,24 +40,197 @@ PROJECT_NAME = "Бух. Задачи. Бэклог"
 BOARD_NAME = "Бэклог"
 COLUMN_NAME = "Бэклог. !НЕ ДВИГАТЬ!"
 
+# --- Ограничение частоты запросов ---
+# Все запросы к WEEEK идут через один token bucket; при 429 поток ставится на паузу по Retry-After
+RATE_LIMIT_PER_SECOND = float(os.getenv("WEEEK_RATE_LIMIT", 5))
+RATE_LIMIT_BURST = int(os.getenv("WEEEK_RATE_BURST", 10))
+RATE_LIMIT_RETRIES = 3         # сколько раз повторить запрос после 429, прежде чем отдать ошибку
+RATE_LIMIT_DEFAULT_PAUSE = 5.0 # пауза, если WEEEK не прислал Retry-After
+
+PRIORITY_NAMES = {PRIORITY_TASK: "task", PRIORITY_DEFAULT: "default", PRIORITY_BOOTSTRAP: "bootstrap"}
+
+scheduler = TokenBucketScheduler(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)
+registry.gauge("buhbot_weeek_queue_depth", "Запросов к WEEEK ждут разрешения планировщика",
+               lambda: scheduler.queue_depth)
+
+# --- Загрузка вложений ---
+UPLOAD_PATH = "tm/tasks/{task_id}/attachments"
+UPLOAD_FIELD = "files"
+UPLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_MIN_RATE = 256 * 1024   # байт/с: по нему бюджет времени на вызов растёт с размером файла
+
+# --- Предохранитель и бюджет времени на вызов ---
+# Пока WEEEK лежит, вызовы не ждут таймаута, а сразу получают CircuitOpenError с retry_after
+CALL_BUDGET_SECONDS = float(os.getenv("WEEEK_CALL_BUDGET", 8))       # весь HTTP-запрос, включая чтение ответа
+SLOW_CALL_SECONDS = float(os.getenv("WEEEK_SLOW_CALL", 4))           # дольше — считается неудачей
+BREAKER_OPEN_SECONDS = float(os.getenv("WEEEK_BREAKER_OPEN", 30))    # первая пауза после размыкания
+
+
+def _on_breaker_change(previous: str, state: str, reason: str):
+    WEEEK_CIRCUIT_TRANSITIONS.inc(state=state)
+    icons = {"open": "🔌 WEEEK недоступен, запросы приостановлены",
+             "half_open": "🔌 WEEEK: пробный запрос после паузы",
+             "closed": "🔌 WEEEK снова доступен"}
+    log_user_friendly(f"{icons.get(state, state)} ({reason})")
+    logger.warning(f"Предохранитель WEEEK: {previous} -> {state}: {reason}")
+
+
+breaker = CircuitBreaker(
+    "WEEEK", slow_call_seconds=SLOW_CALL_SECONDS, open_seconds=BREAKER_OPEN_SECONDS,
+    on_state_change=_on_breaker_change
+)
+registry.gauge("buhbot_weeek_circuit_state", "Предохранитель WEEEK: 0 — норма, 1 — пробный режим, 2 — разомкнут",
+               lambda: STATE_CODES[breaker.state])
+
+# HTTP/2 доступен только при установленном пакете h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# --- Общий клиент на всё время работы приложения ---
+_client: Optional[httpx.AsyncClient] = None
+
+# Кэш ID проекта, доски и колонки бэклога
+_ids = {"project_id": None, "board_id": None, "column_id": None}
+_verify_task: Optional[asyncio.Task] = None
+
+
+class WeeekAPIError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+async def open_weeek_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=15.0,
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+        )
+        logger.info(f"HTTP-клиент WEEEK открыт (HTTP/2: {'да' if HTTP2_ENABLED else 'нет'})")
+    return _client
+
+
+async def close_weeek_client():
+    global _client
+    if _verify_task is not None and not _verify_task.done():
+        _verify_task.cancel()
+        try:
+            await _verify_task
+        except asyncio.CancelledError:
+            pass
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("HTTP-клиент WEEEK закрыт")
+    _client = None
+
+
+def _endpoint_label(path: str) -> str:
+    # tm/tasks/123 -> tm/tasks/{id}, чтобы не плодить метки
+    return re.sub(r"/\d+", "/{id}", path)
+
+
+async def _send(client: httpx.AsyncClient, method: str, path: str,
+                priority: int = PRIORITY_DEFAULT, budget: float = CALL_BUDGET_SECONDS,
+                body_factory=None, **kwargs) -> httpx.Response:
+    """Все HTTP-запросы к WEEEK проходят здесь: общий адрес, заголовки, лимит частоты, предохранитель и метрики.
+
+    Запрос ждёт токен планировщика (создание задач обслуживается раньше служебных запросов).
+    На 429 весь поток запросов замирает на Retry-After, а сам запрос повторяется.
+    Сам HTTP-запрос ограничен budget секундами; ошибки сети, 5xx и медленные ответы учитывает предохранитель.
+    body_factory — для потоковых тел: поток нельзя отправить дважды, поэтому на каждую попытку создаётся новый.
+    """
+    endpoint = _endpoint_label(path)
+    request_headers = {**headers, **kwargs.pop("headers", {})}
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            WEEEK_CIRCUIT_REJECTED.inc(endpoint=endpoint)
+            raise
+
+        try:
+            waited = await scheduler.acquire(priority)
+        except BaseException:
+            breaker.release_probe()
+            raise
+        WEEEK_QUEUE_WAIT.observe(waited, priority=PRIORITY_NAMES.get(priority, str(priority)))
+        if waited > 1.0:
+            logger.info(f"Запрос {method} {endpoint} ждал лимита WEEEK {waited:.1f} с")
+
+        if body_factory is not None:
+            kwargs["content"] = body_factory()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await asyncio.wait_for(
+                client.request(method, f"{BASE_URL}{path}", headers=request_headers, **kwargs), budget
+            )
+            status = str(response.status_code)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            breaker.record_failure(f"нет ответа за {budget:.1f} с")
+            raise WeeekAPIError(f"{method} {endpoint}: WEEEK не ответил за {budget:.1f} с") from None
+        except httpx.HTTPError as e:
+            breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        except BaseException:
+            breaker.release_probe()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            WEEEK_LATENCY.observe(elapsed, endpoint=endpoint, method=method, status=status)
+
+        if response.status_code >= 500:
+            breaker.record_failure(f"HTTP {response.status_code}")
+            return response
+        if response.status_code != 429:
+            # Длинные запросы (загрузка файлов) оцениваем относительно их собственного бюджета
+            breaker.record_success(elapsed * CALL_BUDGET_SECONDS / budget)
+            return response
+
+        breaker.release_probe()
+        WEEEK_THROTTLED.inc(endpoint=endpoint)
+        pause = parse_retry_after(response.headers.get("Retry-After"))
+        scheduler.pause_for(RATE_LIMIT_DEFAULT_PAUSE if pause is None else pause)
+        if attempt < RATE_LIMIT_RETRIES:
+            logger.warning(
+                f"WEEEK ответил 429 на {method} {endpoint}, пауза "
+                f"{RATE_LIMIT_DEFAULT_PAUSE if pause is None else pause:.1f} с (попытка {attempt + 1})"
+            )
+    return response
+
+
+async def _send_bootstrap(client: httpx.AsyncClient, method: str, path: str, **kwargs) -> httpx.Response:
+    # Поиск и создание проекта/доски/колонки пропускает вперёд создание задач
+    return await _send(client, method, path, priority=PRIORITY_BOOTSTRAP, **kwargs)
+
 
 async def handle_response(response: httpx.Response, action: str):
     try:
         data = response.json()
     except Exception:
         logger.error(f"{action}: невалидный JSON")
-        raise Exception(f"{action}: невалидный JSON")
+        raise WeeekAPIError(f"{action}: невалидный JSON", response.status_code)
 
     if response.status_code >= 400:
         logger.error(f"{action}: ошибка {response.status_code} — {data.get('message')}")
-        raise Exception(f"{action}: ошибка {response.status_code} — {data.get('message')}")
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response.status_code == 429 else None
+        raise WeeekAPIError(
+            f"{action}: ошибка {response.status_code} — {data.get('message')}", response.status_code, retry_after
+        )
 
     return data
 
 
 async def find_or_create_project(client: httpx.AsyncClient) -> int:
     logger.info(f"Поиск или создание проекта '{PROJECT_NAME}'")
-    resp = await client.get(f"{BASE_URL}tm/projects", headers=headers)
+    resp = await _send_bootstrap(client, "GET", "tm/projects")
     data = await handle_response(resp, "Получение проектов")
 
     for project in data.get("projects", []):
@@ -65,18 +244,18 @@ async def find_or_create_project(client: httpx.AsyncClient) -> int:
         "description": "Автоматически созданный проект",
         "portfolioId": None
     }
-    resp = await client.post(f"{BASE_URL}tm/projects", json=payload, headers=headers)
+    resp = await _send_bootstrap(client, "POST", "tm/projects", json=payload)
     data = await handle_response(resp, "Создание проекта")
     project = data.get("project")
     if not project or "id" not in project:
-        raise Exception("Ошибка: проект создан, но ID не получен")
+        raise WeeekAPIError("Ошибка: проект создан, но ID не получен")
     logger.info(f"Проект создан: ID {project['id']}")
     return project["id"]
 
 
 async def find_or_create_board(client: httpx.AsyncClient, project_id: int) -> dict:
     logger.info(f"Поиск или создание доски '{BOARD_NAME}'")
-    resp = await client.get(f"{BASE_URL}tm/boards", headers=headers, params={"projectId": project_id})
+    resp = await _send_bootstrap(client, "GET", "tm/boards", params={"projectId": project_id})
     data = await handle_response(resp, "Получение досок")
     boards = data if isinstance(data, list) else data.get("boards", data.get("data", []))
 
@@ -91,22 +270,22 @@ async def find_or_create_board(client: httpx.AsyncClient, project_id: int) -> di
         "description": "Доска для задач",
         "color": "#3498db"
     }
-    resp = await client.post(f"{BASE_URL}tm/boards", json=payload, headers=headers)
+    resp = await _send_bootstrap(client, "POST", "tm/boards", json=payload)
     await handle_response(resp, "Создание доски")
 
-    resp = await client.get(f"{BASE_URL}tm/boards", headers=headers, params={"projectId": project_id})
+    resp = await _send_bootstrap(client, "GET", "tm/boards", params={"projectId": project_id})
     data = await handle_response(resp, "Повторный поиск доски")
     for board in data.get("boards", data.get("data", [])):
         if board.get("name") == BOARD_NAME:
             logger.info(f"Доска подтверждена: ID {board['id']}")
             return board
 
-    raise Exception("Не удалось создать доску")
+    raise WeeekAPIError("Не удалось создать доску")
 
 
-async def ensure_backlog_column(client: httpx.AsyncClient, board_id: int):
+async def ensure_backlog_column(client: httpx.AsyncClient, board_id: int) -> int:
     logger.info("Проверка наличия и позиции столбца 'Бэклог. !НЕ РЕДАКТИРОВАТЬ НАЗВАНИЕ!'")
-    resp = await client.get(f"{BASE_URL}tm/board-columns", headers=headers, params={"boardId": board_id})
+    resp = await _send_bootstrap(client, "GET", "tm/board-columns", params={"boardId": board_id})
     data = await handle_response(resp, "Получение столбцов")
     columns = data.get("boardColumns", [])
     column = next((c for c in columns if c.get("name") == COLUMN_NAME), None)
@@ -114,25 +293,28 @@ async def ensure_backlog_column(client: httpx.AsyncClient, board_id: int):
     if column:
         if columns[0]["id"] != column["id"]:
             logger.info("Столбец найден, но не в начале. Перемещаем...")
-            move_url = f"{BASE_URL}tm/board-columns/{column['id']}/move"
-            await client.post(move_url, json={"upperBoardColumnId": None}, headers=headers)
+            await _send_bootstrap(client, "POST", f"tm/board-columns/{column['id']}/move", json={"upperBoardColumnId": None})
             logger.info("Столбец перемещён в начало")
         else:
             logger.info("Столбец уже на первой позиции")
+        return column["id"]
     else:
         logger.info("Столбец не найден. Создаём...")
         payload = {
             "name": COLUMN_NAME,
             "boardId": board_id
         }
-        resp = await client.post(f"{BASE_URL}tm/board-columns", json=payload, headers=headers)
+        resp = await _send_bootstrap(client, "POST", "tm/board-columns", json=payload)
         col_data = await handle_response(resp, "Создание столбца")
         column_id = col_data.get("boardColumn", {}).get("id")
 
         if column_id is not None:
             logger.info("Столбец создан. Перемещаем в начало...")
-            await client.post(f"{BASE_URL}tm/board-columns/{column_id}/move", json={"upperBoardColumnId": None}, headers=headers)
+            await _send_bootstrap(client, "POST", f"tm/board-columns/{column_id}/move", json={"upperBoardColumnId": None})
             logger.info("Столбец перемещён в начало")
+            return column_id
+
+        raise WeeekAPIError("Ошибка: столбец создан, но ID не получен")
 
 
 def update_env_variable(key: str, value: str):
@@ -141,16 +323,86 @@ def update_env_variable(key: str, value: str):
     logger.info(f".env обновлён: {key} = {value}")
 
 
-async def initialize_weeek_data():
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        project_id = await find_or_create_project(client)
-        board = await find_or_create_board(client, project_id)
-        await ensure_backlog_column(client, board["id"])
+def _load_cached_ids() -> Optional[dict]:
+    try:
+        return {
+            "project_id": int(os.getenv("WEEEK_PROJECT_ID")),
+            "board_id": int(os.getenv("WEEEK_BOARD_ID")),
+            "column_id": int(os.getenv("WEEEK_COLUMN_ID")),
+        }
+    except (TypeError, ValueError):
+        return None
+
 
+async def _verify_weeek_data():
+    try:
+        await bootstrap_weeek_data()
+        logger.info("Кэшированные ID WEEEK проверены")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Фоновая проверка данных WEEEK не удалась: {e}")
+
+
+async def initialize_weeek_data(verify_in_background: bool = True):
+    """Если ID уже сохранены в .env — берёт их сразу, а проверку с WEEEK запускает в фоне."""
+    global _verify_task
+    cached = _load_cached_ids()
+    if cached and verify_in_background:
+        _ids.update(cached)
+        logger.info(f"ID WEEEK взяты из .env: {cached}, проверка выполняется в фоне")
+        if _verify_task is None or _verify_task.done():
+            _verify_task = asyncio.create_task(_verify_weeek_data(), name="weeek-verify")
+        return cached["project_id"], cached["board_id"]
+    return await bootstrap_weeek_data()
+
+
+async def bootstrap_weeek_data():
+    client = await open_weeek_client()
+    project_id = await find_or_create_project(client)
+    board = await find_or_create_board(client, project_id)
+    column_id = await ensure_backlog_column(client, board["id"])
+
+    new_ids = {"project_id": project_id, "board_id": board["id"], "column_id": column_id}
+    if _load_cached_ids() != new_ids:
         update_env_variable("WEEEK_PROJECT_ID", str(project_id))
         update_env_variable("WEEEK_BOARD_ID", str(board["id"]))
+        update_env_variable("WEEEK_COLUMN_ID", str(column_id))
+    _ids.update(new_ids)
 
-        return project_id, board["id"]
+    return project_id, board["id"]
+
+
+async def resolve_backlog_location(client: httpx.AsyncClient, refresh: bool = False) -> tuple:
+    """Возвращает (project_id, column_id) из кэша; обращается к WEEEK только при пустом кэше или refresh."""
+    if refresh:
+        _ids.update(project_id=None, board_id=None, column_id=None)
+
+    if _ids["project_id"] is None or _ids["board_id"] is None:
+        if not refresh and os.getenv("WEEEK_PROJECT_ID") and os.getenv("WEEEK_BOARD_ID"):
+            _ids["project_id"] = int(os.getenv("WEEEK_PROJECT_ID"))
+            _ids["board_id"] = int(os.getenv("WEEEK_BOARD_ID"))
+        else:
+            _ids["project_id"] = await find_or_create_project(client)
+            _ids["board_id"] = (await find_or_create_board(client, _ids["project_id"]))["id"]
+            update_env_variable("WEEEK_PROJECT_ID", str(_ids["project_id"]))
+            update_env_variable("WEEEK_BOARD_ID", str(_ids["board_id"]))
+
+    if _ids["column_id"] is None:
+        if not refresh and os.getenv("WEEEK_COLUMN_ID"):
+            _ids["column_id"] = int(os.getenv("WEEEK_COLUMN_ID"))
+        else:
+            resp = await _send(client, "GET", "tm/board-columns", priority=PRIORITY_TASK,
+                               params={"boardId": _ids["board_id"]})
+            data = await handle_response(resp, "Получение колонок доски")
+            columns = data.get("boardColumns", [])
+            column = next((c for c in columns if c.get("name") == COLUMN_NAME), None)
+            if not column:
+                raise WeeekAPIError("Колонка 'Бэклог' не найдена", 404)
+            _ids["column_id"] = column["id"]
+            update_env_variable("WEEEK_COLUMN_ID", str(column["id"]))
+
+    return _ids["project_id"], _ids["column_id"]
 
 
 # --------------------------
@@ -167,16 +419,101 @@ async def create_task_minimal(client: httpx.AsyncClient, title: str, description
         }],
         "type": "action"
     }
-    resp = await client.post(f"{BASE_URL}tm/tasks", json=payload, headers=headers)
+    resp = await _send(client, "POST", "tm/tasks", priority=PRIORITY_TASK, json=payload)
     data = await handle_response(resp, "Создание задачи")
     return data["task"]["id"]
 
 
-async def get_task_details(client: httpx.AsyncClient, task_id: int) -> dict:
-    resp = await client.get(f"{BASE_URL}tm/tasks/{task_id}", headers=headers)
+def _multipart_parts(filename: str, size: int):
+    boundary = uuid.uuid4().hex
+    safe_name = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "").replace("\n", "")
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{UPLOAD_FIELD}"; filename="{safe_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return boundary, head, tail, len(head) + size + len(tail)
+
+
+async def _stream_file(path: str, head: bytes, tail: bytes):
+    """Тело multipart-запроса: файл читается с диска кусками в потоке, целиком в память не попадает."""
+    yield head
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+    yield tail
+
+
+async def upload_task_attachment(client: httpx.AsyncClient, weeek_task_id, path: str, filename: str) -> int:
+    """Загружает один файл во вложения задачи WEEEK. Возвращает число отправленных байт файла."""
+    size = os.path.getsize(path)
+    boundary, head, tail, content_length = _multipart_parts(filename, size)
+    resp = await _send(
+        client, "POST", UPLOAD_PATH.format(task_id=weeek_task_id),
+        priority=PRIORITY_DEFAULT,
+        budget=CALL_BUDGET_SECONDS + size / UPLOAD_MIN_RATE,
+        body_factory=lambda: _stream_file(path, head, tail),
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+            "Content-Length": str(content_length),
+        },
+    )
+    await handle_response(resp, f"Загрузка вложения '{filename}' в задачу {weeek_task_id}")
+    return size
+
+
+async def get_task_details(client: httpx.AsyncClient, task_id: int, priority: int = PRIORITY_DEFAULT) -> dict:
+    resp = await _send(client, "GET", f"tm/tasks/{task_id}", priority=priority)
     data = await handle_response(resp, f"Получение задачи {task_id}")
     return data["task"]
 
+
+# --------------------------
+# Сверка состояния задач (weeek_sync.py)
+# --------------------------
+
+TASKS_PAGE_SIZE = 100
+# Новые изменения первыми: сверка останавливается, дойдя до уже учтённых. Если WEEEK
+# параметры сортировки не применит, weeek_sync.py заметит это и просмотрит доску целиком
+TASKS_SORT_PARAMS = {"sortBy": "updatedAt", "sortDirection": "desc"}
+
+
+async def list_board_tasks(client: httpx.AsyncClient, offset: int = 0, per_page: int = TASKS_PAGE_SIZE) -> tuple:
+    """Страница задач нашей доски: (задачи, есть_ещё). Фоновый приоритет — создание задач идёт вперёд."""
+    await resolve_backlog_location(client)
+    params = {"boardId": _ids["board_id"], "perPage": per_page, "offset": offset, **TASKS_SORT_PARAMS}
+    resp = await _send(client, "GET", "tm/tasks", priority=PRIORITY_BOOTSTRAP, params=params)
+    data = await handle_response(resp, "Получение списка задач")
+    return data.get("tasks", []), bool(data.get("hasMore"))
+
+
+async def list_board_columns(client: httpx.AsyncClient) -> dict:
+    """{id колонки: название} для нашей доски."""
+    await resolve_backlog_location(client)
+    resp = await _send(client, "GET", "tm/board-columns", priority=PRIORITY_BOOTSTRAP,
+                       params={"boardId": _ids["board_id"]})
+    data = await handle_response(resp, "Получение колонок доски")
+    return {column["id"]: column.get("name", "") for column in data.get("boardColumns", [])}
+
+
+async def find_task(client: httpx.AsyncClient, task_id) -> Optional[dict]:
+    """Задача по ID или None, если в WEEEK её больше нет."""
+    try:
+        return await get_task_details(client, task_id, priority=PRIORITY_BOOTSTRAP)
+    except WeeekAPIError as e:
+        if e.status_code == 404:
+            return None
+        raise
+
+
 async def get_custom_field_from_task(task_data: dict, field_name: str) -> Optional[str]:
     for field in task_data.get("customFields", []):
         if field.get("name") == field_name:
@@ -190,7 +527,7 @@ async def create_custom_field(client: httpx.AsyncClient, name: str, field_type:
         "type": field_type,
         "description": "Автоматически созданное поле для хранения информации о файлах"
     }
-    resp = await client.post(f"{BASE_URL}tm/custom-fields", json=payload, headers=headers)
+    resp = await _send(client, "POST", "tm/custom-fields", json=payload)
     data = await handle_response(resp, f"Создание кастомного поля '{name}'")
     return data.get("customField", {}).get("id")
 
@@ -206,28 +543,27 @@ async def update_task_with_files_field(client: httpx.AsyncClient, task_data: dic
         }
     }
     task_id = task_data["id"]
-    resp = await client.put(f"{BASE_URL}tm/tasks/{task_id}", json=payload, headers=headers)
+    resp = await _send(client, "PUT", f"tm/tasks/{task_id}", json=payload)
     await handle_response(resp, f"Обновление задачи {task_id} с полем 'Файлы'")
 
 
 async def create_weeek_task(title: str, description: str, files_info: str):
     try:
-        project_id = int(os.getenv("WEEEK_PROJECT_ID"))
-        board_id = int(os.getenv("WEEEK_BOARD_ID"))
-
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.get(f"{BASE_URL}tm/board-columns", headers=headers, params={"boardId": board_id})
-            data = await handle_response(resp, "Получение колонок доски")
-            columns = data.get("boardColumns", [])
-            column = next((c for c in columns if c.get("name") == COLUMN_NAME), None)
-            if not column:
-                raise Exception("Колонка 'Бэклог' не найдена")
-
-            task_id = await create_task_minimal(client, title, description, project_id, column["id"])
-            task_data = await get_task_details(client, task_id)
-
-            logger.info(f"Задача создана и дополнена полем 'Файлы': ID {task_id}")
-            return task_id
+        client = await open_weeek_client()
+        project_id, column_id = await resolve_backlog_location(client)
+
+        try:
+            task_id = await create_task_minimal(client, title, description, project_id, column_id)
+        except WeeekAPIError as e:
+            if e.status_code != 404:
+                raise
+            # Проект или колонка пропали — обновляем кэш и пробуем ещё раз
+            logger.info("WEEEK вернул 404, обновляем ID проекта, доски и колонки")
+            project_id, column_id = await resolve_backlog_location(client, refresh=True)
+            task_id = await create_task_minimal(client, title, description, project_id, column_id)
+
+        logger.info(f"Задача создана: ID {task_id}")
+        return task_id
 
     except Exception as e:
         logger.error(f"Ошибка при создании задачи: {str(e)}")
@@ -0,0 +1,189 @@
+# weeek_sync.py
+# Фоновая сверка состояния задач с WEEEK: выполнена, в какой колонке, не удалена ли.
+# Список задач доски запрашивается страницами, новые изменения первыми; просмотр останавливается
+# на странице, где всё уже не новее сохранённого курсора (updatedAt последней сверки в sync_state).
+# Локально перезаписываются только задачи, у которых что-то поменялось, — по транзакции на страницу.
+# Удалённые задачи из списка просто пропадают, поэтому раз в WEEEK_SYNC_FULL_EVERY циклов доска
+# просматривается целиком, а не найденные в ней задачи проверяются поштучно.
+#
+# Ручной запуск:
+#   python weeek_sync.py            # одна сверка (полная, если курсора ещё нет)
+#   python weeek_sync.py --full     # полная сверка с проверкой удалённых
+
+import argparse
+import asyncio
+import os
+
+from db_async import (
+    apply_weeek_states, get_sync_state, set_sync_state, list_tracked_weeek_ids, init_db, shutdown_db_executor
+)
+from loggers import log_user_friendly
+from WEEEK import close_weeek_client, find_task, list_board_columns, list_board_tasks, open_weeek_client
+
+SYNC_INTERVAL_SECONDS = float(os.getenv("WEEEK_SYNC_INTERVAL", 300))  # 0 — сверка выключена
+SYNC_FULL_EVERY = int(os.getenv("WEEEK_SYNC_FULL_EVERY", 288))        # каждый N-й цикл полный (~раз в сутки)
+SYNC_VERIFY_LIMIT = int(os.getenv("WEEEK_SYNC_VERIFY_LIMIT", 50))     # поштучных проверок за полную сверку
+WATERMARK_KEY = "weeek_tasks_updated_at"
+VERIFY_CURSOR_KEY = "weeek_verify_task_id"  # task_id, на котором остановилась поштучная проверка
+
+STATUS_OPEN = "open"
+STATUS_DONE = "done"
+STATUS_DELETED = "deleted"
+
+
+def task_status(task: dict) -> str:
+    if task.get("isDeleted"):
+        return STATUS_DELETED
+    return STATUS_DONE if task.get("isCompleted") else STATUS_OPEN
+
+
+class StatusSync:
+    def __init__(self, interval: float = SYNC_INTERVAL_SECONDS, full_every: int = SYNC_FULL_EVERY,
+                 verify_limit: int = SYNC_VERIFY_LIMIT):
+        self.interval = interval
+        self.full_every = full_every
+        self.verify_limit = verify_limit
+        self._columns = {}
+        self._cycles = 0
+        self._unsorted_reported = False
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="weeek-sync")
+            log_user_friendly(f"🔄 Сверка статусов с WEEEK каждые {self.interval:.0f} с включена")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await self.run_once()
+            except Exception as e:
+                log_user_friendly(f"⚠️ Ошибка сверки с WEEEK: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _column_name(self, client, column_id):
+        if column_id is None:
+            return None
+        if column_id not in self._columns:
+            # Новая или переименованная колонка — перечитываем список колонок доски
+            self._columns = await list_board_columns(client)
+        return self._columns.get(column_id)
+
+    async def run_once(self, full: bool = None) -> dict:
+        client = await open_weeek_client()
+        watermark = await get_sync_state(WATERMARK_KEY)
+        if full is None:
+            full = watermark is None or (self.full_every > 0 and self._cycles % self.full_every == 0)
+        self._cycles += 1
+
+        summary = {"pages": 0, "seen": 0, "changed": 0, "verified": 0, "full": full}
+        newest, offset, previous_stamp, ordered = watermark, 0, None, True
+        seen = set()
+        while True:
+            tasks, has_more = await list_board_tasks(client, offset)
+            summary["pages"] += 1
+            states = []
+            for task in tasks:
+                stamp = task.get("updatedAt")
+                if stamp is None or (previous_stamp is not None and stamp > previous_stamp):
+                    ordered = False
+                previous_stamp = stamp
+                if stamp and (newest is None or stamp > newest):
+                    newest = stamp
+                seen.add(str(task["id"]))
+                states.append((task["id"], task_status(task), await self._column_name(client, task.get("boardColumnId")), stamp))
+            summary["seen"] += len(tasks)
+            summary["changed"] += await apply_weeek_states(states)
+            offset += len(tasks)
+            if not has_more or not tasks:
+                break
+            if not full and ordered and watermark and previous_stamp <= watermark:
+                # Дальше только задачи, не менявшиеся с прошлой сверки
+                break
+
+        if not ordered and not self._unsorted_reported:
+            self._unsorted_reported = True
+            log_user_friendly("ℹ️ WEEEK вернул задачи не по времени изменения — сверка просматривает доску целиком")
+
+        if full:
+            summary["verified"] = await self._verify_missing(client, seen)
+            summary["changed"] += summary["verified"]
+
+        # Курсор двигаем, только когда все страницы записаны: прерванная сверка повторится с того же места
+        if newest and newest != watermark:
+            await set_sync_state(WATERMARK_KEY, newest)
+
+        if summary["changed"]:
+            log_user_friendly(
+                f"🔄 Сверка с WEEEK: изменилось задач {summary['changed']}, просмотрено {summary['seen']} "
+                f"на {summary['pages']} стр.{' (полная)' if full else ''}"
+            )
+        return summary
+
+    async def _verify_missing(self, client, seen: set) -> int:
+        """Задачи, которых нет в списке доски: удалены, перенесены на другую доску или скрыты фильтром списка.
+
+        За одну полную сверку проверяется не больше verify_limit задач; следующая продолжает с места,
+        где остановилась эта (курсор в sync_state), и по кругу возвращается к новым.
+        """
+        missing = [(task_id, weeek_id) for task_id, weeek_id in await list_tracked_weeek_ids() if weeek_id not in seen]
+        cursor = await get_sync_state(VERIFY_CURSOR_KEY)
+        if cursor:
+            start = next((i for i, (task_id, _) in enumerate(missing) if task_id < int(cursor)), len(missing))
+            missing = missing[start:] + missing[:start]
+        batch = missing[:self.verify_limit]
+        states = []
+        for _, weeek_id in batch:
+            task = await find_task(client, weeek_id)
+            if task is None:
+                states.append((weeek_id, STATUS_DELETED, None, None))
+            else:
+                states.append((weeek_id, task_status(task), await self._column_name(client, task.get("boardColumnId")),
+                               task.get("updatedAt")))
+        changed = await apply_weeek_states(states) if states else 0
+        if batch and len(missing) > len(batch):
+            await set_sync_state(VERIFY_CURSOR_KEY, str(batch[-1][0]))
+            log_user_friendly(
+                f"ℹ️ Сверка с WEEEK: проверено {len(batch)} из {len(missing)} задач вне доски, "
+                f"остальные — при следующих полных сверках"
+            )
+        elif cursor:
+            await set_sync_state(VERIFY_CURSOR_KEY, "")
+        return changed
+
+
+status_sync = StatusSync()
+
+
+async def _cli(args):
+    try:
+        await init_db()
+        print(await status_sync.run_once(full=True if args.full else None))
+    finally:
+        await close_weeek_client()
+        shutdown_db_executor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сверка статусов задач BuhBot с WEEEK")
+    parser.add_argument("--full", action="store_true", help="полная сверка с проверкой удалённых задач")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# worker.py
+# Отдельные процессы публикации: разбирают очередь outbox в tasks.db (файлы задачи, карточка
+# в админ-чате, создание задач и загрузка вложений в WEEEK). Бот при этом запускается
+# с BOT_ROLE=ingest и только принимает сообщения и ставит задания в очередь.
+#
+#   BOT_ROLE=ingest python main.py
+#   python worker.py --processes 4
+#
+# Задания арендуются с продлением (outbox.py), поэтому процессы не берут одно задание дважды;
+# упавший процесс перезапускается, а его задания после истечения аренды забирает другой.
+# Лимит запросов к WEEEK (WEEEK_RATE_LIMIT / WEEEK_RATE_BURST) делится между процессами поровну.
+# Фоновую сверку статусов с WEEEK (weeek_sync.py) ведёт только процесс 0.
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+if __name__ == "__main__":
+    # Супервизор пишет в свои файлы логов, чтобы не делить их с ботом
+    os.environ.setdefault("LOG_FILE_TAG", "workers")
+
+from loggers import log_user_friendly  # noqa: E402
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 2))
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", 0.5))  # как часто смотреть в очередь
+RESTART_DELAY_SECONDS = 5.0
+STOP_TIMEOUT_SECONDS = 60.0
+
+
+def _child_env(index: int, processes: int) -> dict:
+    rate = float(os.getenv("WEEEK_RATE_LIMIT", 5))
+    burst = int(os.getenv("WEEEK_RATE_BURST", 10))
+    metrics_port = int(os.getenv("METRICS_PORT", 9108))
+    return {
+        "LOG_FILE_TAG": f"worker{index}",
+        "WEEEK_RATE_LIMIT": str(rate / processes),
+        "WEEEK_RATE_BURST": str(max(1, burst // processes)),
+        # Порт бота + 1 + номер процесса; 0 — эндпоинт выключен везде
+        "METRICS_PORT": str(metrics_port + 1 + index) if metrics_port else "0",
+    }
+
+
+async def _serve(index: int):
+    # Тяжёлые модули импортируем уже в процессе-воркере: супервизору они не нужны
+    from telegram import Bot
+    from config import config
+    from db import close_connections
+    from db_async import init_db, shutdown_db_executor
+    from loggers import setup_user_not_friendly_logger
+    from main import init_weeek, install_stop_signals, read_token
+    from metrics import server as metrics_server
+    from outbox import OutboxWorker, set_bot
+    from WEEEK import open_weeek_client, close_weeek_client
+    from weeek_sync import status_sync
+
+    setup_user_not_friendly_logger()
+    config.validate()
+    stop_event = asyncio.Event()
+    install_stop_signals(stop_event)
+    worker = OutboxWorker(poll_seconds=WORKER_POLL_SECONDS)
+
+    async with Bot(read_token()) as bot:
+        set_bot(bot)
+        await open_weeek_client()
+        try:
+            await asyncio.gather(init_db(), init_weeek())
+            worker.start()
+            if index == 0:
+                status_sync.start()  # сверке с WEEEK достаточно одного процесса
+            await metrics_server.start()
+            log_user_friendly(f"⚙️ Обработчик публикации {index} запущен (PID {os.getpid()})")
+            await stop_event.wait()
+        finally:
+            await worker.stop()
+            await status_sync.stop()
+            await metrics_server.stop()
+            await close_weeek_client()
+            shutdown_db_executor()
+            close_connections()
+            log_user_friendly(f"⚙️ Обработчик публикации {index} остановлен")
+
+
+def run_worker(index: int):
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(_serve(index))
+
+
+class Supervisor:
+    """Держит N процессов-воркеров: запускает, перезапускает упавшие, останавливает по сигналу."""
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._ctx = multiprocessing.get_context("spawn")  # чистый процесс без потоков и event loop родителя
+        self._children = {}
+        self._restart_at = {}
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        env = _child_env(index, self.processes)
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            process = self._ctx.Process(target=run_worker, args=(index,), name=f"buhbot-worker{index}")
+            process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self._children[index] = process
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        for index in range(self.processes):
+            self._spawn(index)
+        log_user_friendly(f"⚙️ Запущено обработчиков публикации: {self.processes}")
+
+        while not self._stopping:
+            time.sleep(1)
+            now = time.monotonic()
+            for index, process in list(self._children.items()):
+                if process.is_alive() or self._stopping:
+                    continue
+                if index not in self._restart_at:
+                    log_user_friendly(
+                        f"⚠️ Обработчик публикации {index} завершился (код {process.exitcode}), "
+                        f"перезапуск через {RESTART_DELAY_SECONDS:.0f} с"
+                    )
+                    self._restart_at[index] = now + RESTART_DELAY_SECONDS
+                elif now >= self._restart_at[index]:
+                    del self._restart_at[index]
+                    self._spawn(index)
+
+        log_user_friendly("🛑 Останавливаем обработчиков публикации...")
+        for process in self._children.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: воркер дожидается текущих заданий
+        deadline = time.monotonic() + STOP_TIMEOUT_SECONDS
+        for process in self._children.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                # Незакрытые задания вернутся в очередь по истечении аренды
+                process.kill()
+                process.join()
+        log_user_friendly("🛑 Обработчики публикации остановлены")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процессы публикации задач BuhBot (очередь outbox)")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="число процессов")
+    args = parser.parse_args()
+    Supervisor(max(1, args.processes)).run()
+
+
+if __name__ == "__main__":
+    main()